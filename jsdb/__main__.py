@@ -1,21 +1,96 @@
 import argparse
+import bsddb
 import pprint
+import sys
 
+from . import analysis
+from . import compression
+from . import keyformat
 from . import leveldict
+from . import repair
+from .benchmarks import suite
 
 PARSER = argparse.ArgumentParser(description='Debug operations for jsdb')
 PARSER.add_argument('--level', action='store_true', help='Use level db backend')
 PARSERS = PARSER.add_subparsers(dest='command')
 dump_under = PARSERS.add_parser('dump-under', help='Dump the keys of the underlying data store')
 dump_under.add_argument('file', type=str)
+convert_keys = PARSERS.add_parser('convert-keys', help='Copy a database into a new file converting the format of its keys')
+convert_keys.add_argument('source', type=str)
+convert_keys.add_argument('destination', type=str)
+convert_keys.add_argument('--format', choices=keyformat.FORMATS, default=keyformat.BINARY, help='Key format of the new file')
+train_dictionary = PARSERS.add_parser('train-dictionary', help='Train a compression dictionary from the values in a database and compress new values with it')
+train_dictionary.add_argument('file', type=str)
+train_dictionary.add_argument('--samples', type=int, default=10000, help='Number of values to sample')
+train_dictionary.add_argument('--size', type=int, default=compression.DICTIONARY_SIZE, help='Maximum size of the dictionary in bytes')
+train_dictionary.add_argument('--threshold', type=int, help='Compress encoded values at least this long (default {})'.format(compression.DEFAULT_THRESHOLD))
+stats = PARSERS.add_parser('stats', help='Report where the space in a database goes, from a single scan of its keys')
+stats.add_argument('file', type=str)
+stats.add_argument('--depth', type=int, default=analysis.DEPTH, help='Report the largest subtrees down to this depth')
+stats.add_argument('--top', type=int, default=analysis.TOP, help='Number of subtrees, lists and dictionaries to report')
+stats.add_argument('--json', action='store_true', help='Output json rather than text')
+BACKENDS = dict(bsddb=bsddb.btopen, leveldb=leveldict.LevelDict)
+for name, description in (
+        ('compact', 'Copy a database into a new file in key order, reporting structural problems'),
+        ('repair', 'Copy a database into a new file, skipping unreadable keys and fixing structural problems')):
+    command = PARSERS.add_parser(name, help=description)
+    command.add_argument('source', type=str)
+    command.add_argument('destination', type=str)
+    command.add_argument('--destination-backend', choices=sorted(BACKENDS), help='Backend of the new file (by default that of the source)')
+    command.add_argument('--batch-size', type=int, default=repair.BATCH_SIZE, help='Number of keys written in each batch')
+    command.add_argument('--progress-every', type=int, default=repair.PROGRESS_EVERY, help='Report progress after reading this many keys')
+bench = PARSERS.add_parser('bench', help='Time operations at several sizes and depths with each backend, or compare two result files')
+suite.add_arguments(bench)
 
 args = PARSER.parse_args()
 
 if args.level:
     Store = leveldict.LevelDict
+else:
+    Store = bsddb.btopen
 
 if args.command == 'dump-under':
     store = Store(args.file)
     pprint.pprint(dict(store))
+elif args.command == 'convert-keys':
+    source = Store(args.source)
+    destination = Store(args.destination)
+    try:
+        keyformat.convert(source, destination, args.format)
+    finally:
+        source.close()
+        destination.close()
+elif args.command == 'train-dictionary':
+    store = Store(args.file)
+    try:
+        data = keyformat.key_format_dict(store)
+        dictionary = compression.train(compression.sample_values(data, args.samples), args.size)
+        number = compression.add_dictionary(data, dictionary, args.threshold)
+        print 'Stored dictionary {} ({} bytes)'.format(number, len(dictionary))
+    finally:
+        store.close()
+elif args.command == 'stats':
+    store = Store(args.file)
+    try:
+        report = analysis.analyse(store, args.depth, args.top)
+    finally:
+        store.close()
+    print analysis.to_json(report) if args.json else analysis.to_text(report)
+elif args.command in ('compact', 'repair'):
+    source = Store(args.source)
+    destination = BACKENDS[args.destination_backend](args.destination) if args.destination_backend else Store(args.destination)
+    def report_problem(problem):
+        print '{}: {!r}: {}'.format(problem.kind, problem.key, problem.detail)
+    def report_progress(keys):
+        sys.stderr.write('Read {} keys\n'.format(keys))
+    try:
+        result = repair.copy(source, destination, args.command == 'repair', args.batch_size,
+                             report_problem, report_progress, args.progress_every)
+    finally:
+        source.close()
+        destination.close()
+    print 'Read {} keys, wrote {}, skipped {}, {} problems'.format(*result)
+elif args.command == 'bench':
+    sys.exit(suite.main(args))
 else:
     raise ValueError()
@@ -0,0 +1,140 @@
+"""Aggregates of the numbers at paths that match a pattern.
+
+An aggregate named `latency` over `requests[*].ms` keeps the count and sum
+of the matching numbers, how many times each distinct number occurs (in
+ascending and descending order, so that the minimum and maximum are
+the first key of a scan) and optionally counts for histogram buckets:
+
+    !aggregate."latency"#                        count
+    !aggregate."latency"+                        sum of the integers
+    !aggregate."latency"~                        sum of the floats, in units of 2 ** -1074
+    !aggregate."latency"~inf                     occurrences of infinity (also -inf and nan)
+    !aggregate."latency"< <sortable value>       occurrences, ascending
+    !aggregate."latency"> <inverted value>       occurrences, descending
+    !aggregate."latency"|2                       numbers in bucket 2
+
+These are updated by `jsdb.derived.DerivedDict` as values are written, so
+reading an aggregate does not depend on how many values it covers. Every
+finite float is a whole number of units, so the sums are exact however
+many numbers are added and removed, and the sum that is read is rounded
+once. Values that are not numbers are ignored. Definitions are stored
+under `DEFINITIONS_KEY`.
+"""
+
+import bisect
+import collections
+import fractions
+import json
+import math
+
+from . import codec
+from . import flatpath
+from . import pattern as pattern_module
+from . import treeutils
+
+DEFINITIONS_KEY = '!aggregates'
+ENTRY_PREFIX = '!aggregate'
+
+AggregateValues = collections.namedtuple('AggregateValues', 'count sum min max histogram')
+
+# Every finite float is a whole number of these
+_FLOAT_UNIT = 2 ** 1074
+
+def load_definitions(store):
+    definitions = json.loads(store.get(DEFINITIONS_KEY, '{}'))
+    return {name.encode('utf8'): AggregateDefinition(name.encode('utf8'), spec['pattern'].encode('utf8'),
+                                                     spec['buckets'])
+            for name, spec in definitions.items()}
+
+def save_definitions(store, definitions):
+    specs = {name: dict(pattern=definition.pattern.text, buckets=definition.buckets)
+             for name, definition in definitions.items()}
+    store[DEFINITIONS_KEY] = json.dumps(specs, sort_keys=True)
+
+def _is_number(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+def _float_units(value):
+    numerator, denominator = value.as_integer_ratio()
+    return numerator * (_FLOAT_UNIT // denominator)
+
+def _invert(string):
+    # The sortable encoding is prefix-free so inverting bytes reverses the order
+    return ''.join(chr(0xff ^ ord(c)) for c in string)
+
+
+class AggregateDefinition(object):
+    """Maintain the aggregate `name` of numbers matching `pattern`.
+    `buckets` is an ascending list of boundaries: bucket `i` counts the
+    numbers with `buckets[i - 1] <= number < buckets[i]`"""
+    def __init__(self, name, pattern, buckets=None):
+        self.name = name
+        self.pattern = pattern_module.Pattern(pattern)
+        self.buckets = list(buckets or [])
+        if self.buckets != sorted(self.buckets):
+            raise ValueError(buckets)
+
+        self.prefix = '{}."{}"'.format(ENTRY_PREFIX, flatpath.escape_double_quote(name))
+        self._count_key = self.prefix + '#'
+        self._sum_key = self.prefix + '+'
+        self._float_sum_key = self.prefix + '~'
+        self._ascending = self.prefix + '<'
+        self._descending = self.prefix + '>'
+
+    def __repr__(self):
+        return '<AggregateDefinition {!r} pattern={!r}>'.format(self.name, self.pattern.text)
+
+    def _bucket_key(self, value):
+        return '{}|{}'.format(self.prefix, bisect.bisect_right(self.buckets, value))
+
+    def _update(self, side, value, sign):
+        if not _is_number(value):
+            return
+        encoded = codec.encode_sortable(value)
+        side.increment(self._count_key, sign)
+        if not isinstance(value, float):
+            side.increment(self._sum_key, sign * value)
+        elif math.isinf(value) or math.isnan(value):
+            side.increment(self._float_sum_key + repr(value), sign)
+        else:
+            side.increment(self._float_sum_key, sign * _float_units(value))
+        side.increment(self._ascending + encoded, sign)
+        side.increment(self._descending + _invert(encoded), sign)
+        if self.buckets:
+            side.increment(self._bucket_key(value), sign)
+
+    def add(self, side, _key, value):
+        self._update(side, value, 1)
+
+    def remove(self, side, _key, value):
+        self._update(side, value, -1)
+
+    def read(self, store):
+        "Read the current `AggregateValues` from `store`"
+        count = store.get(self._count_key, 0)
+        histogram = [store.get('{}|{}'.format(self.prefix, i), 0) for i in range(len(self.buckets) + 1)]
+        return AggregateValues(
+            count=count,
+            sum=self._read_sum(store),
+            min=self._first(store, self._ascending, lambda key: key),
+            max=self._first(store, self._descending, _invert),
+            histogram=histogram if self.buckets else None)
+
+    def _read_sum(self, store):
+        total = store.get(self._sum_key, 0)
+        special = [value for value in (float('inf'), float('-inf'), float('nan'))
+                   if store.get(self._float_sum_key + repr(value), 0)]
+        if special:
+            return sum(special)
+        units = store.get(self._float_sum_key, 0)
+        if units:
+            # Rounded once, from the exact sum
+            return float(total + fractions.Fraction(units, _FLOAT_UNIT))
+        return total
+
+    @staticmethod
+    def _first(store, prefix, decode):
+        for key in treeutils.keys_with_prefix(store, prefix):
+            value, _ = codec.decode_sortable(decode(key[len(prefix):]))
+            return value
+        return None
@@ -0,0 +1,171 @@
+"""Where the space in a database goes, from a single ordered scan of its keys.
+
+    python -m jsdb stats FILE [--depth 2] [--top 10] [--json]
+
+The keys of a subtree are contiguous in the store, so the size of each
+subtree is known as soon as the scan leaves it and only the largest `top`
+need to be kept. Memory use does not depend on the size of the database.
+
+The report gives the bytes of keys and values for the database and for the
+largest subtrees at each depth up to `depth`, the longest lists and
+dictionaries, a histogram of the depth of values, a histogram of the
+number of entries of lists and dictionaries, and the fraction of stored
+bytes taken up by keys. Only the paths layout is supported.
+"""
+
+import heapq
+import json
+
+from . import codec as codec_module
+from . import compression
+from . import flatpath
+from . import keyformat
+from . import nodedict
+from . import stats
+from . import treeutils
+
+DEPTH = 2
+TOP = 10
+
+class _Largest(object):
+    "The `size` items with the largest keys"
+    def __init__(self, size):
+        self._size = size
+        self._heap = []
+        self._added = 0
+
+    def add(self, key, item):
+        # The count breaks ties without comparing items
+        self._added += 1
+        entry = (key, -self._added, item)
+        if len(self._heap) < self._size:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def items(self):
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
+
+
+class _Subtree(object):
+    def __init__(self, path):
+        self.path = path
+        self.keys = 0
+        self.key_bytes = 0
+        self.value_bytes = 0
+
+    def add(self, key_bytes, value_bytes):
+        self.keys += 1
+        self.key_bytes += key_bytes
+        self.value_bytes += value_bytes
+
+    def report(self):
+        return dict(path=list(self.path), keys=self.keys, key_bytes=self.key_bytes, value_bytes=self.value_bytes)
+
+
+def analyse(store, depth=DEPTH, top=TOP):
+    "Report on the space used by the raw store `store` (see the module docstring)"
+    data = keyformat.key_format_dict(store)
+    if nodedict.store_layout(data) != nodedict.PATHS:
+        raise ValueError('Only the paths layout can be analysed')
+    binary = isinstance(data, keyformat.BinaryKeyDict)
+    codec = compression.store_compression(data, codec_module.store_codec(data))
+
+    totals = _Subtree(())
+    meta = _Subtree(())
+    subtrees = [None] * (depth + 1)
+    largest_subtrees = [_Largest(top) for _ in range(depth + 1)]
+    largest = dict(list=_Largest(top), dict=_Largest(top))
+    fanout = stats.Histogram()
+    value_depths = {}
+    length = None
+
+    for stored_key, value in treeutils.ordered_items(store):
+        key_bytes, value_bytes = len(stored_key), len(value)
+        if stored_key.startswith(flatpath.META_PREFIX):
+            meta.add(key_bytes, value_bytes)
+            continue
+
+        key = keyformat.decode_key(stored_key) if binary else stored_key
+        components, terminal = flatpath.parse_key(key)
+        totals.add(key_bytes, value_bytes)
+
+        for level in range(1, min(depth, len(components)) + 1):
+            current = subtrees[level]
+            if current is None or current.path != components[:level]:
+                if current is not None:
+                    largest_subtrees[level].add(current.key_bytes + current.value_bytes, current.report())
+                current = subtrees[level] = _Subtree(components[:level])
+            current.add(key_bytes, value_bytes)
+
+        if terminal == '=':
+            value_depths[len(components)] = value_depths.get(len(components), 0) + 1
+        elif terminal == '#':
+            length = components, codec.decode(value)
+        elif terminal in ('.', '['):
+            # Lengths sort just before their container's marker, and empty
+            #   containers have none
+            entries = length[1] if length is not None and length[0] == components else 0
+            fanout.add(entries)
+            largest['dict' if terminal == '.' else 'list'].add(entries, dict(path=list(components), length=entries))
+
+    for level in range(1, depth + 1):
+        if subtrees[level] is not None:
+            largest_subtrees[level].add(subtrees[level].key_bytes + subtrees[level].value_bytes,
+                                        subtrees[level].report())
+
+    stored = totals.key_bytes + totals.value_bytes
+    return dict(
+        keys=totals.keys,
+        key_bytes=totals.key_bytes,
+        value_bytes=totals.value_bytes,
+        key_overhead=totals.key_bytes / float(stored) if stored else None,
+        meta_keys=meta.keys,
+        meta_bytes=meta.key_bytes + meta.value_bytes,
+        subtrees=dict((level, largest_subtrees[level].items()) for level in range(1, depth + 1)),
+        largest_lists=largest['list'].items(),
+        largest_dicts=largest['dict'].items(),
+        value_depths=sorted(value_depths.items()),
+        fanout=[(int(bound), count) for bound, count in fanout.summary()['buckets']])
+
+def format_path(path):
+    "Format path components like a query pattern, e.g. `records[3].name`"
+    parts = []
+    for component in path:
+        if isinstance(component, (int, long)):
+            parts.append('[{}]'.format(component))
+        else:
+            parts.append(('.' if parts else '') + component)
+    return ''.join(parts)
+
+def to_json(report):
+    return json.dumps(report, indent=2, sort_keys=True)
+
+def to_text(report):
+    lines = [
+        'keys: {}'.format(report['keys']),
+        'key bytes: {}'.format(report['key_bytes']),
+        'value bytes: {}'.format(report['value_bytes']),
+        'key overhead: {}'.format(
+            'n/a' if report['key_overhead'] is None else '{:.1%}'.format(report['key_overhead'])),
+        'header keys: {} ({} bytes)'.format(report['meta_keys'], report['meta_bytes'])]
+
+    for level, subtrees in sorted(report['subtrees'].items()):
+        lines.extend(['', 'Largest subtrees at depth {}:'.format(level)])
+        for subtree in subtrees:
+            lines.append('  {:>12} bytes {:>10} keys  {}'.format(
+                subtree['key_bytes'] + subtree['value_bytes'], subtree['keys'], format_path(subtree['path'])))
+
+    for name in ('lists', 'dicts'):
+        lines.extend(['', 'Largest {}:'.format(name)])
+        for container in report['largest_' + name]:
+            lines.append('  {:>12} entries  {}'.format(container['length'], format_path(container['path'])))
+
+    lines.extend(['', 'Values by depth:'])
+    for level, count in report['value_depths']:
+        lines.append('  {:>4} {:>12}'.format(level, count))
+
+    lines.extend(['', 'Lists and dictionaries by number of entries:'])
+    for bound, count in report['fanout']:
+        lines.append('  < {:<10} {:>12}'.format(bound, count))
+    return '\n'.join(lines)
@@ -0,0 +1,266 @@
+"""Use a database without blocking, from event loops or other threads.
+
+`BackgroundJsdb` makes every access to a `Jsdb` on a single worker thread
+and returns a `Future` for its result, so callers never wait for disk
+reads or writes:
+
+    db = BackgroundJsdb(Jsdb(filename))
+    db.set_path(('users', 'alice'), dict(age=30))
+    db.commit().add_done_callback(lambda future: ...)
+    age = db.get_path(('users', 'alice', 'age')).result()
+
+Requests are carried out in the order they are made, and share one
+transaction. The worker takes every request that is waiting each time it
+wakes up: lookups of the same path between two writes are made once, and
+all the commits requested are made as a single commit at the position of
+the last of them, whose futures complete together. Values are returned as
+plain Python copies, since proxies read from the database when used, and
+each future gets its own copy.
+
+An event loop can wait for a future by completing its own future from a
+callback, e.g. with `loop.call_soon_threadsafe`.
+"""
+
+import logging
+import Queue
+import sys
+import threading
+
+from . import python_copy
+from .jsdb import _path_tuple
+
+LOGGER = logging.getLogger('jsdb.background')
+
+class Future(object):
+    "The result of a request that completes on the worker thread"
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._exc_info = None
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        "Wait for the request to complete and return its result, or raise its exception"
+        if not self._event.wait(timeout):
+            raise Timeout()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self._event.wait(timeout):
+            raise Timeout()
+        return self._exc_info and self._exc_info[1]
+
+    def add_done_callback(self, callback):
+        """Call `callback` with the future when it completes, on the worker
+        thread (or straight away if it already has). Exceptions raised by
+        callbacks are logged and ignored."""
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def set_result(self, result):
+        self._result = result
+        self._complete()
+
+    def set_exc_info(self, exc_info):
+        self._exc_info = exc_info
+        self._complete()
+
+    def _complete(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._call(callback)
+
+    def _call(self, callback):
+        try:
+            callback(self)
+        except Exception: # pylint: disable=broad-except
+            LOGGER.exception('Exception calling callback for %r', self)
+
+class Timeout(Exception):
+    "The request did not complete in time"
+
+class BackgroundClosed(Exception):
+    "The database has been closed"
+
+
+# Kinds of request
+_GET = 'get'
+_SET = 'set'
+_DELETE = 'delete'
+_ITERATE = 'iterate'
+_COMMIT = 'commit'
+_CLOSE = 'close'
+
+_READS = (_GET, _ITERATE)
+
+class BackgroundJsdb(object):
+    "Access the database `db` on a dedicated worker thread (see the module docstring)"
+    def __init__(self, db):
+        self._db = db
+        self._queue = Queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='jsdb-background')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _request(self, kind, *args):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise BackgroundClosed()
+            self._closed = kind == _CLOSE
+            self._queue.put((kind, args, future))
+        return future
+
+    def get_path(self, path):
+        "The value at `path` (a sequence of keys and indexes, or a single key)"
+        return self._request(_GET, _path_tuple(path))
+
+    def get_many(self, paths):
+        "A list of the values at each of `paths`, looked up together"
+        futures = [self.get_path(path) for path in paths]
+        return _gather(futures)
+
+    def set_path(self, path, value):
+        "Set the value at `path`, whose parent must exist"
+        # Later changes made by the caller should not be written
+        return self._request(_SET, _path_tuple(path), python_copy.copy(value))
+
+    def delete_path(self, path):
+        return self._request(_DELETE, _path_tuple(path))
+
+    def iterate(self, path=()):
+        "A list of the `(key, value)` items of the dictionary at `path`, read in a single scan"
+        return self._request(_ITERATE, _path_tuple(path))
+
+    def commit(self):
+        "Commit the changes requested so far, together with any other commits waiting"
+        return self._request(_COMMIT)
+
+    def close(self):
+        "Close the database once the requests made so far are carried out"
+        return self._request(_CLOSE)
+
+    def _run(self):
+        while True:
+            requests = [self._queue.get()]
+            while True:
+                try:
+                    requests.append(self._queue.get_nowait())
+                except Queue.Empty:
+                    break
+            if not self._handle(requests):
+                return
+
+    def _handle(self, requests):
+        "Carry out `requests` in order, returning False once the database is closed"
+        commit_positions = [index for index, (kind, _, _) in enumerate(requests) if kind == _COMMIT]
+        last_commit = commit_positions[-1] if commit_positions else None
+        commits = []
+        lookups = {}
+
+        for index, (kind, args, future) in enumerate(requests):
+            if kind == _COMMIT:
+                commits.append(future)
+                if index == last_commit:
+                    _call(commits, self._db.commit)
+            elif kind == _CLOSE:
+                _call([future], self._db.close)
+                return False
+            elif kind in _READS:
+                if (kind, args) in lookups:
+                    # Callers may change the values they are given
+                    _complete(future, _copy_outcome(kind, lookups[kind, args]))
+                else:
+                    lookups[kind, args] = _capture(self._read, kind, *args)
+                    _complete(future, lookups[kind, args])
+            else:
+                # Later lookups must see this change
+                lookups.clear()
+                _complete(future, _capture(self._write, kind, *args))
+        return True
+
+    def _lookup(self, path):
+        value = self._db
+        for component in path:
+            value = value[component]
+        return value
+
+    def _read(self, kind, path):
+        if kind == _GET:
+            return python_copy.copy(self._lookup(path))
+        else:
+            return [(key, python_copy.copy(value)) for key, value in self._lookup(path).iteritems()]
+
+    def _write(self, kind, path, *args):
+        parent = self._lookup(path[:-1])
+        if kind == _SET:
+            parent[path[-1]] = args[0]
+        else:
+            del parent[path[-1]]
+
+
+def _capture(function, *args):
+    "Call `function`, returning `(result, exc_info)`"
+    try:
+        return function(*args), None
+    except Exception: # pylint: disable=broad-except
+        # Raised to whoever waits for the result
+        return None, sys.exc_info()
+
+def _copy_outcome(kind, outcome):
+    "A copy of the outcome of the read `kind`"
+    result, exc_info = outcome
+    if exc_info is not None:
+        return outcome
+    elif kind == _GET:
+        return python_copy.copy(result), None
+    else:
+        return [(key, python_copy.copy(value)) for key, value in result], None
+
+def _complete(future, outcome):
+    result, exc_info = outcome
+    if exc_info is None:
+        future.set_result(result)
+    else:
+        future.set_exc_info(exc_info)
+
+def _call(futures, function):
+    outcome = _capture(function)
+    for future in futures:
+        _complete(future, outcome)
+
+def _gather(futures):
+    "A future of the list of results of `futures`, failing if any of them fail"
+    gathered = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_future):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        for future in futures:
+            if future.exception() is not None:
+                gathered.set_exc_info(future._exc_info) # pylint: disable=protected-access
+                return
+        gathered.set_result([future.result() for future in futures])
+
+    if not futures:
+        gathered.set_result([])
+    for future in futures:
+        future.add_done_callback(on_done)
+    return gathered
@@ -0,0 +1,14 @@
+"Benchmarks of jsdb's storage options. Run each module with `python -m`"
+
+import bsddb
+
+def backends():
+    "The available on-disk backends as `(name, storage_class)`"
+    result = [('bsddb', bsddb.btopen)]
+    try:
+        from .. import leveldict
+    except ImportError:
+        pass
+    else:
+        result.append(('leveldb', leveldict.LevelDict))
+    return result
@@ -0,0 +1,115 @@
+"""Compare databases written with and without value compression.
+
+    python -m jsdb.benchmarks.compression [--records N]
+
+Writes the same log-like records, which repeat mid-sized strings, with each
+backend (bsddb, and LevelDB if plyvel is installed): uncompressed, compressed
+with plain zlib, and compressed with a dictionary trained on the records.
+Reports the size on disk, which is also what the page cache has to hold to
+serve reads from memory, and the time taken to write and to read everything
+back.
+"""
+
+import argparse
+import collections
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from . import backends
+from .. import compression
+from .. import keyformat
+from .. import python_copy
+from ..jsdb import Jsdb
+
+Result = collections.namedtuple('Result', 'backend mode disk_bytes write_seconds read_seconds')
+
+MODES = ('none', 'zlib', 'dictionary')
+
+_SERVICES = ['authentication-service', 'billing-service', 'search-frontend', 'recommendation-engine']
+_MESSAGES = [
+    'Request completed successfully after retrying the upstream connection',
+    'User session expired and was refreshed using the long-lived token',
+    'Cache miss for product listing, falling back to the primary database',
+    'Rate limit exceeded for client, request rejected with status 429']
+_AGENTS = [
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/61.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_6) AppleWebKit/603.3.8 (KHTML, like Gecko) Version/10.1.2',
+    'curl/7.52.1']
+
+def make_records(count, seed=0):
+    rand = random.Random(seed)
+    return [dict(
+        id=i,
+        service=rand.choice(_SERVICES),
+        message=rand.choice(_MESSAGES),
+        agent=rand.choice(_AGENTS),
+        url='/api/v2/customers/{}/orders/{}'.format(rand.randint(1, 10000), rand.randint(1, 100000)),
+        ms=rand.random() * 100) for i in range(count)]
+
+def disk_bytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(directory, name))
+                   for directory, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+def train_dictionary(storage_class, filename):
+    "Train a dictionary from the uncompressed database `filename`"
+    store = storage_class(filename)
+    try:
+        data = keyformat.key_format_dict(store)
+        return compression.train(compression.sample_values(data, 10000))
+    finally:
+        store.close()
+
+def measure(backend, storage_class, mode, filename, records, dictionary=None):
+    threshold = None if mode == 'none' else compression.DEFAULT_THRESHOLD
+    if mode == 'dictionary':
+        store = storage_class(filename)
+        compression.add_dictionary(store, dictionary, threshold)
+        store.close()
+
+    start = time.time()
+    db = Jsdb(filename, storage_class=storage_class, compression_threshold=threshold)
+    db['records'] = records
+    db.commit()
+    db.close()
+    write_seconds = time.time() - start
+
+    start = time.time()
+    db = Jsdb(filename, storage_class=storage_class)
+    python_copy.copy(db['records'])
+    db.close()
+    read_seconds = time.time() - start
+    return Result(backend, mode, disk_bytes(filename), write_seconds, read_seconds)
+
+def run(record_count, selected_backends=None):
+    "Return a `Result` for each backend and mode"
+    records = make_records(record_count)
+    results = []
+    directory = tempfile.mkdtemp(prefix='jsdb-bench-')
+    try:
+        for backend, storage_class in selected_backends or backends():
+            filename = os.path.join(directory, backend)
+            dictionary = None
+            for mode in MODES:
+                if mode == 'dictionary':
+                    dictionary = train_dictionary(storage_class, filename + '.none')
+                results.append(measure(backend, storage_class, mode, filename + '.' + mode, records, dictionary))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=10000, help='Number of records to write')
+    args = parser.parse_args()
+
+    print '{:<8} {:<11} {:>12} {:>9} {:>9}'.format('backend', 'compression', 'disk bytes', 'write s', 'read s')
+    for result in run(args.records):
+        print '{:<8} {:<11} {:>12} {:>9.2f} {:>9.2f}'.format(*result)
+
+if __name__ == '__main__':
+    main()
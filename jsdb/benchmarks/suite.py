@@ -0,0 +1,314 @@
+"""Time each kind of operation at several sizes and depths, with each backend.
+
+    python -m jsdb bench [--sizes 100,1000,10000] [--output FILE]
+    python -m jsdb bench --compare OLD NEW
+
+Each database holds a dictionary of `size` records and a list of `size`
+numbers, nested `depth` dictionaries deep. Every operation is timed
+`repeat` times (fewer for operations that read the whole dictionary), and
+the throughput and latency percentiles are reported as json.
+
+`growth` is how the median latency of an operation grows with the size of
+the database, as the exponent `k` of `size ** k` fitted across the sizes
+measured: close to 0 for operations that are O(log N) and close to 1 for
+ones that are O(N). `check_growth` compares these with `EXPECTED_GROWTH`,
+which follows the complexity claimed in the README, and `compare` finds the
+operations that got slower between two result files.
+"""
+
+import argparse
+import collections
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from . import backends as disk_backends
+from ..jsdb import Jsdb
+from ..memorystore import MemoryStore
+
+SIZES = (100, 1000, 10000)
+DEPTHS = (1, 4)
+REPEAT = 50
+# Operations that touch the whole dictionary are repeated less
+SLOW_REPEAT = 5
+TOLERANCE = 0.25
+GROWTH_TOLERANCE = 0.3
+
+# Changes made before timing `commit` and `rollback`, and the size of the
+#   substructure deleted by `purge`
+CHANGES = 10
+PURGED = 100
+
+# The exponent of the growth in latency with size that each operation should not exceed
+EXPECTED_GROWTH = dict(
+    get=0.0,
+    set=0.0,
+    delete=0.0,
+    commit=0.0,
+    rollback=0.0,
+    purge=0.0,
+    iterate=1.0,
+    append=1.0,
+    insert=1.0)
+
+Result = collections.namedtuple('Result', 'backend operation size depth count throughput mean p50 p90 p99')
+
+
+def backends():
+    "The available backends as `(name, storage_class)`"
+    return [('memory', MemoryStore)] + disk_backends()
+
+
+class Fixture(object):
+    "A database holding `size` records and list entries, `depth` dictionaries deep"
+    def __init__(self, db, size, depth):
+        self.db = db
+        self.size = size
+        self.depth = depth
+
+    @classmethod
+    def create(cls, db, size, depth):
+        leaf = dict(
+            items=dict((_key(i), _record(i)) for i in range(size)),
+            list=range(size))
+        for level in reversed(range(1, depth)):
+            leaf = {'d{}'.format(level): leaf}
+        db['d0'] = leaf
+        db.commit()
+        return cls(db, size, depth)
+
+    def leaf(self):
+        node = self.db
+        for level in range(self.depth):
+            node = node['d{}'.format(level)]
+        return node
+
+    def key(self, i):
+        return _key(i % self.size)
+
+def _key(i):
+    return 'k{}'.format(i)
+
+def _record(i):
+    return dict(id=i, name='record {}'.format(i), value=i * 0.5)
+
+
+# Each operation makes any changes that should not be timed, and returns
+#   a function that does what should be timed
+
+def _get(fixture, i):
+    key = fixture.key(i * 7919)
+    return lambda: fixture.leaf()['items'][key]['value']
+
+def _set(fixture, i):
+    key = fixture.key(i * 7919)
+    def set_value():
+        fixture.leaf()['items'][key]['value'] = i
+        fixture.db.commit()
+    return set_value
+
+def _delete(fixture, i):
+    key = fixture.key(i * 7919)
+    fixture.leaf()['items'][key] = _record(i)
+    fixture.db.commit()
+    def delete():
+        del fixture.leaf()['items'][key]
+        fixture.db.commit()
+    return delete
+
+def _iterate(fixture, _i):
+    return lambda: sum(1 for _ in fixture.leaf()['items'].iteritems())
+
+def _append(fixture, i):
+    def append():
+        fixture.leaf()['list'].append(i)
+        fixture.db.commit()
+    return append
+
+def _insert(fixture, i):
+    def insert():
+        fixture.leaf()['list'].insert(0, i)
+        fixture.db.commit()
+    return insert
+
+def _purge(fixture, i):
+    fixture.leaf()['purged'] = dict((_key(j), i) for j in range(PURGED))
+    fixture.db.commit()
+    def purge():
+        del fixture.leaf()['purged']
+        fixture.db.commit()
+    return purge
+
+def _change(fixture, i):
+    items = fixture.leaf()['items']
+    for change in range(CHANGES):
+        items[fixture.key(i * CHANGES + change)]['value'] = i
+
+def _commit(fixture, i):
+    _change(fixture, i)
+    return fixture.db.commit
+
+def _rollback(fixture, i):
+    _change(fixture, i)
+    return fixture.db.rollback
+
+OPERATIONS = collections.OrderedDict([
+    ('get', _get),
+    ('set', _set),
+    ('delete', _delete),
+    ('iterate', _iterate),
+    ('append', _append),
+    ('insert', _insert),
+    ('purge', _purge),
+    ('commit', _commit),
+    ('rollback', _rollback)])
+
+SLOW_OPERATIONS = ('iterate',)
+
+
+def percentile(ordered, fraction):
+    "The value `fraction` of the way through the sorted list `ordered`"
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def time_operation(operation, fixture, repeat):
+    "Time `repeat` runs of `operation`, returning the latencies in seconds"
+    latencies = []
+    for i in range(repeat):
+        timed = operation(fixture, i)
+        start = time.time()
+        timed()
+        latencies.append(time.time() - start)
+    return latencies
+
+def summarise(backend, operation, size, depth, latencies):
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return Result(
+        backend, operation, size, depth, len(ordered),
+        throughput=len(ordered) / total if total else None,
+        mean=total / len(ordered),
+        p50=percentile(ordered, 0.5),
+        p90=percentile(ordered, 0.9),
+        p99=percentile(ordered, 0.99))
+
+def run(sizes=SIZES, depths=DEPTHS, selected_backends=None, operations=None, repeat=REPEAT):
+    "Return a `Result` for each backend, size, depth and operation"
+    operations = operations or list(OPERATIONS)
+    results = []
+    directory = tempfile.mkdtemp(prefix='jsdb-bench-')
+    try:
+        for backend, storage_class in selected_backends or backends():
+            for size in sizes:
+                for depth in depths:
+                    filename = os.path.join(directory, '{}-{}-{}'.format(backend, size, depth))
+                    db = Jsdb(filename, storage_class=storage_class)
+                    try:
+                        fixture = Fixture.create(db, size, depth)
+                        for name in operations:
+                            count = min(repeat, SLOW_REPEAT) if name in SLOW_OPERATIONS else repeat
+                            latencies = time_operation(OPERATIONS[name], fixture, count)
+                            results.append(summarise(backend, name, size, depth, latencies))
+                    finally:
+                        db.close()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+def growth(results):
+    """The exponent of the growth in median latency with size for each
+    `(backend, operation, depth)` measured at more than one size"""
+    series = collections.defaultdict(list)
+    for result in results:
+        if result.p50 > 0:
+            series[result.backend, result.operation, result.depth].append((result.size, result.p50))
+
+    exponents = {}
+    for key, points in series.items():
+        if len(set(size for size, _ in points)) < 2:
+            continue
+        xs = [math.log(size) for size, _ in points]
+        ys = [math.log(latency) for _, latency in points]
+        mean_x = sum(xs) / len(xs)
+        mean_y = sum(ys) / len(ys)
+        exponents[key] = (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) /
+                          sum((x - mean_x) ** 2 for x in xs))
+    return exponents
+
+def check_growth(results, tolerance=GROWTH_TOLERANCE):
+    """Return the `((backend, operation, depth), exponent)` pairs whose
+    latency grows faster than `EXPECTED_GROWTH` allows"""
+    return sorted((key, exponent) for key, exponent in growth(results).items()
+                  if exponent > EXPECTED_GROWTH.get(key[1], 1.0) + tolerance)
+
+def compare(old, new, tolerance=TOLERANCE):
+    """Return `(old, new)` pairs of results for the same measurement whose
+    median latency increased by more than `tolerance` (a fraction)"""
+    key = lambda result: (result.backend, result.operation, result.size, result.depth)
+    previous = dict((key(result), result) for result in old)
+    return [(previous[key(result)], result) for result in new
+            if key(result) in previous and result.p50 > previous[key(result)].p50 * (1 + tolerance)]
+
+def dumps(results):
+    "Encode results and their growth as json"
+    return json.dumps(dict(
+        results=[result._asdict() for result in results],
+        growth=[dict(backend=backend, operation=operation, depth=depth, exponent=exponent)
+                for (backend, operation, depth), exponent in sorted(growth(results).items())]),
+                      indent=2, sort_keys=True)
+
+def loads(string):
+    "Decode results encoded with `dumps`"
+    return [Result(**result) for result in json.loads(string)['results']]
+
+def _parse_list(string, parse=int):
+    return [parse(item) for item in string.split(',')]
+
+def add_arguments(parser):
+    parser.add_argument('--sizes', type=_parse_list, default=SIZES, help='Comma-separated sizes of the dictionary and list')
+    parser.add_argument('--depths', type=_parse_list, default=DEPTHS, help='Comma-separated depths at which they are nested')
+    parser.add_argument('--backends', type=lambda string: _parse_list(string, str), help='Comma-separated backends (default all of {})'.format(
+        ', '.join(name for name, _ in backends())))
+    parser.add_argument('--operations', type=lambda string: _parse_list(string, str), help='Comma-separated operations (default all of {})'.format(
+        ', '.join(OPERATIONS)))
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='Number of times to time each operation')
+    parser.add_argument('--output', type=str, help='Write the results to this file rather than standard output')
+    parser.add_argument('--compare', type=str, nargs=2, metavar=('OLD', 'NEW'), help='Report operations that got slower between two result files')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='Fraction by which the median latency may increase when comparing')
+
+def main(args):
+    "Run or compare benchmarks for the parsed arguments `args`. Returns an exit status."
+    if args.compare:
+        old, new = [loads(open(filename).read()) for filename in args.compare]
+        regressions = compare(old, new, args.tolerance)
+        for before, after in regressions:
+            print '{} {} size={} depth={}: median {:.6f}s -> {:.6f}s'.format(
+                after.backend, after.operation, after.size, after.depth, before.p50, after.p50)
+        return 1 if regressions else 0
+
+    for operation in args.operations or []:
+        if operation not in OPERATIONS:
+            raise ValueError(operation)
+    selected = [(name, storage_class) for name, storage_class in backends()
+                if args.backends is None or name in args.backends]
+    results = run(args.sizes, args.depths, selected, args.operations, args.repeat)
+
+    output = dumps(results)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            stream.write(output)
+    else:
+        print output
+
+    for (backend, operation, depth), exponent in check_growth(results):
+        sys.stderr.write('{} {} depth={}: latency grows as size ** {:.2f}, expected at most {}\n'.format(
+            backend, operation, depth, exponent, EXPECTED_GROWTH[operation]))
+    return 0
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(PARSER)
+    sys.exit(main(PARSER.parse_args()))
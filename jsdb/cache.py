@@ -0,0 +1,131 @@
+"A size-bounded cache of decoded values in front of a store"
+
+import collections
+import threading
+
+from . import flatpath
+from . import largestring
+from . import treeutils
+
+CacheInfo = collections.namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+class _Missing(object):
+    def __repr__(self):
+        return '<MISSING>'
+
+MISSING = _Missing()
+
+# Not in the cache, as opposed to cached as missing
+MISSING_ENTRY = object()
+
+class LruCacheDict(collections.MutableMapping):
+    """Remember the most recently read values of `underlying`.
+
+    Missing keys are cached too, since the flattening layer probes for
+    keys that mostly do not exist. Large strings are not cached when
+    `underlying` can tell which values are (see
+    `jsdb.jsdb.JsonEncodeDict.read_cacheable`), so that one string does not
+    hold the memory of many cached values. Writes go straight through to
+    `underlying` and invalidate the cached entry.
+
+    Several threads may read at once, but not while another thread writes
+    (see `jsdb.locking`).
+    """
+    def __init__(self, underlying, size):
+        if size <= 0:
+            raise ValueError(size)
+        self._underlying = underlying
+        self._size = size
+        self._cache = collections.OrderedDict()
+        self._read_cacheable = getattr(underlying, 'read_cacheable', None)
+        # Guards the order of the cache against concurrent reads
+        self._mutex = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return '<LruCacheDict size={!r} underlying={!r}>'.format(self._size, self._underlying)
+
+    def __getitem__(self, key):
+        if flatpath.is_chunk_key(key):
+            # Chunks are large, and large string chunks are written below us
+            return self._underlying[key]
+        with self._mutex:
+            value = self._cache.pop(key, MISSING_ENTRY)
+            if value is MISSING_ENTRY:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache[key] = value
+
+        if value is MISSING_ENTRY:
+            cacheable = True
+            try:
+                if self._read_cacheable is None:
+                    value = self._underlying[key]
+                else:
+                    value, cacheable = self._read_cacheable(key)
+            except KeyError:
+                value = MISSING
+            if cacheable:
+                self._remember(key, value)
+
+        if value is MISSING:
+            raise KeyError(key)
+        else:
+            return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        else:
+            return True
+
+    def _remember(self, key, value):
+        with self._mutex:
+            self._cache[key] = value
+            if len(self._cache) > self._size:
+                self._cache.popitem(last=False)
+
+    def __setitem__(self, key, value):
+        self._cache.pop(key, None)
+        self._underlying[key] = value
+
+    def __delitem__(self, key):
+        self._cache.pop(key, None)
+        del self._underlying[key]
+        self._remember(key, MISSING)
+
+    def __len__(self):
+        return len(self._underlying)
+
+    def __iter__(self):
+        return iter(self._underlying)
+
+    def key_after_func(self):
+        return treeutils.key_after_func(self._underlying)
+
+    def item_after_func(self):
+        return treeutils.item_after_func(self._underlying)
+
+    def write_batch(self):
+        return treeutils.write_batch(self._underlying)
+
+    def open_string(self, key):
+        return largestring.open_string(self._underlying, key)
+
+    def append_string(self, key, text):
+        self._cache.pop(key, None)
+        largestring.append_string(self._underlying, key, text)
+
+    def truncate_string(self, key, length):
+        self._cache.pop(key, None)
+        largestring.truncate_string(self._underlying, key, length)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self._size, len(self._cache))
@@ -0,0 +1,224 @@
+"""Conversion of json values to and from the strings that are stored on disk.
+
+The codec used by a database is recorded in the store under `HEADER_KEY`
+when the database is created. Encoded values never start with `\x7e` or `\x7f`,
+which mark compressed values (see `jsdb.compression`) and strings stored in
+chunks (see `jsdb.largestring`).
+"""
+
+import json
+import struct
+import types
+
+from . import treeutils
+
+HEADER_KEY = '!codec'
+
+class CodecMismatch(Exception):
+    "The database was created with a different codec"
+    def __init__(self, stored, requested):
+        Exception.__init__(self)
+        self.stored = stored
+        self.requested = requested
+
+    def __str__(self):
+        return 'Database uses codec {!r}, not {!r}'.format(self.stored, self.requested)
+
+class JsonCodec(object):
+    "Store each value as json text"
+    name = 'json'
+
+    def encode(self, value):
+        if not isinstance(value, (int, long, float, str, bool, types.NoneType, unicode)):
+            raise ValueError(value)
+        return json.dumps(value)
+
+    def decode(self, string):
+        return json.loads(string)
+
+
+class BinaryCodec(object):
+    """Store each value as a one-byte type tag followed by a packed value.
+
+    None, booleans and integers in [0, 128) are a single byte, so type markers
+    and most lengths take one byte on disk. Integers that do not fit in 64
+    bits are stored in decimal.
+    """
+    name = 'binary'
+
+    NONE, FALSE, TRUE, INT, FLOAT, STRING, BIG_INT = '\x00', '\x01', '\x02', '\x03', '\x04', '\x05', '\x06'
+    SMALL_INT_BASE = 0x80
+    SMALL_INTS = [chr(SMALL_INT_BASE + i) for i in range(0x80)]
+
+    _INT = struct.Struct('>q')
+    _INT_RANGE = (-2 ** 63, 2 ** 63)
+    _FLOAT = struct.Struct('>d')
+
+    def encode(self, value):
+        if value is None:
+            return self.NONE
+        elif value is True:
+            return self.TRUE
+        elif value is False:
+            return self.FALSE
+        elif isinstance(value, (int, long)):
+            if 0 <= value < 0x80:
+                return self.SMALL_INTS[value]
+            elif self._INT_RANGE[0] <= value < self._INT_RANGE[1]:
+                return self.INT + self._INT.pack(value)
+            else:
+                return self.BIG_INT + str(value)
+        elif isinstance(value, float):
+            return self.FLOAT + self._FLOAT.pack(value)
+        elif isinstance(value, unicode):
+            return self.STRING + value.encode('utf8')
+        elif isinstance(value, str):
+            # Behave like json: only utf8 byte strings can be stored
+            value.decode('utf8')
+            return self.STRING + value
+        else:
+            raise ValueError(value)
+
+    def decode(self, string):
+        tag = string[0]
+        if tag >= '\x80':
+            return ord(tag) - self.SMALL_INT_BASE
+        elif tag == self.TRUE:
+            return True
+        elif tag == self.STRING:
+            return string[1:].decode('utf8')
+        elif tag == self.INT:
+            return self._INT.unpack(string[1:])[0]
+        elif tag == self.FLOAT:
+            return self._FLOAT.unpack(string[1:])[0]
+        elif tag == self.BIG_INT:
+            return int(string[1:])
+        elif tag == self.NONE:
+            return None
+        elif tag == self.FALSE:
+            return False
+        else:
+            raise ValueError(string)
+
+
+CODECS = dict(json=JsonCodec(), binary=BinaryCodec())
+
+_SORT_NONE, _SORT_FALSE, _SORT_TRUE, _SORT_NUMBER, _SORT_STRING = '\x01', '\x02', '\x03', '\x04', '\x05'
+_SORT_FLOAT = struct.Struct('>d')
+# Doubles at least this large are integers, but not every integer is a double
+_SORT_INEXACT = 2.0 ** 53
+_SORT_NEGATIVE, _SORT_ZERO, _SORT_POSITIVE = '\x00', '\x01', '\x02'
+
+def encode_sortable(value):
+    """Encode a json scalar so that byte order matches value order.
+
+    None sorts before False, True, numbers and then strings. Numbers are
+    stored as doubles, followed for doubles of at least 2 ** 53 by how far
+    the integer is from the double, so that integers of any size are
+    ordered exactly. The encoding is self-delimiting so that other data
+    can follow it in a key.
+    """
+    if value is None:
+        return _SORT_NONE
+    elif value is False:
+        return _SORT_FALSE
+    elif value is True:
+        return _SORT_TRUE
+    elif isinstance(value, (int, long, float)):
+        try:
+            # Adding 0.0 turns -0.0 into 0.0
+            number = float(value) + 0.0
+        except OverflowError:
+            raise ValueError(value)
+        packed = _SORT_FLOAT.pack(number)
+        if packed[0] >= '\x80':
+            packed = ''.join(chr(0xff ^ ord(c)) for c in packed)
+        else:
+            packed = chr(0x80 | ord(packed[0])) + packed[1:]
+        if _has_difference(number):
+            # Rounding to a double keeps the order, so integers with the
+            #   same double are ordered by their difference from it
+            packed += _encode_difference(int(value) - int(number))
+        return _SORT_NUMBER + packed
+    elif isinstance(value, basestring):
+        if isinstance(value, unicode):
+            value = value.encode('utf8')
+        else:
+            value.decode('utf8')
+        return _SORT_STRING + value.replace('\x00', '\x00\xff') + '\x00\x01'
+    else:
+        raise ValueError(value)
+
+def decode_sortable(string, position=0):
+    "Decode the value encoded by `encode_sortable` at `position`, returning it and where it ends"
+    tag = string[position]
+    position += 1
+    if tag == _SORT_NONE:
+        return None, position
+    elif tag == _SORT_FALSE:
+        return False, position
+    elif tag == _SORT_TRUE:
+        return True, position
+    elif tag == _SORT_NUMBER:
+        packed = string[position:position + 8]
+        if packed[0] >= '\x80':
+            packed = chr(0x7f & ord(packed[0])) + packed[1:]
+        else:
+            packed = ''.join(chr(0xff ^ ord(c)) for c in packed)
+        number, = _SORT_FLOAT.unpack(packed)
+        position += 8
+        if _has_difference(number):
+            difference, position = _decode_difference(string, position)
+            return int(number) + difference, position
+        if number.is_integer():
+            number = int(number)
+        return number, position
+    elif tag == _SORT_STRING:
+        # Escaped NULs are followed by \xff so the first \x00\x01 ends the string
+        end = string.index('\x00\x01', position)
+        return string[position:end].replace('\x00\xff', '\x00').decode('utf8'), end + 2
+    else:
+        raise ValueError(string)
+
+def _has_difference(number):
+    "Is the sortable encoding of the double `number` followed by a difference"
+    return _SORT_INEXACT <= abs(number) < float('inf')
+
+def _encode_difference(difference):
+    # A sign, then the length and big-endian bytes of the magnitude, which
+    #   are inverted for negative differences so that larger ones sort first
+    if difference == 0:
+        return _SORT_ZERO
+    digits = '{:x}'.format(abs(difference))
+    magnitude = ('0' * (len(digits) % 2) + digits).decode('hex')
+    encoded = chr(len(magnitude)) + magnitude
+    if difference > 0:
+        return _SORT_POSITIVE + encoded
+    return _SORT_NEGATIVE + _invert(encoded)
+
+def _decode_difference(string, position):
+    sign = string[position]
+    if sign == _SORT_ZERO:
+        return 0, position + 1
+    length = ord(string[position + 1])
+    if sign == _SORT_NEGATIVE:
+        length ^= 0xff
+    end = position + 2 + length
+    magnitude = string[position + 2:end]
+    if sign == _SORT_NEGATIVE:
+        return -int(_invert(magnitude).encode('hex'), 16), end
+    return int(magnitude.encode('hex'), 16), end
+
+def _invert(text):
+    return ''.join(chr(0xff ^ ord(c)) for c in text)
+
+def store_codec(store, name=None):
+    """Return the codec used by `store`.
+
+    New stores record the codec `name` (by default json). Stores created before
+    codecs were recorded use json.
+    """
+    stored_name = treeutils.store_header(store, HEADER_KEY, name, 'json')
+    if name is not None and name != stored_name:
+        raise CodecMismatch(stored_name, name)
+    return CODECS[stored_name]
@@ -0,0 +1,86 @@
+"""Columns of fields pulled out of a list of records (dictionaries).
+
+    db.to_columns('events', ['ts', 'value'])
+
+reads every record of `events` with a single ordered scan over the list's
+flattened keys, rather than looking up each record and field in turn. Each
+field is collected into an `array.array` of `typecode` (by default doubles)
+allocated up front, along with a mask of the rows where the field is
+missing or null, so memory use is proportional to the columns returned.
+
+Fields are dictionary keys, or tuples of keys and indexes for values
+nested inside each record (e.g. `('meta', 'host')`). The typecode `'O'`
+collects values of any json type into a list.
+"""
+
+import array
+import collections
+import re
+
+from . import flatpath
+from . import treeutils
+
+DEFAULT_TYPECODE = 'd'
+OBJECT = 'O'
+
+_ROW = re.compile(r'\[(\d+)\]')
+
+class Column(collections.namedtuple('Column', 'values missing')):
+    """The values of a field for each row, and a mask of the rows where it
+    is missing or null (whose values are 0, or None for object columns)"""
+
+    def to_numpy(self):
+        "Return the column as a numpy masked array sharing memory with `values` (requires numpy)"
+        import numpy
+        if isinstance(self.values, list):
+            values = numpy.array(self.values, dtype=object)
+        else:
+            values = numpy.frombuffer(self.values, dtype=self.values.typecode)
+        return numpy.ma.masked_array(values, mask=numpy.frombuffer(self.missing, dtype=bool))
+
+def _field_path(field):
+    if isinstance(field, tuple):
+        return field
+    return (field,)
+
+def to_columns(store, prefix, fields, typecodes=None):
+    """Return a dictionary mapping each of `fields` to a `Column` of its
+    values in the records of the list at the flat key `prefix` of `store`.
+    `typecodes` maps fields to the typecode of their column."""
+    typecodes = typecodes or {}
+    marker = store.get(prefix + '[')
+    if marker is None:
+        raise KeyError(prefix)
+    elif marker is not True:
+        raise ValueError('{!r} is a packed array, not a list of records'.format(prefix))
+    length = store.get(prefix + '#', 0)
+
+    columns = {}
+    by_suffix = {}
+    for field in fields:
+        typecode = typecodes.get(field, DEFAULT_TYPECODE)
+        if typecode == OBJECT:
+            values = [None] * length
+        else:
+            values = array.array(typecode, [0]) * length
+        column = columns[field] = Column(values, array.array('B', [1]) * length)
+        by_suffix[flatpath.join_key(_field_path(field), '=')] = column
+
+    for key in treeutils.keys_with_prefix(store, prefix + '['):
+        match = _ROW.match(key, len(prefix))
+        if match is None:
+            continue
+        column = by_suffix.get(key[match.end():])
+        if column is None:
+            continue
+
+        value = store[key]
+        if value is None:
+            continue
+        row = int(match.group(1))
+        try:
+            column.values[row] = value
+        except (TypeError, OverflowError):
+            raise ValueError('{!r}: {!r} does not fit its column'.format(key, value))
+        column.missing[row] = 0
+    return columns
@@ -0,0 +1,170 @@
+"""Compression of encoded values with zlib and a trained dictionary.
+
+Values of a few dozen bytes hardly compress on their own, but documents
+repeat the same strings across many values. A dictionary of these strings,
+trained by sampling stored values (`train`), lets zlib refer back to it from
+every value. Python 2's zlib cannot be given a preset dictionary, so
+`Compressor` primes a raw deflate stream by compressing the dictionary, and
+continues a copy of this stream for each value: only what follows the
+dictionary is stored.
+
+Settings are recorded under `HEADER_KEY`, and each dictionary under
+`DICTIONARY_PREFIX` followed by its number so that values compressed with
+an older dictionary can still be read. Compressed values start with `FLAG`
+and the number of their dictionary (0 is the empty dictionary). Other
+values are stored as the codec encodes them, so compressed and uncompressed
+values can be mixed and compression can be turned on for an existing
+database.
+"""
+
+import collections
+import json
+import random
+import re
+import zlib
+
+from . import flatpath
+from . import keyformat
+from . import largestring
+
+HEADER_KEY = '!compression'
+DICTIONARY_PREFIX = '!compression-dictionary.'
+FLAG = '\x7e'
+DEFAULT_THRESHOLD = 64
+# Deflate can only refer back 32KiB, and the value itself takes up some of this
+DICTIONARY_SIZE = 1 << 14
+LEVEL = 6
+
+# Runs of text between numbers (which tend to differ between values) and quotes
+_TOKEN = re.compile(r'[^\d"\\]{4,}')
+
+class Compressor(object):
+    "Compress strings as if each followed `dictionary`"
+    def __init__(self, dictionary, level=LEVEL):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        primed = compressor.compress(dictionary) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._compressor = compressor
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._decompressor.decompress(primed)
+
+    def compress(self, string):
+        compressor = self._compressor.copy()
+        return compressor.compress(string) + compressor.flush()
+
+    def decompress(self, string):
+        decompressor = self._decompressor.copy()
+        return decompressor.decompress(string) + decompressor.flush()
+
+
+class CompressingCodec(object):
+    """Compress the values encoded by `codec` that are at least `threshold`
+    bytes long with the current dictionary of `store`, when this makes
+    them shorter"""
+    def __init__(self, codec, store, settings):
+        self.name = codec.name
+        self._codec = codec
+        self._store = store
+        self._threshold = settings.get('threshold')
+        self._dictionary = settings.get('dictionary', 0)
+        self._compressors = {}
+
+    def __repr__(self):
+        return '<CompressingCodec codec={!r} threshold={!r} dictionary={!r}>'.format(
+            self.name, self._threshold, self._dictionary)
+
+    def _compressor(self, number):
+        if number not in self._compressors:
+            dictionary = self._store[DICTIONARY_PREFIX + str(number)] if number else ''
+            self._compressors[number] = Compressor(dictionary)
+        return self._compressors[number]
+
+    def encode(self, value):
+        string = self._codec.encode(value)
+        if self._threshold is None or len(string) < self._threshold:
+            return string
+        compressed = (FLAG + keyformat.encode_int(self._dictionary) +
+                      self._compressor(self._dictionary).compress(string))
+        return compressed if len(compressed) < len(string) else string
+
+    def decode(self, string):
+        if string[:1] == FLAG:
+            number, position = keyformat.decode_int(string, 1)
+            string = self._compressor(number).decompress(string[position:])
+        return self._codec.decode(string)
+
+
+def read_settings(store):
+    "The compression settings recorded in `store`, or None"
+    try:
+        return json.loads(store[HEADER_KEY])
+    except KeyError:
+        return None
+
+def _write_settings(store, settings):
+    store[HEADER_KEY] = json.dumps(settings, sort_keys=True)
+
+def store_compression(store, codec, threshold=None):
+    """Wrap `codec` so that it compresses values as recorded in `store`.
+    If `threshold` is given, compress values at least this long from now on."""
+    settings = read_settings(store)
+    if threshold is not None:
+        settings = settings or dict(dictionary=0)
+        if settings.get('threshold') != threshold:
+            settings['threshold'] = threshold
+            _write_settings(store, settings)
+
+    if settings is None:
+        return codec
+    return CompressingCodec(codec, store, settings)
+
+def add_dictionary(store, dictionary, threshold=None):
+    """Record `dictionary` in `store` and compress values written from now
+    on with it. Returns the dictionary's number."""
+    settings = read_settings(store) or dict(dictionary=0)
+    number = settings.get('dictionaries', 0) + 1
+    store[DICTIONARY_PREFIX + str(number)] = dictionary
+    settings.update(dictionary=number, dictionaries=number)
+    if threshold is not None or settings.get('threshold') is None:
+        settings['threshold'] = threshold or DEFAULT_THRESHOLD
+    _write_settings(store, settings)
+    return number
+
+def sample_values(store, count, seed=0):
+    "Return up to `count` stored values of the flat store `store`, chosen at random"
+    rand = random.Random(seed)
+    keys = []
+    value_keys = (key for key in store if key.endswith('=') and not key.startswith(flatpath.META_PREFIX))
+    for seen, key in enumerate(value_keys):
+        if len(keys) < count:
+            keys.append(key)
+        else:
+            replaced = rand.randint(0, seen)
+            if replaced < count:
+                keys[replaced] = key
+
+    values = (store[key] for key in keys)
+    return [value for value in values
+            if value[:1] != FLAG and not largestring.is_large(value)]
+
+def train(samples, size=DICTIONARY_SIZE):
+    """Build a dictionary of up to `size` bytes from the whole values, and
+    the runs of text between numbers, that occur in more than one of
+    `samples` (encoded values)"""
+    counts = collections.Counter()
+    for sample in samples:
+        counts[sample] += 1
+        for token in set(_TOKEN.findall(sample)):
+            if token != sample:
+                counts[token] += 1
+
+    scored = sorted(((count * len(string), string) for string, count in counts.items() if count > 1),
+                    reverse=True)
+    chosen = []
+    total = 0
+    for _, string in scored:
+        if total + len(string) <= size:
+            chosen.append(string)
+            total += len(string)
+
+    # Deflate encodes nearer matches in fewer bits, so put the most useful last
+    return ''.join(reversed(chosen))
@@ -0,0 +1,117 @@
+"""Counts of the operations that jsdb makes on its store.
+
+`CountingStore` wraps a store and adds each operation, and the bytes of the
+keys and values read and written, to a `collections.Counter`:
+
+    counts = collections.Counter()
+    db = Jsdb(filename, storage_class=counting_storage(bsddb.btopen, counts))
+    with measure(counts) as lookup:
+        db['users']['alice']
+    lookup['get'], lookup['bytes_read']
+
+Unlike timings these counts are deterministic, so tests can check how the
+work done by each operation grows with the size of the database.
+"""
+
+import collections
+import contextlib
+
+from . import treeutils
+
+# The operations counted. Iterating counts each key yielded.
+OPERATIONS = ('get', 'put', 'delete', 'contains', 'key_after', 'item_after', 'iterate', 'len', 'batch')
+BYTES = ('bytes_read', 'bytes_written')
+
+class CountingStore(collections.MutableMapping):
+    """Count the operations made on the store `underlying` in `counts`.
+
+    Subclasses can record operations elsewhere by overriding `_call`, which
+    makes each operation on a key, and `_add`, which adds to the other counts.
+    """
+    def __init__(self, underlying, counts=None):
+        self._underlying = underlying
+        self.counts = collections.Counter() if counts is None else counts
+
+    def __repr__(self):
+        return '<{} underlying={!r}>'.format(type(self).__name__, self._underlying)
+
+    def _call(self, operation, key, function, *args):
+        "Call `function` with `args` to carry out `operation` on `key`"
+        self.counts[operation] += 1
+        return function(*args)
+
+    def _add(self, name, amount):
+        self.counts[name] += amount
+
+    def __getitem__(self, key):
+        value = self._call('get', key, self._underlying.__getitem__, key)
+        self._add('bytes_read', len(key) + len(value))
+        return value
+
+    def __contains__(self, key):
+        return self._call('contains', key, self._underlying.__contains__, key)
+
+    def __setitem__(self, key, value):
+        self._call('put', key, self._underlying.__setitem__, key, value)
+        self._add('bytes_written', len(key) + len(value))
+
+    def __delitem__(self, key):
+        self._call('delete', key, self._underlying.__delitem__, key)
+
+    def __len__(self):
+        self._add('len', 1)
+        return len(self._underlying)
+
+    def __iter__(self):
+        for key in self._underlying:
+            self._add('iterate', 1)
+            self._add('bytes_read', len(key))
+            yield key
+
+    def key_after_func(self):
+        key_after = treeutils.key_after_func(self._underlying)
+        if key_after is None:
+            return None
+
+        def counted_key_after(target_key):
+            key = self._call('key_after', target_key, key_after, target_key)
+            self._add('bytes_read', len(key))
+            return key
+        return counted_key_after
+
+    def item_after_func(self):
+        item_after = treeutils.item_after_func(self._underlying)
+        if item_after is None:
+            return None
+
+        def counted_item_after(target_key):
+            key, value = self._call('item_after', target_key, item_after, target_key)
+            self._add('bytes_read', len(key) + len(value))
+            return key, value
+        return counted_item_after
+
+    def write_batch(self):
+        self._add('batch', 1)
+        return treeutils.write_batch(self._underlying)
+
+    def close(self):
+        self._underlying.close()
+
+def counting_storage(storage_class, counts):
+    "A `storage_class` for `Jsdb` whose stores add the operations made on them to `counts`"
+    return lambda filename: CountingStore(storage_class(filename), counts)
+
+@contextlib.contextmanager
+def measure(counts):
+    """Yield a `collections.Counter` which, when the context exits, holds
+    what was added to `counts` within it"""
+    before = collections.Counter(counts)
+    difference = collections.Counter()
+    try:
+        yield difference
+    finally:
+        difference.update(counts)
+        difference.subtract(before)
+        for name in list(difference):
+            if not difference[name]:
+                del difference[name]
@@ -1,5 +1,7 @@
+import array
 import types
 import collections
 
-JSON_TYPES = (types.NoneType, bool, list, float, int, str, unicode, collections.MutableMapping, collections.MutableSequence)
-JSON_VALUE_TYPES = (types.NoneType, bool, float, int, str, unicode)
+JSON_TYPES = (types.NoneType, bool, list, float, int, long, str, unicode, collections.MutableMapping, collections.MutableSequence,
+              array.array)
+JSON_VALUE_TYPES = (types.NoneType, bool, float, int, long, str, unicode)
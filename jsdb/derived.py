@@ -0,0 +1,204 @@
+"""Data derived from the values at paths that match patterns: secondary
+indexes (`jsdb.index`) and aggregates (`jsdb.aggregate`).
+
+`DerivedDict` sits below the flattening layer, so it sees every value key
+that is written or deleted (including those rewritten when list entries
+shift, purged, or moved) and updates the derived side keys to match.
+Derived data therefore always describes committed data: changes that are
+rolled back never reach this layer.
+"""
+
+import collections
+import contextlib
+
+from . import aggregate
+from . import index
+from . import largestring
+from . import treeutils
+
+class _Missing(object):
+    def __repr__(self):
+        return '<MISSING>'
+
+MISSING = _Missing()
+
+class SideWriter(object):
+    """Writes to side keys on behalf of derived data definitions.
+
+    Increments are added up in memory until `flush`, because writes made
+    in a write batch cannot be read back until the batch is written.
+    """
+    def __init__(self, store):
+        self._store = store
+        self._increments = {}
+
+    def put(self, key, value):
+        self._store[key] = value
+
+    def delete(self, key):
+        self._store.pop(key, None)
+
+    def increment(self, key, amount):
+        self._increments[key] = self._increments.get(key, 0) + amount
+
+    def flush(self):
+        for key, amount in self._increments.items():
+            if amount == 0:
+                continue
+            total = self._store.get(key, 0) + amount
+            if total == 0:
+                self._store.pop(key, None)
+            else:
+                self._store[key] = total
+        self._increments.clear()
+
+    def discard(self):
+        self._increments.clear()
+
+
+class DerivedDict(collections.MutableMapping):
+    "Maintain the indexes and aggregates defined in `underlying` as flat keys are written to it"
+    def __init__(self, underlying):
+        self._underlying = underlying
+        self._side = SideWriter(underlying)
+        self._batch_depth = 0
+        self._indexes = index.load_definitions(underlying)
+        self._aggregates = aggregate.load_definitions(underlying)
+        self._definitions = self._indexes.values() + self._aggregates.values()
+
+    def __repr__(self):
+        return '<DerivedDict indexes={!r} aggregates={!r} underlying={!r}>'.format(
+            sorted(self._indexes), sorted(self._aggregates), self._underlying)
+
+    def _matching(self, key):
+        if not self._definitions or not key.endswith('='):
+            return ()
+        return [definition for definition in self._definitions if definition.pattern.matches(key)]
+
+    def __getitem__(self, key):
+        return self._underlying[key]
+
+    def __setitem__(self, key, value):
+        definitions = self._matching(key)
+        if definitions:
+            old_value = self._underlying.get(key, MISSING)
+            for definition in definitions:
+                if old_value is not MISSING:
+                    definition.remove(self._side, key, old_value)
+                definition.add(self._side, key, value)
+            self._flush()
+        self._underlying[key] = value
+
+    def __delitem__(self, key):
+        definitions = self._matching(key)
+        if definitions:
+            old_value = self._underlying[key]
+            for definition in definitions:
+                definition.remove(self._side, key, old_value)
+            self._flush()
+        del self._underlying[key]
+
+    def _flush(self):
+        if not self._batch_depth:
+            self._side.flush()
+
+    def __contains__(self, key):
+        return key in self._underlying
+
+    def __len__(self):
+        return len(self._underlying)
+
+    def __iter__(self):
+        return iter(self._underlying)
+
+    def key_after_func(self):
+        return treeutils.key_after_func(self._underlying)
+
+    def item_after_func(self):
+        return treeutils.item_after_func(self._underlying)
+
+    def open_string(self, key):
+        return largestring.open_string(self._underlying, key)
+
+    def append_string(self, key, text):
+        if self._matching(key):
+            # Derived data needs the whole old and new values
+            self[key] = largestring.join(self._underlying[key], text)
+        else:
+            largestring.append_string(self._underlying, key, text)
+
+    def truncate_string(self, key, length):
+        if self._matching(key):
+            self[key] = largestring.utf8(self._underlying[key])[:length].decode('utf8')
+        else:
+            largestring.truncate_string(self._underlying, key, length)
+
+    @contextlib.contextmanager
+    def write_batch(self):
+        with treeutils.write_batch(self._underlying):
+            self._batch_depth += 1
+            try:
+                yield
+            except:
+                self._side.discard()
+                raise
+            finally:
+                self._batch_depth -= 1
+            self._flush()
+
+    def _add_definition(self, definitions, definition, save):
+        if definition.name in definitions:
+            raise ValueError('{!r} already exists'.format(definition.name))
+        definitions[definition.name] = definition
+        self._definitions.append(definition)
+        save(self._underlying, definitions)
+
+        prefix = definition.pattern.prefix()
+        with self.write_batch():
+            for key in list(treeutils.keys_with_prefix(self._underlying, prefix)):
+                if definition.pattern.matches(key):
+                    definition.add(self._side, key, self._underlying[key])
+
+    def _drop_definition(self, definitions, name, save):
+        definition = definitions.pop(name)
+        self._definitions.remove(definition)
+        save(self._underlying, definitions)
+
+        with treeutils.write_batch(self._underlying):
+            for key in treeutils.keys_with_prefix(self._underlying, definition.prefix):
+                del self._underlying[key]
+
+    def index_names(self):
+        return sorted(self._indexes)
+
+    def create_index(self, name, pattern):
+        """Index the values at paths matching `pattern` as `name`, adding
+        entries for the values that are already stored"""
+        if not isinstance(name, str):
+            raise ValueError(name)
+        self._add_definition(self._indexes, index.IndexDefinition(name, pattern), index.save_definitions)
+
+    def drop_index(self, name):
+        "Remove the index `name` and its entries"
+        self._drop_definition(self._indexes, name, index.save_definitions)
+
+    def index(self, name):
+        return index.Index(self._underlying, self._indexes[name])
+
+    def aggregate_names(self):
+        return sorted(self._aggregates)
+
+    def create_aggregate(self, name, pattern, buckets=None):
+        """Aggregate the numbers at paths matching `pattern` as `name`,
+        including those that are already stored"""
+        if not isinstance(name, str):
+            raise ValueError(name)
+        definition = aggregate.AggregateDefinition(name, pattern, buckets)
+        self._add_definition(self._aggregates, definition, aggregate.save_definitions)
+
+    def drop_aggregate(self, name):
+        self._drop_definition(self._aggregates, name, aggregate.save_definitions)
+
+    def aggregate(self, name):
+        "The current `jsdb.aggregate.AggregateValues` of the aggregate `name`"
+        return self._aggregates[name].read(self._underlying)
@@ -2,12 +2,16 @@
 structure into a store that does not support nesting.
 """
 
+import array
 import collections
 import logging
 
+from . import columns
+from . import largestring
 from . import python_copy
 from .flatpath import FlatPath
 from . import flatpath
+from . import packed
 from .data import JSON_VALUE_TYPES
 from . import treeutils
 
@@ -15,6 +19,50 @@ LOGGER = logging.getLogger('jsdb.flatdict')
 
 ASCII_TOP = '\xff'
 
+def flatten(prefix, value):
+    "Iterate over the flat keys and values that store `value` at the flat prefix `prefix`"
+    if isinstance(value, JSON_VALUE_TYPES):
+        yield prefix + '=', value
+    elif isinstance(value, array.array):
+        for item in packed.flatten(prefix, value):
+            yield item
+    elif isinstance(value, collections.Mapping):
+        yield prefix + '.', True
+        if value:
+            yield prefix + '#', len(value)
+        for key, child in value.items():
+            if isinstance(key, unicode):
+                key = key.encode('ascii')
+            if not isinstance(key, str):
+                raise ValueError(key)
+            for item in flatten(prefix + flatpath.join_key((key,)), child):
+                yield item
+    elif isinstance(value, collections.Sequence):
+        yield prefix + '[', True
+        if value:
+            yield prefix + '#', len(value)
+        for index, child in enumerate(value):
+            for item in flatten(prefix + flatpath.join_key((index,)), child):
+                yield item
+    else:
+        raise ValueError(value)
+
+def _comparable(value):
+    # Distinguish values that python considers equal but json does not
+    if isinstance(value, bool) or value is None:
+        return type(value), value
+    elif isinstance(value, (int, long)):
+        return int, value
+    elif isinstance(value, str):
+        return unicode, value.decode('utf8')
+    else:
+        return type(value), value
+
+def _same_value(key, old, new):
+    if flatpath.is_chunk_key(key):
+        return old == new
+    return _comparable(old) == _comparable(new)
+
 class JsonFlatteningDict(collections.MutableMapping):
     "Flatten nested list and dictionaries down to a string to value mapping"
 
@@ -81,6 +129,9 @@ class JsonFlatteningDict(collections.MutableMapping):
                 yield child_path.prefix().key_string()
 
     def _is_child_key(self, key):
+        if key.startswith(flatpath.META_PREFIX) or flatpath.is_chunk_key(key):
+            return False
+
         child_path = FlatPath(key)
         try:
             return child_path.prefix().parent().key() == self._prefix
@@ -130,6 +181,78 @@ class JsonFlatteningDict(collections.MutableMapping):
             except KeyError:
                 break
 
+    def assign(self, key, value, diff=True):
+        """Set `key` to `value`. If `diff` is set, only write the flat keys
+        that differ from those of the existing value, so that assigning a
+        slightly changed copy of a large structure makes few writes.
+        This is what assigning a dictionary does."""
+        if isinstance(key, unicode):
+            key = key.encode('ascii')
+        if isinstance(value, (JsonFlatteningDict, JsonFlatteningList)):
+            if self._path.dict().lookup(key).key() == value._path.key():
+                return
+        if isinstance(value, (collections.Sequence, collections.Mapping)):
+            value = python_copy.copy(value)
+
+        if not diff:
+            self.pop(key, None)
+        self._assign_copy(key, value)
+
+    def _assign_copy(self, key, value):
+        existed = self._flat_store.assign(self._path.dict().lookup(key).key(), value)
+        if not existed:
+            self._set_length(len(self) + 1)
+
+    def iteritems(self):
+        item_after = treeutils.item_after_func(self._underlying)
+        if item_after:
+            return self._item_after_iteritems(item_after)
+        else:
+            return collections.MutableMapping.iteritems(self)
+
+    def itervalues(self):
+        for _, value in self.iteritems():
+            yield value
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def _item_after_iteritems(self, item_after):
+        # Like `_key_after_iter`, except that the key found for each child
+        #   is its length, type marker or value, and we get its value
+        #   from the same lookup. So children that are values need no
+        #   further reads, and containers are known to be dictionaries or lists.
+        dict_key = self._path.dict().key()
+        search_key = dict_key
+        while True:
+            try:
+                found_key, value = item_after(search_key)
+            except KeyError:
+                return
+            if not found_key.startswith(dict_key):
+                return
+
+            search_key = found_key + ASCII_TOP
+            child_path = FlatPath(found_key)
+            path_type = child_path.path_type()
+            if isinstance(path_type, flatpath.LengthPath):
+                # The type marker follows
+                continue
+
+            item_prefix = child_path.prefix().key()
+            if isinstance(path_type, flatpath.ValuePath):
+                child = value
+            elif isinstance(path_type, flatpath.DictPath):
+                child = JsonFlatteningDict(self._underlying, prefix=item_prefix)
+            elif value is True:
+                child = JsonFlatteningList(self._underlying, prefix=item_prefix)
+            else:
+                child = packed.PackedArray(self._underlying, item_prefix, value)
+            yield child_path.prefix().key_string(), child
+
     def __delitem__(self, key):
         if key not in self:
             raise KeyError(key)
@@ -160,14 +283,12 @@ class JsonFlatteningDict(collections.MutableMapping):
             flat_key = self._path.dict().lookup(key).value().key()
             self._underlying[flat_key] = value
             self._set_length(len(self) + 1)
-        elif isinstance(value, (dict, collections.MutableMapping)):
+        elif isinstance(value, array.array):
             self.pop(key, None)
-            base_path = self._path.dict().lookup(key)
-            self._underlying[base_path.dict().key()] = True
+            packed.write(self._underlying, self._path.dict().lookup(key).key(), value)
             self._set_length(len(self) + 1)
-            dict_store = self[key]
-            for dict_key in list(value):
-                dict_store[dict_key] = value[dict_key]
+        elif isinstance(value, (dict, collections.MutableMapping)):
+            self._assign_copy(key, value)
         elif isinstance(value, (list, collections.MutableSequence)):
             self.pop(key, None)
             base_path = self._path.dict().lookup(key)
@@ -183,6 +304,81 @@ class JsonFlatteningDict(collections.MutableMapping):
     def copy(self):
         return {k: self[k] for k in self.keys()}
 
+    def query(self, query):
+        "Iterate over the `(path, value)` matches of the `jsdb.query.Query` `query` below this dictionary"
+        return query.run(self._underlying, self._prefix)
+
+    def to_columns(self, path, fields, typecodes=None):
+        "Columns of `fields` from the records of the list at `path` (see `jsdb.columns`)"
+        prefix = self._prefix + flatpath.join_key(tuple(path))
+        return columns.to_columns(self._underlying, prefix, fields, typecodes)
+
+    def _value_key(self, path):
+        return self._prefix + flatpath.join_key(tuple(path), '=')
+
+    def open_string(self, path):
+        "A `jsdb.largestring.StringReader` of the string at `path`"
+        return largestring.open_string(self._underlying, self._value_key(path))
+
+    def append_string(self, path, text):
+        "Append `text` to the string at `path`, only rewriting the end of large strings"
+        largestring.append_string(self._underlying, self._value_key(path), text)
+
+    def truncate_string(self, path, length):
+        "Shorten the string at `path` to `length` utf8 bytes"
+        largestring.truncate_string(self._underlying, self._value_key(path), length)
+
+    def move(self, source_path, target_path):
+        """Move the value at `source_path` to `target_path` by rewriting
+        the keys below it in one write batch, without building Python objects.
+
+        Paths are sequences of keys and indexes relative to this dictionary.
+        Both must be entries of dictionaries, and `target_path` must not exist.
+        """
+        source_parent, source, target_parent, target = self._transfer_prefixes(source_path, target_path)
+        if not isinstance(source_parent, JsonFlatteningDict):
+            raise ValueError('{!r} is not in a dictionary'.format(source_path))
+
+        self._flat_store.copy_prefix(source, target, move=True)
+        source_parent._set_length(len(source_parent) - 1)
+        target_parent._set_length(len(target_parent) + 1)
+
+    def copy_path(self, source_path, target_path):
+        "Copy the value at `source_path` to `target_path`, like `move` but keeping the source"
+        _, source, target_parent, target = self._transfer_prefixes(source_path, target_path)
+        self._flat_store.copy_prefix(source, target)
+        target_parent._set_length(len(target_parent) + 1)
+
+    def _transfer_prefixes(self, source_path, target_path):
+        source_path, target_path = tuple(source_path), tuple(target_path)
+        if not source_path or not target_path:
+            raise ValueError('Cannot move or copy the root')
+        if target_path[:len(source_path)] == source_path:
+            raise ValueError('Cannot move or copy {!r} into itself'.format(source_path))
+
+        source_parent = self._lookup_path(source_path[:-1])
+        if isinstance(source_parent, JsonFlatteningDict):
+            source = source_parent._path.dict().lookup(source_path[-1]).key()
+        else:
+            source = source_parent._path.list().index(source_parent._simplify_index(source_path[-1])).key()
+        # Raises an error if missing
+        self._flat_store.lookup(source)
+
+        target_parent = self._lookup_path(target_path[:-1])
+        if not isinstance(target_parent, JsonFlatteningDict):
+            raise ValueError('{!r} is not in a dictionary'.format(target_path))
+        if target_path[-1] in target_parent:
+            raise ValueError('{!r} already exists'.format(target_path))
+        target = target_parent._path.dict().lookup(target_path[-1]).key()
+
+        return source_parent, source, target_parent, target
+
+    def _lookup_path(self, path):
+        value = self
+        for component in path:
+            value = value[component]
+        return value
+
 
 class JsonFlatteningList(collections.MutableSequence):
     def __init__(self, underlying, prefix):
@@ -232,15 +428,9 @@ class JsonFlatteningList(collections.MutableSequence):
 
         if isinstance(index, slice):
             if index.start == index.stop == index.step == None:
-                # Support complete reassignment because
-
-                self._flat_store.purge_prefix(self._path.list().key())
-                self._underlying[self._path.list().key()] = True
-
-                self._set_length(0)
-
-                for item in value:
-                    self.append(item)
+                # Support complete reassignment because rollback commits lists this way.
+                #   Only the entries that changed are written
+                self._flat_store.assign(self._prefix, list(value))
             else:
                 raise NotImplementedError()
         else:
@@ -256,22 +446,17 @@ class JsonFlatteningList(collections.MutableSequence):
         if isinstance(value, (collections.Sequence, collections.Mapping)):
             value = python_copy.copy(value)
 
+        if isinstance(value, (dict, list)):
+            # Only write what differs: entries often shift onto similar entries
+            self._flat_store.assign(self._path.list().index(index).key(), value)
+            return
+
         self._flat_store.purge_prefix(self._path.list().index(index).key())
 
         if isinstance(value, JSON_VALUE_TYPES):
             self._underlying[self._path.list().index(index).value().key()] = value
-        elif isinstance(value, dict):
-            dict_key = self._path.list().index(index)
-            self._underlying[dict_key.dict().key()] = True
-            nested_dict = self[index]
-            for key, nested_value in list(value.items()):
-                nested_dict[key] = nested_value
-        elif isinstance(value, list):
-            list_key = self._path.list().index(index)
-            self._underlying[list_key.list().key()] = True
-            nested_list = self[index]
-            for nested_value in value:
-                nested_list.append(nested_value)
+        elif isinstance(value, array.array):
+            packed.write(self._underlying, self._path.list().index(index).key(), value)
         else:
             raise ValueError(value)
 
@@ -318,7 +503,9 @@ class FlatteningStore(object):
 
         has_terminal_key = self._has_terminal_key(item_prefix)
         has_dict_key = self._has_dict_key(item_prefix)
-        has_list_key = self._has_list_key(item_prefix)
+        # True for lists, or the typecode of a packed array
+        list_marker = self._underlying.get(item_prefix + '[')
+        has_list_key = list_marker is not None
 
         if len([x for x in (has_terminal_key, has_dict_key, has_list_key) if x]) > 1:
             key_types = (
@@ -331,6 +518,8 @@ class FlatteningStore(object):
             return self._underlying[item_path.value().key()]
         elif has_dict_key:
             return JsonFlatteningDict(self._underlying, prefix=item_path.key())
+        elif has_list_key and list_marker is not True:
+            return packed.PackedArray(self._underlying, item_path.key(), list_marker)
         elif has_list_key:
             return JsonFlatteningList(self._underlying, prefix=item_path.key())
         else:
@@ -345,39 +534,100 @@ class FlatteningStore(object):
     def _has_dict_key(self, item_prefix):
         return item_prefix + "." in self._underlying
 
-    def _has_list_key(self, item_prefix):
-        return item_prefix + "[" in self._underlying
-
     def _has_terminal_key(self, item_prefix):
         return item_prefix + "=" in self._underlying
 
     def purge_prefix(self, prefix):
         "Remove everythign in the store that starts with this prefix"
-        try:
-            key_after = treeutils.key_after_func(self._underlying)
-        except KeyError:
-            return
+        with treeutils.write_batch(self._underlying):
+            for key in self.prefix_keys(prefix):
+                del self._underlying[key]
 
+    def prefix_keys(self, prefix):
+        """Iterate over the keys in the store that start with `prefix`.
+
+        Keys that have been yielded may be deleted during iteration.
+        """
+        key_after = treeutils.key_after_func(self._underlying)
         if key_after:
-            self._key_after_purge_prefix(key_after, prefix)
+            return self._key_after_prefix_keys(key_after, prefix)
         else:
-            self._inefficient_purge_prefix(prefix)
+            return self._inefficient_prefix_keys(prefix)
 
-    def _key_after_purge_prefix(self, key_after, prefix):
+    def _key_after_prefix_keys(self, key_after, prefix):
         if prefix in self._underlying:
-            del self._underlying[prefix]
+            yield prefix
 
+        # Carry on from the last key rather than the prefix
+        #   so that deletions made in a write batch (which we
+        #   cannot see yet) do not matter
+        key = prefix
         while True:
             try:
-                key = key_after(prefix)
+                key = key_after(key)
             except KeyError:
                 break
             if not key.startswith(prefix):
                 break
             else:
+                yield key
+
+    def prefix_items(self, prefix):
+        "Iterate over the keys in the store that start with `prefix` and their values"
+        item_after = treeutils.item_after_func(self._underlying)
+        if not item_after:
+            for key in self._inefficient_prefix_keys(prefix):
+                yield key, self._underlying[key]
+            return
+
+        key = prefix
+        while True:
+            try:
+                key, value = item_after(key)
+            except KeyError:
+                break
+            if not key.startswith(prefix):
+                break
+            yield key, value
+
+    def assign(self, item_prefix, value):
+        """Store `value` at `item_prefix`, writing and deleting only the keys
+        that differ from what is stored there. Returns whether there was
+        already a value."""
+        new = dict(flatten(item_prefix, value))
+        existed = False
+        deletes = []
+        unchanged = set()
+        for key, old_value in self.prefix_items(item_prefix):
+            existed = True
+            if flatpath.is_string_chunk_key(key):
+                # Chunks of a large string, which are rewritten with their
+                #   value key unless it is left as it is
+                if key[:key.rindex('(')] not in unchanged:
+                    deletes.append(key)
+            elif key not in new:
+                deletes.append(key)
+            elif _same_value(key, old_value, new[key]):
+                del new[key]
+                unchanged.add(key)
+
+        with treeutils.write_batch(self._underlying):
+            for key in deletes:
                 del self._underlying[key]
+            for key in sorted(new):
+                self._underlying[key] = new[key]
+        return existed
 
-    def _inefficient_purge_prefix(self, prefix):
+    def _inefficient_prefix_keys(self, prefix):
         for key in list(self._underlying):
             if key.startswith(prefix):
-                del self._underlying[key]
+                yield key
+
+    def copy_prefix(self, source, target, move=False):
+        """Copy every key starting with `source` to the same key starting with
+        `target` in one write batch, removing the original if `move` is set."""
+        with treeutils.write_batch(self._underlying):
+            for key in self.prefix_keys(source):
+                self._underlying[target + key[len(source):]] = self._underlying[key]
+                if move:
+                    del self._underlying[key]
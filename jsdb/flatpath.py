@@ -1,5 +1,11 @@
 # We might like to do this with some sort of parser
 
+import re
+
+# Keys starting with this are not part of the flattened structure
+#   (database headers and the like). They sort before all other keys.
+META_PREFIX = '!'
+
 def escape_double_quote(string):
     return string.replace('\\', '\\\\').replace('"', '\\"')
 
@@ -17,6 +23,74 @@ def unescape_double_quote(string):
             quoting = False
     return ''.join(chars)
 
+_COMPONENT = re.compile(r'\."((?:[^"\\]|\\.)*)"|\[(\d+)\]')
+_ESCAPE = re.compile(r'\\(.)')
+TERMINALS = ('', '.', '[', '=', '#')
+
+# Packed arrays (see `jsdb.packed`) store chunks of raw bytes under keys
+#   like ."samples"[(3) which sort with the list marker ."samples"[, and
+#   large strings (see `jsdb.largestring`) under keys like ."log"=(3)
+_CHUNK_TERMINAL = re.compile(r'[\[=]\((\d+)\)$')
+_CHUNK_KEY = re.compile(r'[\[=]\(\d+\)\Z')
+_STRING_CHUNK_KEY = re.compile(r'=\(\d+\)\Z')
+
+def is_chunk_key(key):
+    "Is `key` a chunk of a packed array or large string, whose value is raw bytes"
+    # Header keys (such as those of aggregates) may end in any byte
+    return (key.endswith(')') and not key.startswith(META_PREFIX)
+            and _CHUNK_KEY.search(key) is not None)
+
+def is_string_chunk_key(key):
+    "Is `key` a chunk of a large string"
+    return (key.endswith(')') and not key.startswith(META_PREFIX)
+            and _STRING_CHUNK_KEY.search(key) is not None)
+
+def chunk_key(prefix, number):
+    return '{}[({})'.format(prefix, number)
+
+def string_chunk_key(value_key, number):
+    return '{}({})'.format(value_key, number)
+
+def chunk_number(terminal):
+    "The chunk number of a terminal returned by `parse_key`, or None"
+    match = _CHUNK_TERMINAL.match(terminal)
+    return None if match is None else int(match.group(1))
+
+def parse_key(key):
+    """Split a flat key into its path and the type character at its end. e.g.
+
+    ."hello"[0]."world"= -> (('hello', 0, 'world'), '=')
+
+    This is much faster than walking up a key with `FlatPath.parent`.
+    """
+    components = []
+    position = 0
+    match = _COMPONENT.match(key, position)
+    while match is not None:
+        dict_key, index = match.groups()
+        if index is None:
+            components.append(_ESCAPE.sub(r'\1', dict_key) if '\\' in dict_key else dict_key)
+        else:
+            components.append(int(index))
+        position = match.end()
+        match = _COMPONENT.match(key, position)
+
+    terminal = key[position:]
+    if terminal not in TERMINALS and not _CHUNK_TERMINAL.match(terminal):
+        raise PathCorrupt(key)
+    return tuple(components), terminal
+
+def join_key(components, terminal=''):
+    "Inverse of `parse_key`"
+    parts = []
+    for component in components:
+        if isinstance(component, (int, long)):
+            parts.append('[{}]'.format(component))
+        else:
+            parts.append('."{}"'.format(escape_double_quote(component)))
+    parts.append(terminal)
+    return ''.join(parts)
+
 class FlatPathType(object):
     """
     Types of path:
@@ -75,6 +149,13 @@ class ValuePath(TypePath):
 
     """
 
+class ChunkPath(TypePath):
+    """A path that stores a chunk of a packed array
+
+    ."hello"[(0)
+
+    """
+
 class LengthPath(TypePath):
     """A path that tells us how long an iterable is
 
@@ -104,10 +185,10 @@ class PathCorrupt(Exception):
         self.path = path
 
     def __str__(self):
-        print 'Path is corrupt {!r}'.format(self.path)
+        return 'Path is corrupt {!r}'.format(self.path)
 
-DICT_PATH, LIST_PATH, VALUE_PATH, LENGTH_PATH, LIST_PREFIX_PATH, DICT_PREFIX_PATH = (
-    DictPath(), ListPath(), ValuePath(), LengthPath(), ListPrefixPath(), DictPrefixPath())
+DICT_PATH, LIST_PATH, VALUE_PATH, LENGTH_PATH, LIST_PREFIX_PATH, DICT_PREFIX_PATH, CHUNK_PATH = (
+    DictPath(), ListPath(), ValuePath(), LengthPath(), ListPrefixPath(), DictPrefixPath(), ChunkPath())
 
 class FlatPath(object):
     # Nope: I'm not fully parsing this
@@ -148,6 +229,8 @@ class FlatPath(object):
             return LIST_PREFIX_PATH
         elif self._prefix[-1] == '"':
             return DICT_PREFIX_PATH
+        elif self._prefix[-1] == ')':
+            return CHUNK_PATH
         else:
             raise PathCorrupt(self._prefix)
 
@@ -285,7 +368,9 @@ class FlatPath(object):
         return self._prefix
 
     def prefix(self):
-        if isinstance(self.path_type(), (ValuePath, TypePath)):
+        if isinstance(self.path_type(), ChunkPath):
+            return FlatPath(self._prefix[:self._prefix.rindex('(') - 1])
+        elif isinstance(self.path_type(), (ValuePath, TypePath)):
             return FlatPath(self._prefix[:-1])
         elif isinstance(self.path_type(), PrefixPath):
             return self
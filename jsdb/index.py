@@ -0,0 +1,89 @@
+"""Secondary indexes over the values at paths that match a pattern.
+
+An index named `users_by_email` over the pattern `users[*].email` (see
+`jsdb.pattern`) keeps an entry for each matching value under a side key
+
+    !index."users_by_email" <sortable value> ."users"[3]."email"=
+
+so finding the paths with a given value, or a range of values, is a
+range scan over these entries rather than a walk over the list.
+
+Entries are kept up to date by `jsdb.derived.DerivedDict`. Index
+definitions are stored under `DEFINITIONS_KEY`.
+"""
+
+import json
+
+from . import codec
+from . import flatpath
+from . import pattern as pattern_module
+from . import treeutils
+
+DEFINITIONS_KEY = '!indexes'
+ENTRY_PREFIX = '!index'
+
+# The byte after every entry of an index, and after every path
+_TOP = '\xff'
+
+def load_definitions(store):
+    definitions = json.loads(store.get(DEFINITIONS_KEY, '{}'))
+    return {name.encode('utf8'): IndexDefinition(name.encode('utf8'), text.encode('utf8'))
+            for name, text in definitions.items()}
+
+def save_definitions(store, definitions):
+    texts = {name: definition.pattern.text for name, definition in definitions.items()}
+    store[DEFINITIONS_KEY] = json.dumps(texts, sort_keys=True)
+
+
+class IndexDefinition(object):
+    "Maintain the entries of the index `name` of values matching `pattern`"
+    def __init__(self, name, pattern):
+        self.name = name
+        self.pattern = pattern_module.Pattern(pattern)
+        self.prefix = '{}."{}"'.format(ENTRY_PREFIX, flatpath.escape_double_quote(name))
+
+    def __repr__(self):
+        return '<IndexDefinition {!r} pattern={!r}>'.format(self.name, self.pattern.text)
+
+    def _entry_key(self, key, value):
+        return self.prefix + codec.encode_sortable(value) + key
+
+    def add(self, side, key, value):
+        side.put(self._entry_key(key, value), True)
+
+    def remove(self, side, key, value):
+        side.delete(self._entry_key(key, value))
+
+
+class Index(object):
+    "Query an index of `store`. Paths are tuples of keys and indexes"
+    def __init__(self, store, definition):
+        self._store = store
+        self.name = definition.name
+        self.pattern = definition.pattern
+        self._prefix = definition.prefix
+
+    def __repr__(self):
+        return '<Index {!r} pattern={!r}>'.format(self.name, self.pattern.text)
+
+    def lookup(self, value):
+        "Return the paths whose value is `value`, in path order"
+        prefix = self._prefix + codec.encode_sortable(value)
+        return [_key_path(key[len(prefix):])
+                for key in treeutils.keys_with_prefix(self._store, prefix)]
+
+    def range(self, start=None, stop=None):
+        """Iterate over `(value, path)` pairs in value order for values with
+        `start <= value < stop`. Either bound can be `None` to leave the range open."""
+        low = self._prefix if start is None else self._prefix + codec.encode_sortable(start)
+        high = self._prefix + _TOP if stop is None else self._prefix + codec.encode_sortable(stop)
+        for key in treeutils.keys_between(self._store, low, high):
+            value, end = codec.decode_sortable(key, len(self._prefix))
+            yield value, _key_path(key[end:])
+
+    def __iter__(self):
+        return self.range()
+
+def _key_path(key):
+    components, _ = flatpath.parse_key(key)
+    return components
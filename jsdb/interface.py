@@ -3,7 +3,11 @@ import abc
 
 # This is mostly just for documentation
 class JsdbStorageInterface(collections.MutableMapping):
-    "Interface to store string key value pairs to disk"
+    """Interface to store string key value pairs to disk
+
+    Stores may also provide `write_batch()`, returning a context manager
+    whose writes are applied together (see `jsdb.treeutils.write_batch`).
+    """
     __metaclass__ = abc.ABCMeta
 
     @abc.abstractmethod
@@ -18,3 +22,8 @@ class JsdbStorageInterface(collections.MutableMapping):
     def key_after(self, target_key):
         "Return the key strictly after `target_key`"
 
+    def item_after(self, target_key):
+        "Return the key strictly after `target_key` and its value"
+        key = self.key_after(target_key)
+        return key, self[key]
+
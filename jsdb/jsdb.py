@@ -2,12 +2,26 @@
 
 import bsddb
 import collections
-import json
+import contextlib
 import logging
-import types
+import threading
+import time
 
 from .rollback import RollbackDict
+from . import cache
+from . import codec as codec_module
+from . import compression
 from . import flatdict
+from . import flatpath
+from . import derived
+from . import keyformat
+from . import largestring
+from . import locking
+from . import nodedict
+from . import query as query_module
+from . import snapshot as snapshot_module
+from . import stats as stats_module
+from . import timeseries as timeseries_module
 from . import treeutils
 
 LOGGER = logging.getLogger('jsdb')
@@ -17,28 +31,164 @@ class Jsdb(collections.MutableMapping):
 
     `storage_class` can be `bsddb.btopen`, `jsdb.leveldict.LevelDict`, or another
     instance of `jsdb.interface.JsdbStorageInterface`.
+
+    If `cache_size` is given, up to this many decoded values (and missing keys)
+    are kept in memory so that repeated reads do not touch storage.
+
+    `codec` names how values are encoded (see `jsdb.codec.CODECS`). It is
+    recorded when the database is created; by default existing databases use
+    their recorded codec and new databases use json.
+
+    If `compression_threshold` is given, encoded values at least this long
+    are compressed with zlib from now on, using the dictionary trained with
+    `python -m jsdb train-dictionary` if there is one (see `jsdb.compression`).
+    This is recorded in the database.
+
+    `key_format` can be `jsdb.keyformat.BINARY` to store keys in a compact
+    binary format rather than as text. Like `codec` it is recorded when the
+    database is created.
+
+    `layout` can be `jsdb.nodedict.NODES` to store each dictionary and list
+    under a numeric id rather than under its full path (see `jsdb.nodedict`).
+    This is also recorded when the database is created.
+
+    Values at paths matching a pattern can be indexed with `create_index`
+    and looked up with `index` (see `jsdb.index`), and aggregated with
+    `create_aggregate` (see `jsdb.aggregate`). `query` finds the
+    values at paths matching a pattern (see `jsdb.query`), and `to_columns`
+    reads fields of a list of records into arrays (see `jsdb.columns`).
+
+    Strings longer than `large_string_threshold` bytes are stored in chunks,
+    compressed with zlib if `string_compression` is `'zlib'`. `open_string`
+    reads a string a chunk at a time and `append_string` extends one by
+    rewriting only its last chunk (see `jsdb.largestring`).
+
+    `timeseries` returns a named series of `(time, value)` samples stored
+    in packed chunks beside the json structure (see `jsdb.timeseries`).
+
+    If `stats` is true, operations are counted and timed from the start;
+    see `enable_stats` and `stats`. Operations slower than `slow_threshold`
+    seconds are logged; see `log_slow_operations`.
+
+    If `threadsafe` is true, the database can be shared between threads:
+    each thread has its own transaction, many threads can read at once,
+    and commits are made one at a time (see `jsdb.locking`). Time series,
+    statistics and the database's lifetime are shared by all threads.
     """
-    def __init__(self, filename, storage_class=bsddb.btopen):
+    def __init__(self, filename, storage_class=bsddb.btopen, cache_size=None, codec=None, key_format=None,
+                 layout=None, large_string_threshold=None, string_compression=None, compression_threshold=None,
+                 stats=False, slow_threshold=None, threadsafe=False):
+        if key_format == keyformat.BINARY and layout == nodedict.NODES:
+            raise ValueError('The binary key format only supports the paths layout')
+        if large_string_threshold is not None and layout == nodedict.NODES:
+            raise ValueError('Large strings are only supported by the paths layout')
+        if string_compression not in largestring.COMPRESSIONS:
+            raise ValueError(string_compression)
+
         self._filename = filename
-        self._db = None
+        self._root = None
+        self._shared_db = None
         self._data_file = None
+        self._versioned = None
+        self._cache = None
+        self._derived = None
+        self._data = None
+        self._timeseries = {}
         self._closed = False
         self._storage_class = storage_class
+        self._cache_size = cache_size
+        self._codec = codec
+        self._key_format = key_format
+        self._layout = layout
+        self._large_string_threshold = large_string_threshold
+        self._string_compression = string_compression
+        self._compression_threshold = compression_threshold
+        self._stats = stats_module.Stats(stats, slow_threshold)
+        self._lock = locking.ReadWriteLock() if threadsafe else None
+        self._thread_dbs = threading.local() if threadsafe else None
+
+    @property
+    def _db(self):
+        "The rollback layer holding this thread's transaction"
+        if self._thread_dbs is None or self._root is None:
+            return self._shared_db
+        if getattr(self._thread_dbs, 'root', None) is not self._root:
+            self._thread_dbs.root = self._root
+            self._thread_dbs.db = RollbackDict(self._root, stats=self._stats, operation=self._operation)
+        return self._thread_dbs.db
+
+    @contextlib.contextmanager
+    def _reading(self):
+        "Hold the lock for reading, if the database is shared between threads"
+        if self._lock is None:
+            yield
+        else:
+            with self._lock.read():
+                yield
+
+    @contextlib.contextmanager
+    def _writing(self):
+        "Hold the lock for writing, if the database is shared between threads"
+        if self._lock is None:
+            yield
+        else:
+            with self._lock.write():
+                yield
 
     def _open(self):
         if self._closed:
             raise DbClosedError()
 
-        if self._db is None:
-            self._data_file = self._storage_class(self._filename)
-            self._db = RollbackDict(flatdict.JsonFlatteningDict(JsonEncodeDict(self._data_file)))
+        if self._root is None:
+            with self._writing():
+                self._open_store()
+
+    def _open_store(self):
+        if self._root is not None:
+            # Opened by another thread
+            return
+
+        self._data_file = self._storage_class(self._filename)
+        data_file = self._data_file if self._lock is None else locking.thread_safe_storage(self._data_file)
+        if not hasattr(data_file, 'snapshot'):
+            data_file = snapshot_module.VersionedStore(data_file)
+        self._versioned = data_file
+        stats_store = stats_module.StatsStore(data_file, self._stats)
+        data = self._data = keyformat.key_format_dict(stats_store, self._key_format)
+        layout = nodedict.store_layout(data, self._layout)
+        if layout == nodedict.NODES and isinstance(data, keyformat.BinaryKeyDict):
+            raise ValueError('The binary key format only supports the paths layout')
+
+        if layout == nodedict.NODES and self._large_string_threshold is not None:
+            raise ValueError('Large strings are only supported by the paths layout')
+
+        codec = codec_module.store_codec(data, self._codec)
+        codec = compression.store_compression(data, codec, self._compression_threshold)
+        store = JsonEncodeDict(data, codec, self._large_string_threshold, self._string_compression, self._stats)
+        if self._cache_size:
+            store = self._cache = cache.LruCacheDict(store, self._cache_size)
+        if self._lock is not None:
+            store = locking.LockedStore(store, self._lock)
+
+        if layout == nodedict.NODES:
+            self._root = nodedict.NodeDict(store)
+        else:
+            store = self._derived = derived.DerivedDict(store)
+            self._root = flatdict.JsonFlatteningDict(store)
+        if self._lock is None:
+            self._shared_db = RollbackDict(self._root, stats=self._stats, operation=self._operation)
 
     def __getitem__(self, key):
         self._open()
+        if self._stats.enabled:
+            return self._operation('get', (key,), self._db.__getitem__, key)
         return self._db[key]
 
     def __setitem__(self, key, value):
         self._open()
+        if self._stats.enabled:
+            self._operation('set', (key,), self._db.__setitem__, key, value)
+            return
         self._db[key] = value
 
     def __len__(self):
@@ -49,15 +199,97 @@ class Jsdb(collections.MutableMapping):
         return iter(self._db)
 
     def __delitem__(self, key):
+        if self._stats.enabled:
+            self._operation('delete', (key,), self._db.__delitem__, key)
+            return
         del self._db[key]
 
+    def iteritems(self):
+        "Iterate over `(key, value)` pairs, reading each value in the same scan as its key"
+        self._open()
+        return self._db.iteritems()
+
+    def itervalues(self):
+        self._open()
+        return self._db.itervalues()
+
+    def items(self):
+        self._open()
+        if self._stats.enabled:
+            return self._operation('items', None, self._db.items)
+        return self._db.items()
+
+    def values(self):
+        self._open()
+        if self._stats.enabled:
+            return self._operation('values', None, self._db.values)
+        return self._db.values()
+
     def commit(self):
         self._open()
-        self._db.commit()
+        if self._stats.enabled:
+            self._timed_commit()
+            return
+        self._commit()
+
+    def _commit(self):
+        with self._writing():
+            self._db.commit()
+            for series in self._timeseries.values():
+                series.commit()
+
+    def _operation(self, name, path, function, *args):
+        """Time `function` as the operation `name` on `path` (None, a tuple of
+        keys and indexes or a function returning one), logging it if it is slow"""
+        threshold = self._stats.slow_threshold
+        if threshold is None:
+            return self._stats.timed(name, function, *args)
+
+        with self._stats.tracing() as calls:
+            start = time.time()
+            try:
+                return self._stats.timed(name, function, *args)
+            finally:
+                elapsed = time.time() - start
+                if elapsed >= threshold:
+                    self._log_slow(name, path() if callable(path) else path, elapsed, calls)
+
+    def _log_slow(self, name, path, elapsed, calls):
+        operation = name if path is None else '{} of {}'.format(name, _path_text(path))
+        counts = collections.Counter(call.operation for call in calls)
+        slowest = sorted(calls, key=lambda call: call.seconds, reverse=True)[:3]
+        LOGGER.warning('Slow %s took %.3fs with %d storage calls (%s) taking %.3fs, slowest: %s',
+                       operation, elapsed, len(calls),
+                       ', '.join('{} {}'.format(count, call_name) for call_name, count in sorted(counts.items())),
+                       sum(call.seconds for call in calls),
+                       ', '.join('{} {!r} {:.3f}s'.format(call.operation, self._text_key(call.key), call.seconds)
+                                 for call in slowest) or 'none')
+
+    def _text_key(self, key):
+        if isinstance(self._data, keyformat.BinaryKeyDict):
+            return keyformat.describe_key(key)
+        return key
+
+    def _timed_commit(self):
+        counts = self._stats.counts
+        writes = counts['store.put'] + counts['store.delete']
+        written = counts['store.bytes_written']
+        self._operation('commit', None, self._commit)
+        self._stats.record_size('commit.writes', counts['store.put'] + counts['store.delete'] - writes)
+        self._stats.record_size('commit.bytes', counts['store.bytes_written'] - written)
 
     def rollback(self):
         self._open()
-        self._db.rollback()
+        if self._stats.enabled:
+            self._operation('rollback', None, self._rollback)
+            return
+        self._rollback()
+
+    def _rollback(self):
+        with self._writing():
+            self._db.rollback()
+            for series in self._timeseries.values():
+                series.rollback()
 
     def __enter__(self):
         pass
@@ -68,38 +300,289 @@ class Jsdb(collections.MutableMapping):
             self.close()
 
     def close(self):
+        with self._writing():
+            self._close()
+
+    def _close(self):
         if self._data_file:
             self._data_file.close()
         self._data_file = None
-        self._db = None
+        self._versioned = None
+        self._root = None
+        self._shared_db = None
+        self._cache = None
+        self._derived = None
+        self._data = None
+        self._timeseries = {}
         self._closed = True
 
+    def move(self, source_path, target_path):
+        """Move the value at `source_path` to `target_path`, which must not exist.
+
+        Paths are sequences of keys and indexes (or a single top-level key),
+        and must both be entries of dictionaries. The value is moved by
+        rewriting its keys in storage rather than being copied through Python,
+        when the transaction is committed (see `jsdb.rollback.RollbackDict.move`).
+        """
+        self._open()
+        self._db.move(_path_tuple(source_path), _path_tuple(target_path))
+
+    def copy(self, source_path, target_path):
+        "Copy the value at `source_path` to `target_path`. See `move`"
+        self._open()
+        self._db.copy_path(_path_tuple(source_path), _path_tuple(target_path))
+
+    def create_index(self, name, pattern):
+        """Maintain an index called `name` of the values at paths matching
+        `pattern` (e.g. `users[*].email`). Existing values are indexed
+        immediately; later values are indexed when they are committed."""
+        with self._writing():
+            self._derived_store('Indexes').create_index(name, pattern)
+
+    def drop_index(self, name):
+        with self._writing():
+            self._derived_store('Indexes').drop_index(name)
+
+    def index(self, name):
+        """Return the index `name`, which supports `lookup(value)` and
+        `range(start, stop)`. See `jsdb.index.Index`"""
+        return self._derived_store('Indexes').index(name)
+
+    def create_aggregate(self, name, pattern, buckets=None):
+        """Maintain the count, sum, minimum and maximum of the numbers at
+        paths matching `pattern` (e.g. `requests[*].ms`), and optionally
+        counts for histogram `buckets` (ascending boundaries). Existing values
+        are included immediately; later values when they are committed."""
+        with self._writing():
+            self._derived_store('Aggregates').create_aggregate(name, pattern, buckets)
+
+    def drop_aggregate(self, name):
+        with self._writing():
+            self._derived_store('Aggregates').drop_aggregate(name)
+
+    def aggregate(self, name):
+        """Read the aggregate `name` as a `jsdb.aggregate.AggregateValues`.
+        This takes the same time however many values are aggregated"""
+        return self._derived_store('Aggregates').aggregate(name)
+
+    def _derived_store(self, feature):
+        self._require_paths_layout(feature)
+        return self._derived
+
+    def _require_paths_layout(self, feature):
+        self._open()
+        if self._derived is None:
+            raise ValueError('{} are only supported by the paths layout'.format(feature))
+
+    def query(self, pattern):
+        """Iterate over `(path, value)` for each value at a path matching
+        `pattern`, e.g. `logs[*].level == "error"` (see `jsdb.query`). There
+        must not be any uncommitted changes to the values it could match."""
+        self._require_paths_layout('Queries')
+        return self._db.query(query_module.Query(pattern))
+
+    def to_columns(self, list_path, fields, typecodes=None):
+        """Read `fields` from each record (dictionary) of the list at
+        `list_path` into a `jsdb.columns.Column` of packed values and a
+        mask of missing rows, in a single scan. `typecodes` maps fields to
+        `array` typecodes (by default `'d'`). There must not be any
+        uncommitted changes to the list."""
+        self._require_paths_layout('Columns')
+        return self._db.to_columns(_path_tuple(list_path), fields, typecodes)
+
+    def open_string(self, path):
+        """Return a read-only file-like `jsdb.largestring.StringReader` of the
+        utf8 bytes of the string at `path`, which reads large strings a chunk
+        at a time. There must not be any uncommitted changes to the string."""
+        self._require_paths_layout('String readers')
+        return self._db.open_string(_path_tuple(path))
+
+    def append_string(self, path, text):
+        """Append `text` to the string at `path`. Like `move` the append is
+        made in storage, only rewriting the last chunk of large strings, when
+        the transaction is committed."""
+        self._require_paths_layout('String appends')
+        self._db.append_string(_path_tuple(path), text)
+
+    def timeseries(self, name, chunk_size=None):
+        """Return the time series `name`, creating it if necessary with
+        `chunk_size` samples in each stored chunk. Like other changes, appends
+        are written by `commit` and discarded by `rollback`."""
+        self._open()
+        if name not in self._timeseries:
+            data = self._data if self._lock is None else locking.LockedStore(self._data, self._lock)
+            self._timeseries[name] = timeseries_module.TimeSeries(data, name, chunk_size)
+        elif chunk_size not in (None, self._timeseries[name].chunk_size):
+            raise ValueError('{!r} has chunk size {}'.format(name, self._timeseries[name].chunk_size))
+        return self._timeseries[name]
+
+    def cache_info(self):
+        "Hit and miss counts for the value cache (`None` without a cache)"
+        self._open()
+        if self._cache is None:
+            return None
+        return self._cache.cache_info()
+
+    def enable_stats(self, enabled=True):
+        "Start (or with `enabled` false, stop) counting and timing operations"
+        self._stats.collect(enabled)
+
+    def stats(self):
+        """Return the counters and latency histograms recorded since
+        statistics were enabled or reset, and the value cache's hit rate
+        (see `jsdb.stats`). Latencies are in seconds."""
+        self._open()
+        summary = self._stats.summary()
+        summary['enabled'] = self._stats.collecting
+        cache_info = self.cache_info()
+        if cache_info is not None:
+            lookups = cache_info.hits + cache_info.misses
+            summary['cache'] = dict(cache_info._asdict(), hit_rate=cache_info.hits / float(lookups) if lookups else None)
+        return summary
+
+    def reset_stats(self):
+        self._stats.reset()
+
+    def log_slow_operations(self, threshold):
+        """Log operations on the database that take at least `threshold`
+        seconds as warnings on the `jsdb` logger, along with the storage calls
+        they made. `None` stops logging."""
+        self._stats.log_slow(threshold)
+
+    def explain(self, access):
+        """Run `access`, a path (a sequence of keys and indexes, or a
+        single key) to look up or a function taking the database, and return
+        the storage calls it made as `jsdb.stats.StorageCall`s of the
+        operation, flat key and seconds taken, in order."""
+        self._open()
+        with self._stats.tracing() as calls:
+            if callable(access):
+                access(self)
+            else:
+                value = self
+                for component in _path_tuple(access):
+                    value = value[component]
+        return [call._replace(key=self._text_key(call.key)) for call in calls]
+
+    def snapshot(self):
+        """Return a read-only `jsdb.snapshot.Snapshot` of what has been
+        committed, which is not affected by later commits. It supports the
+        reads of the database, including `query`, `to_columns` and
+        `open_string`, and should be closed when it is finished with."""
+        self._open()
+        with self._reading():
+            store = self._versioned.snapshot()
+        if self._lock is not None:
+            store = locking.LockedStore(store, self._lock)
+
+        data = keyformat.key_format_dict(store)
+        codec = compression.store_compression(data, codec_module.store_codec(data))
+        values = JsonEncodeDict(data, codec)
+        if nodedict.store_layout(data) == nodedict.NODES:
+            root = nodedict.NodeDict(values)
+        else:
+            root = flatdict.JsonFlatteningDict(values)
+        return snapshot_module.Snapshot(root, store)
+
     def python_copy(self):
         """Return a copy of the entire structure without backed proxies"""
         return self._db.python_copy()
 
+def _path_tuple(path):
+    if isinstance(path, basestring):
+        return (path,)
+    else:
+        return tuple(path)
+
+def _path_text(path):
+    "`path` as the subscripts that read it, e.g. ['users']['alice']"
+    return ''.join('[{!r}]'.format(component) for component in path)
+
 class DbClosedError(Exception):
     """Database is closed"""
 
 class JsonEncodeDict(collections.MutableMapping):
-    "Convert basic json data types to and from strings. To deal with a dictioanry that only accepts string values"
-    def __init__(self, underlying):
+    """Convert basic json data types to and from strings. To deal with a dictioanry that only accepts string values
+
+    Strings longer than `large_string_threshold` utf8 bytes are stored in chunks
+    (see `jsdb.largestring`), optionally compressed with `string_compression`.
+    """
+    def __init__(self, underlying, codec=codec_module.CODECS['json'], large_string_threshold=None,
+                 string_compression=None, stats=None):
+        if string_compression not in largestring.COMPRESSIONS:
+            raise ValueError(string_compression)
         self._underlying = underlying
+        self._codec = codec
+        self._large_string_threshold = large_string_threshold
+        self._string_compression = string_compression
+        self._stats = stats or stats_module.Stats()
 
     def __getitem__(self, key):
-        return self._decode(self._underlying[key])
+        return self._decode_stored(key, self._underlying[key])
+
+    def read_cacheable(self, key):
+        "The value at `key`, and whether it is worth caching (large strings are not)"
+        stored = self._underlying[key]
+        return self._decode_stored(key, stored), not largestring.is_large(stored)
+
+    def _decode_stored(self, key, stored):
+        if flatpath.is_chunk_key(key):
+            return stored
+        if largestring.is_large(stored):
+            return largestring.read(self._underlying, key, stored)
+        return self._decode(stored)
 
     def __setitem__(self, key, value):
+        if flatpath.is_chunk_key(key):
+            # Packed array and string chunks are already bytes
+            self._underlying[key] = value
+            return
+        if self._is_large_string(key, value):
+            data = value.encode('utf8') if isinstance(value, unicode) else value
+            if len(data) > self._large_string_threshold:
+                data.decode('utf8')
+                largestring.write(self._underlying, key, data, self._string_compression)
+                return
         encoded_value = self._encode(value)
         self._underlying[key] = encoded_value
 
+    def _is_large_string(self, key, value):
+        # The utf8 encoding is at least as long as the string
+        return (self._large_string_threshold is not None and isinstance(value, basestring)
+                and len(value) > self._large_string_threshold and key.endswith('='))
+
+    def open_string(self, key):
+        "A `jsdb.largestring.StringReader` of the string at `key`"
+        stored = self._underlying[key]
+        if largestring.is_large(stored):
+            return largestring.reader(self._underlying, key, stored)
+        return largestring.inline_reader(self._decode(stored))
+
+    def append_string(self, key, text):
+        "Append `text` to the string at `key`, only rewriting the last chunk of large strings"
+        stored = self._underlying[key]
+        if largestring.is_large(stored):
+            largestring.append(self._underlying, key, stored, largestring.utf8(text))
+        else:
+            self[key] = largestring.join(self._decode(stored), text)
+
+    def truncate_string(self, key, length):
+        "Shorten the string at `key` to `length` utf8 bytes"
+        stored = self._underlying[key]
+        if largestring.is_large(stored):
+            largestring.truncate(self._underlying, key, stored, length)
+        else:
+            self[key] = largestring.utf8(self._decode(stored))[:length].decode('utf8')
+
     def _decode(self, string):
-        return json.loads(string)
+        if self._stats.enabled:
+            return self._stats.timed('decode', self._codec.decode, string)
+        return self._codec.decode(string)
 
     def _encode(self, value):
-        if not isinstance(value, (int, float, str, bool, types.NoneType, unicode)):
-            raise ValueError(value)
-        return json.dumps(value)
+        if self._stats.enabled:
+            return self._stats.timed('encode', self._codec.encode, value)
+        return self._codec.encode(value)
 
     def __len__(self):
         return len(self._underlying)
@@ -113,3 +596,19 @@ class JsonEncodeDict(collections.MutableMapping):
     def key_after_func(self):
         func = treeutils.key_after_func(self._underlying)
         return func
+
+    def item_after_func(self):
+        item_after = treeutils.item_after_func(self._underlying)
+        if item_after is None:
+            return None
+
+        def decoded_item_after(key):
+            found_key, stored = item_after(key)
+            if found_key.startswith(flatpath.META_PREFIX):
+                # Headers (which sort last with binary keys) are not necessarily encoded
+                return found_key, stored
+            return found_key, self._decode_stored(found_key, stored)
+        return decoded_item_after
+
+    def write_batch(self):
+        return treeutils.write_batch(self._underlying)
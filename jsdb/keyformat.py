@@ -0,0 +1,212 @@
+"""A compact binary format for flat keys.
+
+Text keys quote every ancestor's name (e.g. `."metrics"."values"[14]."time"=`).
+The binary format instead writes each component as a one-byte type marker
+followed by a length-prefixed name or a packed index:
+
+    ."a"[14]=  ->  DICT \\x01 a  LIST \\x01 \\x0e  VALUE
+
+Lengths and indexes are written as a byte count followed by big-endian
+bytes, so the byte after a marker is never more than 8. This keeps every
+descendant of a key contiguous and after it, and `key + '\\xff'` after all of
+them: the ordering properties that the flattening layer relies on for
+`key_after`. List indexes sort numerically.
+
+`BinaryKeyDict` translates between the two formats so that the layers above
+only ever see text keys. The format of a database is recorded under
+`HEADER_KEY`.
+"""
+
+import collections
+import struct
+
+from . import flatpath
+from . import treeutils
+
+HEADER_KEY = '!keyformat'
+TEXT, BINARY = 'text', 'binary-1'
+FORMATS = (TEXT, BINARY)
+
+LENGTH, DICT, VALUE, LIST = '\x02', '\x03', '\x04', '\x05'
+# Follows LIST in packed array chunk keys and VALUE in large string chunk
+#   keys. Larger than any byte count so that chunks sort after a list's entries
+CHUNK = '\x09'
+TOP = '\xff'
+
+_TERMINAL_MARKERS = {'#': LENGTH, '.': DICT, '=': VALUE, '[': LIST, '': ''}
+_MARKER_TERMINALS = {LENGTH: '#', DICT: '.', VALUE: '=', LIST: '['}
+_COUNTS = [chr(i) for i in range(9)]
+
+class KeyFormatMismatch(Exception):
+    "The database uses a different key format"
+    def __init__(self, stored, requested):
+        Exception.__init__(self)
+        self.stored = stored
+        self.requested = requested
+
+    def __str__(self):
+        return 'Database uses key format {!r}, not {!r}'.format(self.stored, self.requested)
+
+def encode_int(number):
+    "Encode a non-negative integer so that byte order matches numeric order"
+    if number < 0:
+        raise ValueError(number)
+    packed = struct.pack('>Q', number).lstrip('\x00')
+    return _COUNTS[len(packed)] + packed
+
+def decode_int(string, position):
+    "Decode the integer encoded by `encode_int` at `position`, returning it and where it ends"
+    count = ord(string[position])
+    end = position + 1 + count
+    packed = string[position + 1:end]
+    return struct.unpack('>Q', '\x00' * (8 - count) + packed)[0], end
+
+def encode_key(text_key):
+    "Convert a text flat key to binary"
+    if text_key.startswith(flatpath.META_PREFIX):
+        return text_key
+
+    top = text_key.endswith(TOP)
+    if top:
+        text_key = text_key[:-1]
+
+    components, terminal = flatpath.parse_key(text_key)
+    parts = []
+    for component in components:
+        if isinstance(component, str):
+            parts.append(DICT)
+            parts.append(encode_int(len(component)))
+            parts.append(component)
+        else:
+            parts.append(LIST)
+            parts.append(encode_int(component))
+
+    chunk = flatpath.chunk_number(terminal)
+    if chunk is None:
+        parts.append(_TERMINAL_MARKERS[terminal])
+    else:
+        parts.append(_TERMINAL_MARKERS[terminal[0]] + CHUNK + encode_int(chunk))
+    if top:
+        parts.append(TOP)
+    return ''.join(parts)
+
+def decode_key(binary_key):
+    "Convert a binary flat key to text"
+    if binary_key.startswith(flatpath.META_PREFIX):
+        return binary_key
+
+    parts = []
+    position = 0
+    length = len(binary_key)
+    while position < length:
+        marker = binary_key[position]
+        if position + 1 == length:
+            parts.append(_MARKER_TERMINALS[marker])
+            break
+        elif marker == DICT:
+            name_length, start = decode_int(binary_key, position + 1)
+            position = start + name_length
+            parts.append('."{}"'.format(flatpath.escape_double_quote(binary_key[start:position])))
+        elif marker in (LIST, VALUE) and binary_key[position + 1] == CHUNK:
+            chunk, position = decode_int(binary_key, position + 2)
+            parts.append(flatpath.string_chunk_key(_MARKER_TERMINALS[marker], chunk))
+        elif marker == LIST:
+            index, position = decode_int(binary_key, position + 1)
+            parts.append('[{}]'.format(index))
+        else:
+            raise flatpath.PathCorrupt(binary_key)
+    return ''.join(parts)
+
+def describe_key(binary_key):
+    "Convert a binary flat key, or a key used to seek past a prefix, to text"
+    if binary_key.endswith(TOP):
+        return decode_key(binary_key[:-1]) + TOP
+    return decode_key(binary_key)
+
+
+class BinaryKeyDict(collections.MutableMapping):
+    "Store text flat keys in `underlying` in the binary format"
+    def __init__(self, underlying):
+        self._underlying = underlying
+
+    def __repr__(self):
+        return '<BinaryKeyDict underlying={!r}>'.format(self._underlying)
+
+    def __getitem__(self, key):
+        return self._underlying[encode_key(key)]
+
+    def __setitem__(self, key, value):
+        self._underlying[encode_key(key)] = value
+
+    def __delitem__(self, key):
+        del self._underlying[encode_key(key)]
+
+    def __contains__(self, key):
+        return encode_key(key) in self._underlying
+
+    def __iter__(self):
+        for key in self._underlying:
+            yield decode_key(key)
+
+    def __len__(self):
+        return len(self._underlying)
+
+    def key_after_func(self):
+        key_after = treeutils.key_after_func(self._underlying)
+        if key_after is None:
+            return None
+
+        def binary_key_after(key):
+            return decode_key(key_after(encode_key(key)))
+        return binary_key_after
+
+    def item_after_func(self):
+        item_after = treeutils.item_after_func(self._underlying)
+        if item_after is None:
+            return None
+
+        def binary_item_after(key):
+            found_key, value = item_after(encode_key(key))
+            return decode_key(found_key), value
+        return binary_item_after
+
+    def write_batch(self):
+        return treeutils.write_batch(self._underlying)
+
+
+def store_key_format(store, name=None):
+    "Return the key format used by `store`, recording `name` for new stores"
+    if name is not None and name not in FORMATS:
+        raise ValueError(name)
+
+    stored_name = treeutils.store_header(store, HEADER_KEY, name, TEXT)
+    if name is not None and name != stored_name:
+        raise KeyFormatMismatch(stored_name, name)
+    return stored_name
+
+def key_format_dict(store, name=None):
+    "Wrap `store` so that it is accessed with text keys whatever its format"
+    if store_key_format(store, name) == BINARY:
+        return BinaryKeyDict(store)
+    else:
+        return store
+
+def convert(source, destination, name):
+    """Copy every key in `source` to the empty store `destination`,
+    converting keys to the format `name`"""
+    if not treeutils.is_empty(destination):
+        raise ValueError('Destination is not empty')
+
+    source_format = store_key_format(source)
+    store_key_format(destination, name)
+
+    for key in source:
+        if key == HEADER_KEY:
+            continue
+
+        value = source[key]
+        if source_format == BINARY:
+            key = decode_key(key)
+        if name == BINARY:
+            key = encode_key(key)
+        destination[key] = value
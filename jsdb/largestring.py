@@ -0,0 +1,212 @@
+"""Strings too large to store as a single value.
+
+`JsonEncodeDict` can be given a threshold above which strings are stored in
+chunks of `CHUNK_BYTES` of their utf8 encoding, under the value's key. The
+value key then holds a header rather than an encoded value:
+
+    ."log"=       \\x7f{"chunk_size": 65536, "chunks": 3, "compression": null, "length": 150000}
+    ."log"=(0)    bytes 0 to 65535
+    ."log"=(1)    bytes 65536 to 131071
+
+Codecs never produce values starting with `MARKER`. Ordinary reads still
+return the whole string, but `StringReader` reads it a chunk at a time,
+and `append` only rewrites the last chunk. Chunks may be compressed with
+zlib.
+"""
+
+import json
+import zlib
+
+from . import flatpath
+from . import treeutils
+
+MARKER = '\x7f'
+CHUNK_BYTES = 1 << 16
+COMPRESSIONS = (None, 'zlib')
+
+def is_large(stored):
+    "Is the stored value `stored` the header of a chunked string"
+    return stored[:1] == MARKER
+
+def _header(stored):
+    return json.loads(stored[1:])
+
+def _encode_header(header):
+    return MARKER + json.dumps(header, sort_keys=True)
+
+def _chunk_count(length, chunk_size):
+    return (length + chunk_size - 1) // chunk_size
+
+def _pack(header, data):
+    if header['compression'] == 'zlib':
+        return zlib.compress(data)
+    return data
+
+def _unpack(header, stored):
+    if header['compression'] == 'zlib':
+        return zlib.decompress(stored)
+    return stored
+
+def write(store, key, data, compression=None, chunk_size=CHUNK_BYTES):
+    "Store the utf8 bytes `data` in chunks at the value key `key` of the raw store `store`"
+    if compression not in COMPRESSIONS:
+        raise ValueError(compression)
+    old = store.get(key)
+    old_count = _header(old)['chunks'] if old is not None and is_large(old) else 0
+
+    header = dict(chunk_size=chunk_size, compression=compression, length=0, chunks=0)
+    with treeutils.write_batch(store):
+        _write_from(store, key, header, 0, data)
+        for number in range(header['chunks'], old_count):
+            # These may already have been deleted (see `FlatteningStore.assign`)
+            store.pop(flatpath.string_chunk_key(key, number), None)
+
+def _write_from(store, key, header, first, data):
+    "Replace chunk `first` onwards with `data` and write the header"
+    chunk_size = header['chunk_size']
+    for offset in range(0, len(data), chunk_size):
+        store[flatpath.string_chunk_key(key, first + offset // chunk_size)] = _pack(
+            header, data[offset:offset + chunk_size])
+    header['length'] = first * chunk_size + len(data)
+    header['chunks'] = _chunk_count(header['length'], chunk_size)
+    store[key] = _encode_header(header)
+
+def read(store, key, stored):
+    "The whole string whose header `stored` is at `key`"
+    return reader(store, key, stored).getvalue().decode('utf8')
+
+def reader(store, key, stored):
+    "A `StringReader` of the chunked string whose header `stored` is at `key`"
+    header = _header(stored)
+    def read_chunk(number):
+        return _unpack(header, store[flatpath.string_chunk_key(key, number)])
+    return StringReader(header['length'], header['chunk_size'], read_chunk)
+
+def inline_reader(value):
+    "A `StringReader` of a string held in memory"
+    if not isinstance(value, basestring):
+        raise ValueError(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf8')
+    return StringReader(len(value), max(len(value), 1), lambda _number: value)
+
+def append(store, key, stored, data):
+    "Append the bytes `data` to the chunked string at `key`, rewriting only its last chunk"
+    header = _header(stored)
+    first, filled = divmod(header['length'], header['chunk_size'])
+    if filled:
+        data = _unpack(header, store[flatpath.string_chunk_key(key, first)]) + data
+    with treeutils.write_batch(store):
+        _write_from(store, key, header, first, data)
+
+def truncate(store, key, stored, length):
+    "Shorten the chunked string at `key` to `length` bytes"
+    header = _header(stored)
+    old_count = header['chunks']
+    first, filled = divmod(length, header['chunk_size'])
+    data = ''
+    if filled:
+        data = _unpack(header, store[flatpath.string_chunk_key(key, first)])[:filled]
+    with treeutils.write_batch(store):
+        _write_from(store, key, header, first, data)
+        for number in range(header['chunks'], old_count):
+            del store[flatpath.string_chunk_key(key, number)]
+
+def open_string(store, key):
+    "A `StringReader` of the string at the value key `key` of any layer"
+    if hasattr(store, 'open_string'):
+        return store.open_string(key)
+    return inline_reader(store[key])
+
+def append_string(store, key, text):
+    "Append `text` to the string at the value key `key` of any layer"
+    if hasattr(store, 'append_string'):
+        store.append_string(key, text)
+    else:
+        store[key] = join(store[key], text)
+
+def truncate_string(store, key, length):
+    "Shorten the string at the value key `key` of any layer to `length` utf8 bytes"
+    if hasattr(store, 'truncate_string'):
+        store.truncate_string(key, length)
+    else:
+        store[key] = utf8(store[key])[:length].decode('utf8')
+
+def utf8(value):
+    "The utf8 bytes of the string `value`"
+    if not isinstance(value, basestring):
+        raise ValueError(value)
+    if isinstance(value, unicode):
+        return value.encode('utf8')
+    return value
+
+def join(value, text):
+    "Concatenate two strings given as unicode or utf8 bytes"
+    return (utf8(value) + utf8(text)).decode('utf8')
+
+
+class StringReader(object):
+    """A read-only file-like object over the utf8 bytes of a string, which
+    reads the chunks that hold them when they are needed"""
+    def __init__(self, length, chunk_size, read_chunk):
+        self._length = length
+        self._chunk_size = chunk_size
+        self._read_chunk = read_chunk
+        self._position = 0
+        self._cached = None, None
+
+    def __repr__(self):
+        return '<StringReader length={!r}>'.format(self._length)
+
+    def __len__(self):
+        return self._length
+
+    def _chunk(self, number):
+        if self._cached[0] != number:
+            self._cached = number, memoryview(self._read_chunk(number))
+        return self._cached[1]
+
+    def chunks(self, start=0, stop=None):
+        "Iterate over memoryviews of the bytes from `start` to `stop`, a chunk at a time"
+        stop = self._length if stop is None else min(stop, self._length)
+        if start >= stop:
+            return
+        for number in range(start // self._chunk_size, (stop - 1) // self._chunk_size + 1):
+            chunk_start = number * self._chunk_size
+            yield self._chunk(number)[max(start - chunk_start, 0):stop - chunk_start]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                return self.getvalue()[index]
+            start, stop, _ = index.indices(self._length)
+            return ''.join(view.tobytes() for view in self.chunks(start, stop))
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return self[index:index + 1]
+
+    def read(self, size=-1):
+        stop = self._length if size < 0 else self._position + size
+        data = self[self._position:stop]
+        self._position += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self._length
+        self._position = max(offset, 0)
+
+    def tell(self):
+        return self._position
+
+    def getvalue(self):
+        "All of the bytes"
+        return self[:]
+
+    def __iter__(self):
+        for view in self.chunks():
+            yield view.tobytes()
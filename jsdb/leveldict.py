@@ -1,21 +1,93 @@
-"Leveldb dictionary interface, like bsddb"
+"""Leveldb dictionary interface, like bsddb
 
-import plyvel
+LevelDB's options are chosen with a tuning profile from `PROFILES`, and
+individual `plyvel.DB` options override them:
+
+    Jsdb(filename, storage_class=level_storage('read_heavy', lru_cache_size=256 << 20))
+
+A deleted key leaves a tombstone that every iterator seek over its range
+must skip until a compaction removes it, which makes `key_after` slow after
+a large subtree is purged. `LevelDict` keeps the range of keys deleted
+since the last compaction within each top-level value (see
+`deletion_bucket`), and compacts a range once it holds
+`compaction_threshold` deletions and no write batch is open. Subtrees are
+stored contiguously, so after a purge this range is the purged subtree,
+and deletions elsewhere in the database do not widen it.
+"""
+
+import contextlib
 import logging
+import re
+
+import plyvel
 
 LOGGER = logging.getLogger('jsdb.leveldict')
 
 from . import interface
+from . import keyformat
+from . import snapshot as snapshot_module
+
+MB = 1 << 20
+
+# Options for plyvel.DB. LevelDB's defaults are an 8MB block cache, a 4MB
+#   write buffer, 4KB blocks, snappy compression and no bloom filter.
+PROFILES = dict(
+    default=dict(),
+    # Bloom filters save reading a block for keys that are missing
+    read_heavy=dict(lru_cache_size=64 * MB, bloom_filter_bits=10, block_size=4096),
+    # Larger memtables and files mean fewer, larger compactions
+    write_heavy=dict(write_buffer_size=64 * MB, max_file_size=8 * MB, bloom_filter_bits=10),
+    low_memory=dict(lru_cache_size=1 * MB, write_buffer_size=1 * MB, max_open_files=64))
+
+COMPACTION_THRESHOLD = 10000
+
+_TEXT_COMPONENT = re.compile(r'\."(?:[^"\\]|\\.)*"|\[\d+\]')
+
+def profile_options(profile=None, **options):
+    "The options for plyvel.DB of the profile named `profile`, updated with `options`"
+    if profile is None:
+        profile = 'default'
+    if profile not in PROFILES:
+        raise ValueError('Unknown profile {!r}, expected one of {}'.format(profile, ', '.join(sorted(PROFILES))))
+    result = dict(PROFILES[profile])
+    result.update(options)
+    return result
+
+def deletion_bucket(key):
+    """The start of the stored `key` that names the top-level value (or with
+    the nodes layout, the node) it belongs to, or '' for other keys"""
+    if key.startswith(keyformat.DICT) and len(key) > 1:
+        name_length, start = keyformat.decode_int(key, 1)
+        return key[:start + name_length]
+    elif key.startswith('@'):
+        return key[:key.find(':') + 1]
+    match = _TEXT_COMPONENT.match(key)
+    return key[:match.end()] if match else ''
+
+def level_storage(profile=None, compaction_threshold=COMPACTION_THRESHOLD, **options):
+    "A `storage_class` for `Jsdb` that opens a `LevelDict` with these settings"
+    return lambda filename: LevelDict(filename, profile, compaction_threshold, **options)
+
 
 class LevelDict(interface.JsdbStorageInterface):
-    def __init__(self, filename):
+    """`profile` names a tuning profile in `PROFILES` and `options` are further
+    options for `plyvel.DB`. `compaction_threshold` is the number of
+    deletions in one bucket (see `deletion_bucket`) after which their range
+    is compacted, or None to never compact."""
+    def __init__(self, filename, profile=None, compaction_threshold=COMPACTION_THRESHOLD, **options):
         interface.JsdbStorageInterface.__init__(self, filename)
         LOGGER.debug('Opening leveldb file %r', filename)
         self._filename = filename
-        self._db = plyvel.DB(filename, create_if_missing=True)
+        self._db = plyvel.DB(filename, create_if_missing=True, **profile_options(profile, **options))
+        self._writer = self._db
+        self._compaction_threshold = compaction_threshold
+        # Deletion bucket -> [first key, last key, deletions]
+        self._deleted = {}
+        # The buckets to compact once their deletions are written
+        self._due = set()
 
     def __setitem__(self, key, value):
-        self._db.put(key, value)
+        self._writer.put(key, value)
 
     def __iter__(self):
         for key, _value in self._db.iterator():
@@ -36,7 +108,37 @@ class LevelDict(interface.JsdbStorageInterface):
 
     def __delitem__(self, key):
         self.__getitem__(key)
-        self._db.delete(key) # delete does not raise on error
+        self._writer.delete(key) # delete does not raise on error
+        self._track_deletion(key)
+
+    def _track_deletion(self, key):
+        if self._compaction_threshold is None:
+            return
+        bucket = deletion_bucket(key)
+        deleted = self._deleted.get(bucket)
+        if deleted is None:
+            deleted = self._deleted[bucket] = [key, key, 0]
+        else:
+            deleted[0] = min(deleted[0], key)
+            deleted[1] = max(deleted[1], key)
+        deleted[2] += 1
+        if deleted[2] >= self._compaction_threshold:
+            self._due.add(bucket)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        "Compact the ranges of deleted keys with enough deletions once they have been written"
+        if not self._due or self._writer is not self._db:
+            return
+        for bucket in sorted(self._due):
+            start, stop, deletions = self._deleted.pop(bucket)
+            LOGGER.debug('Compacting %r to %r after %d deletions', start, stop, deletions)
+            self.compact_range(start, stop)
+        self._due.clear()
+
+    def compact_range(self, start=None, stop=None):
+        "Compact the keys from `start` to `stop` inclusive, or all keys"
+        self._db.compact_range(start=start, stop=stop)
 
     def close(self):
         LOGGER.debug('Closing level db database: %r', self._filename)
@@ -50,3 +152,75 @@ class LevelDict(interface.JsdbStorageInterface):
                 return key
         else:
             raise KeyError(target_key)
+
+    def item_after(self, target_key):
+        for key, value in self._db.iterator(start=target_key):
+            if key == target_key:
+                continue
+            else:
+                return key, value
+        else:
+            raise KeyError(target_key)
+
+    def snapshot(self):
+        "A read-only `LevelSnapshot` of the database as it is now (see `jsdb.snapshot`)"
+        return LevelSnapshot(self._db.snapshot())
+
+    @contextlib.contextmanager
+    def write_batch(self):
+        """Apply the writes made in this context in one leveldb write batch
+        when it exits. Nothing is written if it exits with an exception."""
+        if self._writer is not self._db:
+            # Already batching
+            yield
+            return
+
+        self._writer = self._db.write_batch()
+        try:
+            yield
+        except:
+            self._writer = self._db
+            raise
+        else:
+            batch, self._writer = self._writer, self._db
+            batch.write()
+            self._maybe_compact()
+
+
+class LevelSnapshot(interface.JsdbStorageInterface):
+    "A read-only store reading the leveldb snapshot `snapshot`"
+    def __init__(self, snapshot): # pylint: disable=super-init-not-called
+        self._snapshot = snapshot
+
+    def __getitem__(self, key):
+        result = self._snapshot.get(key)
+        if result is None:
+            raise KeyError(key)
+        return result
+
+    def __setitem__(self, key, value):
+        raise snapshot_module.SnapshotReadOnly()
+
+    def __delitem__(self, key):
+        raise snapshot_module.SnapshotReadOnly()
+
+    def __iter__(self):
+        for key, _value in self._snapshot.iterator():
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self._snapshot.iterator())
+
+    def key_after(self, target_key):
+        return self.item_after(target_key)[0]
+
+    def item_after(self, target_key):
+        for key, value in self._snapshot.iterator(start=target_key):
+            if key != target_key:
+                return key, value
+        raise KeyError(target_key)
+
+    def close(self):
+        if hasattr(self._snapshot, 'close'):
+            # Older versions of plyvel release snapshots when they are garbage collected
+            self._snapshot.close()
@@ -0,0 +1,224 @@
+"""Sharing a database between threads.
+
+`Jsdb(filename, threadsafe=True)` gives each thread its own transaction,
+so changes made by one thread are only seen by others once it commits.
+Every operation on the store below the rollback layer holds a
+`ReadWriteLock`: reads share the lock, so many threads can read at once,
+while commits and other writes hold it alone. A commit is therefore
+applied all at once as far as readers are concerned, though a read made up
+of several store operations (such as iterating over a dictionary) may see
+a commit made part way through it.
+
+The bsddb backend finds the key after another by moving a single cursor
+that belongs to the database, so threads reading in parallel open a cursor
+for each lookup instead (see `ThreadCursorStore`).
+"""
+
+import bsddb
+import collections
+import contextlib
+import threading
+
+from . import largestring
+from . import treeutils
+
+class ReadWriteLock(object):
+    """A lock that may be held by many readers or one writer. Writers
+    waiting for the lock are served before new readers, so that a stream
+    of reads cannot hold up a commit indefinitely. Both are reentrant, and
+    the writer may also read."""
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def _thread_reads(self):
+        return getattr(self._local, 'reads', 0)
+
+    @contextlib.contextmanager
+    def read(self):
+        if self._writer == threading.current_thread():
+            # Holding the write lock
+            yield
+            return
+
+        with self._condition:
+            # A thread that is already reading must not wait for writers that wait for it
+            if not self._thread_reads():
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers += 1
+            self._local.reads = self._thread_reads() + 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._local.reads -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        current = threading.current_thread()
+        with self._condition:
+            if self._writer != current:
+                if self._thread_reads():
+                    raise RuntimeError('Cannot write while reading')
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._condition.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = current
+            self._writes += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writes -= 1
+                if not self._writes:
+                    self._writer = None
+                    self._condition.notify_all()
+
+
+class LockedStore(collections.MutableMapping):
+    "Make each operation on the store `underlying` hold `lock` (a `ReadWriteLock`)"
+    def __init__(self, underlying, lock):
+        self._underlying = underlying
+        self._lock = lock
+
+    def __repr__(self):
+        return '<LockedStore underlying={!r}>'.format(self._underlying)
+
+    def __getitem__(self, key):
+        with self._lock.read():
+            return self._underlying[key]
+
+    def __contains__(self, key):
+        with self._lock.read():
+            return key in self._underlying
+
+    def __setitem__(self, key, value):
+        with self._lock.write():
+            self._underlying[key] = value
+
+    def __delitem__(self, key):
+        with self._lock.write():
+            del self._underlying[key]
+
+    def __len__(self):
+        with self._lock.read():
+            return len(self._underlying)
+
+    def __iter__(self):
+        # Holding the lock between the keys yielded would leave it held by
+        #   iterators that are never finished
+        key_after = self.key_after_func()
+        if key_after is None:
+            with self._lock.read():
+                keys = list(self._underlying)
+            for key in keys:
+                yield key
+            return
+
+        key = ''
+        while True:
+            try:
+                key = key_after(key)
+            except KeyError:
+                return
+            yield key
+
+    def key_after_func(self):
+        return self._locked(treeutils.key_after_func(self._underlying))
+
+    def item_after_func(self):
+        return self._locked(treeutils.item_after_func(self._underlying))
+
+    def _locked(self, function):
+        if function is None:
+            return None
+
+        def locked_function(key):
+            with self._lock.read():
+                return function(key)
+        return locked_function
+
+    @contextlib.contextmanager
+    def write_batch(self):
+        with self._lock.write():
+            with treeutils.write_batch(self._underlying):
+                yield
+
+    def open_string(self, key):
+        # The reader reads later chunks without the lock
+        with self._lock.read():
+            return largestring.open_string(self._underlying, key)
+
+    def append_string(self, key, text):
+        with self._lock.write():
+            largestring.append_string(self._underlying, key, text)
+
+    def truncate_string(self, key, length):
+        with self._lock.write():
+            largestring.truncate_string(self._underlying, key, length)
+
+    def close(self):
+        self._underlying.close()
+
+
+class ThreadCursorStore(collections.MutableMapping):
+    """Find keys in the bsddb database `underlying` with a new cursor for
+    each lookup rather than the cursor it shares between callers"""
+    def __init__(self, underlying):
+        self._underlying = underlying
+
+    def __repr__(self):
+        return '<ThreadCursorStore underlying={!r}>'.format(self._underlying)
+
+    def __getitem__(self, key):
+        return self._underlying[key]
+
+    def __contains__(self, key):
+        return key in self._underlying
+
+    def __setitem__(self, key, value):
+        self._underlying[key] = value
+
+    def __delitem__(self, key):
+        del self._underlying[key]
+
+    def __len__(self):
+        return len(self._underlying)
+
+    def __iter__(self):
+        return iter(self._underlying)
+
+    def key_after(self, target_key):
+        return self.item_after(target_key)[0]
+
+    def item_after(self, target_key):
+        # Cursors raise DBNotFoundError, which is a KeyError, when there
+        #   is no following key
+        cursor = self._underlying.db.cursor()
+        try:
+            following = cursor.set_range(target_key)
+            if following[0] == target_key:
+                following = cursor.next()
+            return following
+        finally:
+            cursor.close()
+
+    def close(self):
+        self._underlying.close()
+
+def thread_safe_storage(store):
+    "Wrap the backend `store` so that it can be read by several threads at once"
+    if isinstance(store, bsddb._DBWithCursor): # pylint: disable=protected-access
+        return ThreadCursorStore(store)
+    return store
@@ -0,0 +1,46 @@
+"""A store that keeps its keys in memory, for benchmarks and tests.
+
+    db = Jsdb('memory', storage_class=MemoryStore)
+
+Nothing is written to disk, so the database is lost when it is closed.
+"""
+
+import bisect
+import collections
+
+class MemoryStore(collections.MutableMapping):
+    "An in-memory store implementing `jsdb.interface.JsdbStorageInterface`"
+    def __init__(self, _filename=None):
+        self._data = {}
+        self._keys = []
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if key not in self._data:
+            bisect.insort(self._keys, key)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        del self._data[key]
+        del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def key_after(self, target_key):
+        index = bisect.bisect_right(self._keys, target_key)
+        if index == len(self._keys):
+            raise KeyError(target_key)
+        return self._keys[index]
+
+    def item_after(self, target_key):
+        key = self.key_after(target_key)
+        return key, self._data[key]
+
+    def close(self):
+        pass
@@ -0,0 +1,352 @@
+"""An alternative to the flattening layout where every dictionary and list
+is a node with a numeric id.
+
+A node's entries are stored under its id rather than under the full path
+of the node, using the flat key syntax for a single level:
+
+    @0:."a".     -> 1         d["a"] is a dictionary stored as node 1
+    @1:."b"=     -> "value"   d["a"]["b"]
+    @1:#         -> 1         len(d["a"])
+    @0:."c"[     -> 2         d["c"] is a list stored as node 2
+    @2:[0]=      -> 17        d["c"][0]
+
+Keys stay short however deep the structure is, and a dictionary or list
+can be moved to a different parent (`NodeDict.move`) with a constant
+number of writes. Deleting or copying a node still visits everything
+below it.
+"""
+
+import collections
+
+from . import flatpath
+from . import python_copy
+from . import treeutils
+from .data import JSON_VALUE_TYPES
+
+LAYOUT_HEADER_KEY = '!layout'
+PATHS, NODES = 'paths', 'nodes'
+LAYOUTS = (PATHS, NODES)
+
+NEXT_NODE_KEY = '!next-node'
+ROOT_NODE = 0
+
+class LayoutMismatch(Exception):
+    "The database uses a different layout"
+    def __init__(self, stored, requested):
+        Exception.__init__(self)
+        self.stored = stored
+        self.requested = requested
+
+    def __str__(self):
+        return 'Database uses layout {!r}, not {!r}'.format(self.stored, self.requested)
+
+def store_layout(store, name=None):
+    "Return the layout used by `store`, recording `name` for new stores"
+    if name is not None and name not in LAYOUTS:
+        raise ValueError(name)
+
+    stored_name = treeutils.store_header(store, LAYOUT_HEADER_KEY, name, PATHS)
+    if name is not None and name != stored_name:
+        raise LayoutMismatch(stored_name, name)
+    return stored_name
+
+def _node_prefix(node_id):
+    return '@{}:'.format(node_id)
+
+def _node_keys(underlying, node_id):
+    prefix = _node_prefix(node_id)
+    key_after = treeutils.key_after_func(underlying)
+    if key_after is None:
+        for key in list(underlying):
+            if key.startswith(prefix):
+                yield key
+    else:
+        key = prefix
+        while True:
+            try:
+                key = key_after(key)
+            except KeyError:
+                return
+            if not key.startswith(prefix):
+                return
+            yield key
+
+def _delete_node(underlying, node_id):
+    for key in list(_node_keys(underlying, node_id)):
+        if key[-1] in '.[':
+            _delete_node(underlying, underlying[key])
+        del underlying[key]
+
+def _copy_node(underlying, node_id):
+    "Copy a node and its descendants returning the id of the copy"
+    prefix = _node_prefix(node_id)
+    copy_id = _new_node(underlying)
+    copy_prefix = _node_prefix(copy_id)
+    for key in list(_node_keys(underlying, node_id)):
+        value = underlying[key]
+        if key[-1] in '.[':
+            value = _copy_node(underlying, value)
+        underlying[copy_prefix + key[len(prefix):]] = value
+    return copy_id
+
+def _new_node(underlying):
+    node_id = underlying.get(NEXT_NODE_KEY, ROOT_NODE + 1)
+    underlying[NEXT_NODE_KEY] = node_id + 1
+    return node_id
+
+
+class _NodeMixin(object):
+    def _entry(self, component):
+        return self._prefix + flatpath.join_key((component,))
+
+    def _set_length(self, value):
+        self._underlying[self._prefix + '#'] = value
+
+    def _lookup(self, entry):
+        try:
+            return self._underlying[entry + '=']
+        except KeyError:
+            pass
+
+        try:
+            return NodeDict(self._underlying, self._underlying[entry + '.'])
+        except KeyError:
+            pass
+
+        return NodeList(self._underlying, self._underlying[entry + '['])
+
+    def _write(self, entry, value):
+        "Write `value` to the empty `entry`"
+        if isinstance(value, JSON_VALUE_TYPES):
+            self._underlying[entry + '='] = value
+        elif isinstance(value, collections.Mapping):
+            node_id = _new_node(self._underlying)
+            self._underlying[entry + '.'] = node_id
+            node = NodeDict(self._underlying, node_id)
+            for key in list(value):
+                node[key] = value[key]
+        elif isinstance(value, collections.Sequence):
+            node_id = _new_node(self._underlying)
+            self._underlying[entry + '['] = node_id
+            node = NodeList(self._underlying, node_id)
+            for item in list(value):
+                node.append(item)
+        else:
+            raise ValueError(value)
+
+    def _stored(self, entry):
+        "The type suffix of `entry` and what is stored in it"
+        for suffix in '=.[':
+            try:
+                return suffix, self._underlying[entry + suffix]
+            except KeyError:
+                continue
+        raise KeyError(entry)
+
+    def _unlink(self, entry):
+        "Remove `entry` returning what was stored there but not any node it refers to"
+        suffix, value = self._stored(entry)
+        del self._underlying[entry + suffix]
+        return suffix, value
+
+    def _link(self, entry, (suffix, value)):
+        self._underlying[entry + suffix] = value
+
+    def _remove(self, entry):
+        suffix, value = self._unlink(entry)
+        if suffix != '=':
+            _delete_node(self._underlying, value)
+
+    def _is_self(self, entry, value):
+        # no-op self assignment. e.g. d["a"] = d["a"]
+        if isinstance(value, _NodeMixin):
+            for suffix in '.[':
+                if self._underlying.get(entry + suffix) == value.node_id:
+                    return True
+        return False
+
+
+class NodeDict(_NodeMixin, collections.MutableMapping):
+    "A dictionary stored as a node"
+    def __init__(self, underlying, node_id=ROOT_NODE):
+        self._underlying = underlying
+        self.node_id = node_id
+        self._prefix = _node_prefix(node_id)
+
+    def __repr__(self):
+        return '<NodeDict node={!r}>'.format(self.node_id)
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            raise ValueError(key)
+        return self._lookup(self._entry(key))
+
+    def __setitem__(self, key, value):
+        if isinstance(key, unicode):
+            key = key.encode('ascii')
+
+        if not isinstance(key, str):
+            raise ValueError(key)
+
+        entry = self._entry(key)
+        if self._is_self(entry, value):
+            return
+
+        # Copy first to allow assignment from within
+        #    ourselves. e.g. d["a"] = d["a"]["child"]
+        if isinstance(value, (collections.Sequence, collections.Mapping)):
+            value = python_copy.copy(value)
+
+        if key in self:
+            self._remove(entry)
+        else:
+            self._set_length(len(self) + 1)
+        self._write(entry, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._remove(self._entry(key))
+        self._set_length(len(self) - 1)
+
+    def __len__(self):
+        return self._underlying.get(self._prefix + '#', 0)
+
+    def __iter__(self):
+        # Each key of a node is a separate entry, nothing needs skipping
+        for key in _node_keys(self._underlying, self.node_id):
+            if key[-1] != '#':
+                (name,), _ = flatpath.parse_key(key[len(self._prefix):])
+                yield name
+
+    def move(self, source_path, target_path):
+        """Move the value at `source_path` to `target_path`. These are
+        sequences of keys and indexes relative to this dictionary. Both must
+        be entries of dictionaries, and `target_path` must not exist.
+
+        Only the entries of the two parents change, however large the value is.
+        """
+        source_parent, source_key, target_parent, target_key = self._transfer_parents(source_path, target_path)
+        if not isinstance(source_parent, NodeDict):
+            raise ValueError('{!r} is not in a dictionary'.format(source_path))
+
+        moved = source_parent._unlink(source_parent._entry(source_key))
+        source_parent._set_length(len(source_parent) - 1)
+        target_parent._link(target_parent._entry(target_key), moved)
+        target_parent._set_length(len(target_parent) + 1)
+
+    def copy_path(self, source_path, target_path):
+        "Copy the value at `source_path` to `target_path`, like `move` but keeping the source"
+        source_parent, source_key, target_parent, target_key = self._transfer_parents(source_path, target_path)
+        suffix, value = source_parent._stored(source_parent._entry(source_key))
+        if suffix != '=':
+            value = _copy_node(self._underlying, value)
+        target_parent._link(target_parent._entry(target_key), (suffix, value))
+        target_parent._set_length(len(target_parent) + 1)
+
+    def _transfer_parents(self, source_path, target_path):
+        source_path, target_path = tuple(source_path), tuple(target_path)
+        if not source_path or not target_path:
+            raise ValueError('Cannot move or copy the root')
+        if target_path[:len(source_path)] == source_path:
+            raise ValueError('Cannot move or copy {!r} into itself'.format(source_path))
+
+        source_parent = self._lookup_path(source_path[:-1])
+        source_key = source_path[-1]
+        if isinstance(source_parent, NodeList):
+            source_key = source_parent._simplify_index(source_key)
+        elif source_key not in source_parent:
+            raise KeyError(source_key)
+
+        target_parent = self._lookup_path(target_path[:-1])
+        if not isinstance(target_parent, NodeDict):
+            raise ValueError('{!r} is not in a dictionary'.format(target_path))
+        if target_path[-1] in target_parent:
+            raise ValueError('{!r} already exists'.format(target_path))
+
+        return source_parent, source_key, target_parent, target_path[-1]
+
+    def _lookup_path(self, path):
+        value = self
+        for component in path:
+            value = value[component]
+        return value
+
+    def copy(self):
+        return {k: self[k] for k in self.keys()}
+
+
+class NodeList(_NodeMixin, collections.MutableSequence):
+    "A list stored as a node. Inserting and deleting moves entries but not their contents"
+    def __init__(self, underlying, node_id):
+        self._underlying = underlying
+        self.node_id = node_id
+        self._prefix = _node_prefix(node_id)
+
+    def __repr__(self):
+        return '<NodeList node={!r}>'.format(self.node_id)
+
+    def __len__(self):
+        return self._underlying.get(self._prefix + '#', 0)
+
+    def _simplify_index(self, index):
+        length = len(self)
+        if -length <= index < 0:
+            return length + index
+        elif 0 <= index < length:
+            return index
+        else:
+            raise IndexError(index)
+
+    def __getitem__(self, index):
+        index = self._simplify_index(index)
+        try:
+            return self._lookup(self._entry(index))
+        except KeyError:
+            raise IndexError(index)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            if index.start == index.stop == index.step == None:
+                value = python_copy.copy(value)
+                for i in range(len(self)):
+                    self._remove(self._entry(i))
+                self._set_length(0)
+                for item in value:
+                    self.append(item)
+                return
+            else:
+                raise NotImplementedError()
+
+        index = self._simplify_index(index)
+        entry = self._entry(index)
+        if self._is_self(entry, value):
+            return
+
+        if isinstance(value, (collections.Sequence, collections.Mapping)):
+            value = python_copy.copy(value)
+
+        self._remove(entry)
+        self._write(entry, value)
+
+    def __delitem__(self, index):
+        index = self._simplify_index(index)
+        length = len(self)
+        self._remove(self._entry(index))
+        for i in range(index + 1, length):
+            self._link(self._entry(i - 1), self._unlink(self._entry(i)))
+        self._set_length(length - 1)
+
+    def insert(self, pos, value):
+        length = len(self)
+        if pos < 0:
+            pos = max(0, length + pos)
+        pos = min(pos, length)
+
+        if isinstance(value, (collections.Sequence, collections.Mapping)):
+            value = python_copy.copy(value)
+
+        for i in range(length - 1, pos - 1, -1):
+            self._link(self._entry(i + 1), self._unlink(self._entry(i)))
+        self._write(self._entry(pos), value)
+        self._set_length(length + 1)
@@ -0,0 +1,231 @@
+"""Lists of numbers stored as packed `array.array` chunks.
+
+Assigning an `array.array` stores it packed rather than as a list. It is
+read back as a `PackedArray`, which behaves like a list:
+
+    ."samples"[        'd8'       the array's typecode and item size (True for lists)
+    ."samples"#        1000000    length
+    ."samples"[(0)     <bytes>    items 0 to 1023, little-endian
+    ."samples"[(1)     <bytes>    items 1024 to 2047
+
+Indexing and slicing only read the chunks that they need, and `extend`
+writes each chunk once. Chunks are stored as raw bytes rather than through
+the value codec. The size of some typecodes (e.g. 'l') varies between
+platforms, so arrays are read with the typecode of the same kind that has
+the stored size. Arrays stored with just a typecode use this platform's size.
+"""
+
+import array
+import collections
+import sys
+
+from . import flatpath
+
+CHUNK_ITEMS = 1024
+TYPECODES = 'bBhHiIlLfd'
+# Typecodes of the same kind, which differ only in size
+_KINDS = ('bhil', 'BHIL', 'fd')
+
+def header(typecode):
+    "The value stored at the list key of arrays of `typecode`"
+    if typecode not in TYPECODES:
+        raise ValueError(typecode)
+    return '{}{}'.format(typecode, array.array(typecode).itemsize)
+
+def local_typecode(stored):
+    "The typecode with which to read an array whose list key holds `stored`"
+    typecode, itemsize = stored[0], stored[1:]
+    if not itemsize or array.array(typecode).itemsize == int(itemsize):
+        return typecode
+    for kind in _KINDS:
+        if typecode in kind:
+            for candidate in kind:
+                if array.array(candidate).itemsize == int(itemsize):
+                    return candidate
+    raise ValueError('Cannot read arrays of {!r} with {} byte items'.format(typecode, itemsize))
+
+def to_bytes(values):
+    "Pack the `array.array` `values` as little-endian bytes"
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tostring()
+
+def from_bytes(typecode, string):
+    values = array.array(typecode)
+    values.fromstring(string)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def write(underlying, prefix, values):
+    "Store the `array.array` `values` at the empty flat prefix `prefix`"
+    underlying[prefix + '['] = header(values.typecode)
+    PackedArray(underlying, prefix, values.typecode).extend(values)
+
+def flatten(prefix, values):
+    "Iterate over the flat keys and values that `write` stores"
+    yield prefix + '[', header(values.typecode)
+    if values:
+        yield prefix + '#', len(values)
+    for offset in range(0, len(values), CHUNK_ITEMS):
+        yield flatpath.chunk_key(prefix, offset // CHUNK_ITEMS), to_bytes(values[offset:offset + CHUNK_ITEMS])
+
+
+class PackedArray(collections.MutableSequence):
+    "A packed array of numbers stored at `prefix`, whose list key holds `stored`"
+    def __init__(self, underlying, prefix, stored):
+        self._underlying = underlying
+        self._prefix = prefix
+        self.typecode = local_typecode(str(stored))
+
+    def __repr__(self):
+        return '<PackedArray path={!r} typecode={!r}>'.format(self._prefix, self.typecode)
+
+    def __len__(self):
+        return self._underlying.get(self._prefix + '#', 0)
+
+    def _set_length(self, value):
+        self._underlying[self._prefix + '#'] = value
+
+    def _chunk_count(self, length):
+        return (length + CHUNK_ITEMS - 1) // CHUNK_ITEMS
+
+    def _read_chunk(self, number):
+        return from_bytes(self.typecode, self._underlying[flatpath.chunk_key(self._prefix, number)])
+
+    def _write_chunk(self, number, values):
+        self._underlying[flatpath.chunk_key(self._prefix, number)] = to_bytes(values)
+
+    def _simplify_index(self, index, length):
+        if -length <= index < 0:
+            return length + index
+        elif 0 <= index < length:
+            return index
+        else:
+            raise IndexError(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._get_slice(index)
+        index = self._simplify_index(index, len(self))
+        return self._read_chunk(index // CHUNK_ITEMS)[index % CHUNK_ITEMS]
+
+    def _get_slice(self, index):
+        indexes = range(*index.indices(len(self)))
+        if not indexes:
+            return array.array(self.typecode)
+        low, high = min(indexes), max(indexes) + 1
+        values = self._read_range(low, high)
+        if index.step in (None, 1):
+            return values
+        return array.array(self.typecode, (values[i - low] for i in indexes))
+
+    def _read_range(self, start, stop):
+        "Read items `start` to `stop` from only the chunks that hold them"
+        values = array.array(self.typecode)
+        for number in range(start // CHUNK_ITEMS, (stop - 1) // CHUNK_ITEMS + 1):
+            chunk_start = number * CHUNK_ITEMS
+            values.extend(self._read_chunk(number)[max(start - chunk_start, 0):stop - chunk_start])
+        return values
+
+    def __iter__(self):
+        for number in range(self._chunk_count(len(self))):
+            for value in self._read_chunk(number):
+                yield value
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            values = self.to_array()
+            values[index] = array.array(self.typecode, value)
+            self._rewrite_from(0, values)
+            return
+
+        index = self._simplify_index(index, len(self))
+        chunk = self._read_chunk(index // CHUNK_ITEMS)
+        chunk[index % CHUNK_ITEMS] = value
+        self._write_chunk(index // CHUNK_ITEMS, chunk)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            values = self.to_array()
+            del values[index]
+            self._rewrite_from(0, values)
+            return
+
+        index = self._simplify_index(index, len(self))
+        first = index // CHUNK_ITEMS
+        values = self._read_range(first * CHUNK_ITEMS, len(self))
+        del values[index - first * CHUNK_ITEMS]
+        self._rewrite_from(first, values)
+
+    def insert(self, pos, value):
+        length = len(self)
+        if pos < 0:
+            pos = max(0, length + pos)
+        pos = min(pos, length)
+
+        first = min(pos // CHUNK_ITEMS, self._chunk_count(length))
+        values = self._read_range(first * CHUNK_ITEMS, length)
+        values.insert(pos - first * CHUNK_ITEMS, value)
+        self._rewrite_from(first, values)
+
+    def _rewrite_from(self, first, values):
+        "Replace everything from chunk `first` onwards with `values`"
+        old_count = self._chunk_count(len(self))
+        for offset in range(0, len(values), CHUNK_ITEMS):
+            self._write_chunk(first + offset // CHUNK_ITEMS, values[offset:offset + CHUNK_ITEMS])
+        new_count = first + self._chunk_count(len(values))
+        for number in range(new_count, old_count):
+            del self._underlying[flatpath.chunk_key(self._prefix, number)]
+        self._set_length(first * CHUNK_ITEMS + len(values))
+
+    def append(self, value):
+        self.extend((value,))
+
+    def extend(self, values):
+        "Append `values`, writing each chunk once"
+        values = array.array(self.typecode, values)
+        if not values:
+            return
+        length = len(self)
+
+        number, filled = divmod(length, CHUNK_ITEMS)
+        position = 0
+        if filled:
+            chunk = self._read_chunk(number)
+            position = CHUNK_ITEMS - filled
+            chunk.extend(values[:position])
+            self._write_chunk(number, chunk)
+            number += 1
+
+        for offset in range(position, len(values), CHUNK_ITEMS):
+            self._write_chunk(number, values[offset:offset + CHUNK_ITEMS])
+            number += 1
+        self._set_length(length + len(values))
+
+    def to_bytes(self):
+        """All items as little-endian bytes, concatenating the stored chunks
+        without decoding them. This is the one copy of the items that exports
+        need, since `memoryview` and `numpy.frombuffer` share its memory."""
+        return ''.join(self._underlying[flatpath.chunk_key(self._prefix, number)]
+                       for number in range(self._chunk_count(len(self))))
+
+    def to_array(self):
+        "Return the items as a new `array.array`"
+        return from_bytes(self.typecode, self.to_bytes())
+
+    def to_numpy(self):
+        "Return the items as a read-only numpy array over `to_bytes` (requires numpy)"
+        import numpy
+        return numpy.frombuffer(self.to_bytes(), dtype=numpy_dtype(self.typecode))
+
+def numpy_dtype(typecode):
+    "The numpy dtype string of stored items of `typecode`"
+    if typecode in 'fd':
+        kind = 'f'
+    elif typecode in 'bhil':
+        kind = 'i'
+    else:
+        kind = 'u'
+    return '<{}{}'.format(kind, array.array(typecode).itemsize)
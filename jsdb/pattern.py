@@ -0,0 +1,166 @@
+"""Patterns that match paths in the flattened structure. e.g.
+
+    users[*].email       the email of every user in the list users
+    users[10:20].email   the emails of users 10 to 19 (either bound can be left out)
+    config.*.enabled     enabled in every entry of the dictionary config
+    config..enabled      enabled anywhere below config
+    "odd key"[0]         quote keys that are not identifiers
+
+A pattern is matched against flat value keys (e.g. `."users"[3]."email"=`)
+with a regular expression, and every key that it can match starts with
+`Pattern.prefix()` so that matches can be found with a range scan.
+"""
+
+import collections
+import re
+
+from . import flatpath
+
+class _Wildcard(object):
+    def __init__(self, name):
+        self._name = name
+
+    def __repr__(self):
+        return self._name
+
+ANY_KEY = _Wildcard('ANY_KEY')
+ANY_INDEX = _Wildcard('ANY_INDEX')
+# Zero or more levels of nesting
+DESCENDANTS = _Wildcard('DESCENDANTS')
+
+class IndexRange(collections.namedtuple('IndexRange', 'start stop')):
+    "The list indexes `start <= index < stop`. `stop` may be None"
+    def __contains__(self, index):
+        return self.start <= index and (self.stop is None or index < self.stop)
+
+class BadPattern(Exception):
+    "A pattern could not be parsed"
+    def __init__(self, pattern, position):
+        Exception.__init__(self)
+        self.pattern = pattern
+        self.position = position
+
+    def __str__(self):
+        return 'Cannot parse pattern {!r} at position {}'.format(self.pattern, self.position)
+
+_TOKEN = re.compile(r'''
+    (?P<separator>\.\.|\.)?
+    (?:
+        (?P<name>[A-Za-z_][A-Za-z0-9_-]*) |
+        "(?P<quoted>(?:[^"\\]|\\.)*)" |
+        (?P<any_key>\*) |
+        \[(?P<index>\d+)\] |
+        (?P<any_index>\[\*\]) |
+        \[(?P<start>\d*):(?P<stop>\d*)\]
+    )''', re.VERBOSE)
+
+_ANY_KEY_REGEX = r'\."(?:[^"\\]|\\.)*"'
+_ANY_INDEX_REGEX = r'\[\d+\]'
+_DESCENDANTS_REGEX = r'(?:{}|{})*'.format(_ANY_KEY_REGEX, _ANY_INDEX_REGEX)
+
+def parse(pattern):
+    """Parse `pattern` into a list of keys, indexes, `IndexRange`s,
+    `ANY_KEY`, `ANY_INDEX` and `DESCENDANTS`"""
+    components, position = parse_start(pattern)
+    if position != len(pattern):
+        raise BadPattern(pattern, position)
+    return components
+
+def parse_start(pattern):
+    "Parse as much of the start of `pattern` as possible, returning the components and where they end"
+    if isinstance(pattern, unicode):
+        pattern = pattern.encode('utf8')
+
+    components = []
+    position = 0
+    while position < len(pattern):
+        match = _TOKEN.match(pattern, position)
+        if match is None:
+            break
+
+        separator = match.group('separator')
+        component = _component(match)
+        is_key = isinstance(component, str) or component is ANY_KEY
+        if is_key and components and separator is None:
+            raise BadPattern(pattern, position)
+        if separator == '.' and (not components or not is_key):
+            raise BadPattern(pattern, position)
+
+        if separator == '..':
+            components.append(DESCENDANTS)
+        components.append(component)
+        position = match.end()
+    return components, position
+
+def _component(match):
+    if match.group('name') is not None:
+        return match.group('name')
+    elif match.group('quoted') is not None:
+        return re.sub(r'\\(.)', r'\1', match.group('quoted'))
+    elif match.group('any_key') is not None:
+        return ANY_KEY
+    elif match.group('index') is not None:
+        return int(match.group('index'))
+    elif match.group('any_index') is not None:
+        return ANY_INDEX
+    else:
+        return IndexRange(int(match.group('start') or 0),
+                          int(match.group('stop')) if match.group('stop') else None)
+
+def is_literal(component):
+    return isinstance(component, (str, int, long))
+
+def literal_prefix(components):
+    "The leading literal keys and indexes of `components`"
+    literal = []
+    for component in components:
+        if not is_literal(component):
+            break
+        literal.append(component)
+    return tuple(literal)
+
+def components_regex(components):
+    """A regular expression matching the flat key paths that `components`
+    matches. Index ranges are matched by any index and captured in the
+    groups `range0`, `range1`, ... for `ranges_match` to check"""
+    parts = []
+    for component in components:
+        if component is ANY_KEY:
+            parts.append(_ANY_KEY_REGEX)
+        elif component is ANY_INDEX:
+            parts.append(_ANY_INDEX_REGEX)
+        elif component is DESCENDANTS:
+            parts.append(_DESCENDANTS_REGEX)
+        elif isinstance(component, IndexRange):
+            parts.append(r'\[(?P<range{}>\d+)\]'.format(len(parts)))
+        else:
+            parts.append(re.escape(flatpath.join_key((component,))))
+    return ''.join(parts)
+
+def ranges_match(components, match):
+    "Check the indexes captured by a match of `components_regex(components)`"
+    for position, component in enumerate(components):
+        if isinstance(component, IndexRange):
+            if int(match.group('range{}'.format(position))) not in component:
+                return False
+    return True
+
+
+class Pattern(object):
+    "A compiled pattern"
+    def __init__(self, text):
+        self.text = text
+        self.components = parse(text)
+        self._regex = re.compile(components_regex(self.components) + '=$')
+
+    def __repr__(self):
+        return '<Pattern {!r}>'.format(self.text)
+
+    def matches(self, key):
+        "Does the flat value key `key` match this pattern"
+        match = self._regex.match(key)
+        return match is not None and ranges_match(self.components, match)
+
+    def prefix(self):
+        "The flat key prefix shared by everything that this pattern matches"
+        return flatpath.join_key(literal_prefix(self.components))
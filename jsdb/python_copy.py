@@ -1,10 +1,16 @@
 
+import array
 import collections
 import types
 
 def copy(d):
-    if isinstance(d, (int, unicode, str, float, bool, types.NoneType)):
+    if isinstance(d, (int, long, unicode, str, float, bool, types.NoneType)):
         return d
+    if isinstance(d, array.array):
+        return array.array(d.typecode, d)
+    if hasattr(d, 'to_array'):
+        # Packed arrays stay packed
+        return d.to_array()
     if isinstance(d, collections.Mapping):
         return {k:copy(v) for k, v in d.items()}
     elif isinstance(d, collections.Sequence):
@@ -0,0 +1,206 @@
+"""Queries for the values at paths that match a pattern (see `jsdb.pattern`),
+optionally compared with a json value:
+
+    logs[*].level == "error"
+    users[100:200].age >= 18
+    config..enabled
+
+A query is planned as a series of steps over the flattened keys. Literal
+components only extend the key prefix. `*` visits the children of a
+dictionary, skipping over each child's subtree. `[*]` and index ranges read
+the length of the list. Everything from the first `..` onwards is matched
+against a single range scan of the subtree. Values are only read for the
+paths that reach the end of the plan, so `logs[*].level == "error"` reads
+one key for each log entry.
+"""
+
+import json
+import operator
+import re
+
+from . import flatdict
+from . import flatpath
+from . import pattern as pattern_module
+from . import treeutils
+from .pattern import ANY_KEY, ANY_INDEX, DESCENDANTS, IndexRange
+
+_OPERATORS = {
+    '==': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+_PREDICATE = re.compile(r'\s*(==|!=|<=|>=|<|>)\s*(.+?)\s*$')
+
+class _Missing(object):
+    def __repr__(self):
+        return '<MISSING>'
+
+MISSING = _Missing()
+
+class Predicate(object):
+    """Compare values with `value` using `op`. Values of different kinds
+    (e.g. booleans and numbers) are never equal or ordered"""
+    def __init__(self, op, value):
+        self.op = op
+        self.value = value
+        self._compare = _OPERATORS[op]
+
+    def __repr__(self):
+        return '<Predicate {} {!r}>'.format(self.op, self.value)
+
+    def __call__(self, value):
+        if _kind(value) != _kind(self.value):
+            return self.op == '!='
+        return self._compare(value, self.value)
+
+def _kind(value):
+    if isinstance(value, bool) or value is None:
+        return type(value)
+    elif isinstance(value, (int, long, float)):
+        return float
+    elif isinstance(value, basestring):
+        return basestring
+    else:
+        return type(value)
+
+
+class _Literal(object):
+    def __init__(self, components):
+        self.suffix = flatpath.join_key(components)
+
+    def __repr__(self):
+        return 'append {}'.format(self.suffix)
+
+    def expand(self, _store, prefix):
+        yield prefix + self.suffix
+
+class _DictChildren(object):
+    def __repr__(self):
+        return 'scan dictionary keys'
+
+    def expand(self, store, prefix):
+        for key in flatdict.JsonFlatteningDict(store, prefix):
+            yield prefix + flatpath.join_key((key,))
+
+class _ListIndexes(object):
+    def __init__(self, index_range):
+        self.index_range = index_range
+
+    def __repr__(self):
+        stop = '' if self.index_range.stop is None else self.index_range.stop
+        return 'list indexes [{}:{}]'.format(self.index_range.start, stop)
+
+    def expand(self, store, prefix):
+        if prefix + '[' not in store:
+            return
+        stop = store.get(prefix + '#', 0)
+        if self.index_range.stop is not None:
+            stop = min(stop, self.index_range.stop)
+        for index in range(self.index_range.start, stop):
+            yield prefix + flatpath.join_key((index,))
+
+class _SubtreeScan(object):
+    def __init__(self, components):
+        self.components = components
+        self._regex = re.compile(pattern_module.components_regex(components) + r'[.\[=]$')
+
+    def __repr__(self):
+        return 'scan subtree for {}'.format(self._regex.pattern)
+
+    def expand(self, store, prefix):
+        for key in treeutils.keys_with_prefix(store, prefix):
+            match = self._regex.match(key, len(prefix))
+            if match is not None and pattern_module.ranges_match(self.components, match):
+                yield key[:-1]
+
+
+def _plan(components):
+    steps = []
+    literal = []
+    for position, component in enumerate(components):
+        if component is DESCENDANTS:
+            break
+        elif pattern_module.is_literal(component):
+            literal.append(component)
+            continue
+
+        if literal:
+            steps.append(_Literal(literal))
+            literal = []
+
+        if component is ANY_KEY:
+            steps.append(_DictChildren())
+        elif component is ANY_INDEX:
+            steps.append(_ListIndexes(IndexRange(0, None)))
+        elif isinstance(component, IndexRange):
+            steps.append(_ListIndexes(component))
+        else:
+            raise ValueError(component)
+    else:
+        position = len(components)
+
+    if literal:
+        steps.append(_Literal(literal))
+    if position < len(components):
+        steps.append(_SubtreeScan(components[position:]))
+    return steps
+
+
+class Query(object):
+    "A compiled query. `run` it against a flattened store"
+    def __init__(self, text):
+        self.text = text
+        self.components, position = pattern_module.parse_start(text)
+        self.predicate = None
+        if position != len(text):
+            match = _PREDICATE.match(text, position)
+            if match is None:
+                raise pattern_module.BadPattern(text, position)
+            try:
+                value = json.loads(match.group(2))
+            except ValueError:
+                raise pattern_module.BadPattern(text, match.start(2))
+            self.predicate = Predicate(match.group(1), value)
+        self.steps = _plan(self.components)
+
+    def __repr__(self):
+        return '<Query {!r}>'.format(self.text)
+
+    def prefix_path(self):
+        "The path (a tuple of keys and indexes) that every match is within"
+        return pattern_module.literal_prefix(self.components)
+
+    def explain(self):
+        "Describe the steps that running the query takes"
+        lines = [repr(step) for step in self.steps]
+        if self.predicate is None:
+            lines.append('read values')
+        else:
+            lines.append('read leaf values where value {} {!r}'.format(self.predicate.op, self.predicate.value))
+        return lines
+
+    def run(self, store, prefix=''):
+        """Iterate over `(path, value)` for the matches below the flat key
+        `prefix` of `store`. Paths are tuples relative to `prefix`"""
+        prefixes = [prefix]
+        for step in self.steps:
+            prefixes = _expand(step, store, prefixes)
+
+        flat_store = flatdict.FlatteningStore(store)
+        for item_prefix in prefixes:
+            if self.predicate is None:
+                try:
+                    value = flat_store.lookup(item_prefix)
+                except (KeyError, IndexError):
+                    continue
+            else:
+                value = store.get(item_prefix + '=', MISSING)
+                if value is MISSING or not self.predicate(value):
+                    continue
+
+            path, _ = flatpath.parse_key(item_prefix[len(prefix):])
+            yield path, value
+
+def _expand(step, store, prefixes):
+    for prefix in prefixes:
+        for expanded in step.expand(store, prefix):
+            yield expanded
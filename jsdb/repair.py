@@ -0,0 +1,286 @@
+"""Copy a database into a new store, in key order, checking its structure.
+
+    python -m jsdb compact SOURCE DESTINATION
+    python -m jsdb repair SOURCE DESTINATION
+
+Copying a database into a fresh store leaves behind the space freed by
+deleted keys. Keys are read in order with a single scan and written in
+batches, and only the dictionaries and lists enclosing the current key are
+kept in memory.
+
+The flattening layer expects every path to be exactly one of a dictionary
+(`.`), a list (`[`) or a value (`=`), every entry to be inside a dictionary
+or list of the right kind, and each dictionary or list's length (`#`) to
+match its entries. `copy` reports a `Problem` for each key that breaks
+these rules or cannot be read. When compacting, keys are copied as they
+are. When repairing, unreadable keys are skipped, as are keys outside a
+dictionary or list, a second type for a path (with everything below it),
+and lengths are rewritten to match the entries that were copied. Gaps in
+the indexes of a list are reported but not fixed.
+
+Databases with the nodes layout are copied without these checks.
+"""
+
+import collections
+import struct
+
+from . import codec as codec_module
+from . import compression
+from . import flatpath
+from . import keyformat
+from . import nodedict
+from . import treeutils
+
+BATCH_SIZE = 1000
+PROGRESS_EVERY = 10000
+
+# `key` is the flat key as text, unless it could not be parsed
+Problem = collections.namedtuple('Problem', 'key kind detail')
+Result = collections.namedtuple('Result', 'keys written skipped problems')
+
+# The kinds of problem
+UNREADABLE = 'unreadable'
+CORRUPT_KEY = 'corrupt-key'
+CONFLICT = 'conflict'
+ORPHAN = 'orphan'
+WRONG_KIND = 'wrong-kind'
+LENGTH = 'length'
+INDEXES = 'indexes'
+
+MARKERS = ('.', '[', '=')
+_LIST = '['
+
+class _Node(object):
+    "A path whose type has been seen, and the entries of it that have been copied"
+    def __init__(self, components, terminal, packed=False):
+        self.components = components
+        self.terminal = terminal
+        self.packed = packed
+        self.length = 0
+        self.entries = 0
+        self.max_index = -1
+
+    def contains(self, components):
+        return components[:len(self.components)] == self.components
+
+
+class _BatchWriter(object):
+    "Write to `store` in write batches of `size` keys"
+    def __init__(self, store, size):
+        self._store = store
+        self._size = size
+        self._batch = None
+        self._pending = 0
+        self.written = 0
+
+    def __setitem__(self, key, value):
+        if self._batch is None:
+            self._batch = treeutils.write_batch(self._store)
+            self._batch.__enter__()
+        self._store[key] = value
+        self.written += 1
+        self._pending += 1
+        if self._pending >= self._size:
+            self.flush()
+
+    def flush(self):
+        if self._batch is not None:
+            self._batch.__exit__(None, None, None)
+        self._batch = None
+        self._pending = 0
+
+
+def _tolerant_items(store, unreadable):
+    """Iterate over the items of `store` in order, calling `unreadable` for
+    values that cannot be read and yielding None for them"""
+    key_after = treeutils.key_after_func(store)
+    keys = sorted(store) if key_after is None else _keys_after(key_after)
+    for key in keys:
+        try:
+            value = store[key]
+        except Exception as error: # pylint: disable=broad-except
+            # Backends raise their own errors for corrupt data
+            unreadable(key, '{}: {}'.format(type(error).__name__, error))
+            yield key, None
+        else:
+            yield key, value
+
+def _keys_after(key_after):
+    key = ''
+    while True:
+        try:
+            key = key_after(key)
+        except KeyError:
+            return
+        yield key
+
+
+class _Copier(object):
+    def __init__(self, source, destination, repair, batch_size, report):
+        self._repair = repair
+        self._report = report
+        self._writer = _BatchWriter(destination, batch_size)
+        self._binary = keyformat.store_key_format(source) == keyformat.BINARY
+        self._validate = nodedict.store_layout(source) == nodedict.PATHS
+        data = keyformat.key_format_dict(source)
+        self._codec = compression.store_compression(data, codec_module.store_codec(data))
+        self._stack = [_Node((), '.')]
+        self._pending_length = None
+        self._skipping = None
+        self.keys = 0
+        self.skipped = 0
+        self.problems = 0
+
+    @property
+    def written(self):
+        return self._writer.written
+
+    def problem(self, key, kind, detail):
+        self.problems += 1
+        self._report(Problem(key, kind, detail))
+
+    def copy(self, items, progress, progress_every):
+        for stored_key, value in items:
+            self.keys += 1
+            if progress is not None and self.keys % progress_every == 0:
+                progress(self.keys)
+
+            if value is None:
+                # Unreadable
+                self.skipped += 1
+            elif stored_key.startswith(flatpath.META_PREFIX) or not self._validate:
+                self._writer[stored_key] = value
+            else:
+                self._copy_flat(stored_key, value)
+
+        if self._validate:
+            self._flush_length(None)
+            while self._stack:
+                self._close(self._stack.pop())
+        self._writer.flush()
+
+    def _text_key(self, stored_key):
+        return keyformat.decode_key(stored_key) if self._binary else stored_key
+
+    def unreadable(self, stored_key, detail):
+        try:
+            key = self._text_key(stored_key)
+        except (KeyError, IndexError, struct.error):
+            key = stored_key
+        self.problem(key, UNREADABLE, detail)
+
+    def _stored_key(self, key):
+        return keyformat.encode_key(key) if self._binary else key
+
+    def _copy_flat(self, stored_key, value):
+        try:
+            key = self._text_key(stored_key)
+            components, terminal = flatpath.parse_key(key)
+        except (flatpath.PathCorrupt, KeyError, IndexError, struct.error):
+            self.problem(stored_key, CORRUPT_KEY, 'Cannot parse key')
+            if self._repair:
+                self.skipped += 1
+            else:
+                self._writer[stored_key] = value
+            return
+
+        if self._skipping is not None:
+            if components[:len(self._skipping)] == self._skipping:
+                self.skipped += 1
+                return
+            self._skipping = None
+
+        self._flush_length(components if terminal in MARKERS else None)
+        while len(self._stack) > 1 and not self._stack[-1].contains(components):
+            self._close(self._stack.pop())
+        parent = self._stack[-1]
+
+        if terminal == '#':
+            if parent.components == components:
+                parent.length = self._codec.decode(value)
+                self._writer[stored_key] = value
+            else:
+                # Lengths sort just before their dictionary or list's marker
+                self._pending_length = components, stored_key, value
+        elif terminal in MARKERS:
+            self._copy_marker(key, stored_key, value, components, terminal, parent)
+        else:
+            # A chunk of a packed array or large string
+            if parent.components != components:
+                self.problem(key, ORPHAN, 'Chunk without its array or string')
+                if self._repair:
+                    self.skipped += 1
+                    return
+            self._writer[stored_key] = value
+
+    def _copy_marker(self, key, stored_key, value, components, terminal, parent):
+        node = _Node(components, terminal, terminal == _LIST and self._codec.decode(value) is not True)
+        pending, self._pending_length = self._pending_length, None
+        if pending is not None:
+            node.length = self._codec.decode(pending[2])
+
+        problem = None
+        if parent.components == components:
+            problem = CONFLICT, 'Already has type {!r}'.format(parent.terminal)
+        elif parent.components != components[:-1]:
+            problem = ORPHAN, 'No dictionary or list contains {!r}'.format(components[-1])
+        elif parent.terminal == '=' or (parent.terminal == _LIST) != isinstance(components[-1], (int, long)):
+            problem = WRONG_KIND, 'Entry {!r} of {!r}'.format(components[-1], parent.terminal)
+
+        if problem is not None:
+            self.problem(key, *problem)
+            if self._repair:
+                self.skipped += 1 + (pending is not None)
+                if terminal != '=':
+                    self._skipping = components
+                return
+        elif parent.terminal != '=':
+            parent.entries += 1
+            if isinstance(components[-1], (int, long)):
+                parent.max_index = max(parent.max_index, components[-1])
+
+        if pending is not None:
+            self._writer[pending[1]] = pending[2]
+        self._writer[stored_key] = value
+        if problem is None or problem[0] != CONFLICT:
+            self._stack.append(node)
+
+    def _flush_length(self, components):
+        "Deal with a pending length that is not followed by the marker at `components`"
+        if self._pending_length is None or self._pending_length[0] == components:
+            return
+        length_components, stored_key, value = self._pending_length
+        self._pending_length = None
+        self.problem(flatpath.join_key(length_components, '#'), ORPHAN, 'Length without a dictionary or list')
+        if self._repair:
+            self.skipped += 1
+        else:
+            self._writer[stored_key] = value
+
+    def _close(self, node):
+        if node.terminal == '=' or node.packed:
+            return
+        length_key = flatpath.join_key(node.components, '#')
+        if node.length != node.entries:
+            self.problem(length_key, LENGTH, 'Length {} with {} entries'.format(node.length, node.entries))
+            if self._repair:
+                self._writer[self._stored_key(length_key)] = self._codec.encode(node.entries)
+        if node.terminal == _LIST and node.max_index >= node.entries:
+            self.problem(flatpath.join_key(node.components, _LIST), INDEXES,
+                         'Index {} in a list of {} entries'.format(node.max_index, node.entries))
+
+
+def copy(source, destination, repair=False, batch_size=BATCH_SIZE, report=None, progress=None,
+         progress_every=PROGRESS_EVERY):
+    """Copy every key of the store `source` to the empty store `destination`
+    in order, checking the structure of the database (see the module
+    docstring). `report` is called with each `Problem`, and `progress` with
+    the number of keys read every `progress_every` keys. Returns a `Result`."""
+    if not treeutils.is_empty(destination):
+        raise ValueError('Destination is not empty')
+    report = report or (lambda _problem: None)
+
+    copier = _Copier(source, destination, repair, batch_size, report)
+    items = _tolerant_items(source, copier.unreadable) if repair else treeutils.ordered_items(source)
+    copier.copy(items, progress, progress_every)
+    return Result(copier.keys, copier.written, copier.skipped, copier.problems)
@@ -1,6 +1,8 @@
 import collections
 
-from .data import JSON_TYPES
+from . import largestring, python_copy
+from .data import JSON_TYPES, JSON_VALUE_TYPES
+from .packed import PackedArray
 
 class _Deleted(object):
     def __repr__(self):
@@ -8,7 +10,68 @@ class _Deleted(object):
 
 DELETED = _Deleted()
 
+class UncommittedChanges(Exception):
+    "The operation requires all changes to be committed or rolled back"
+
+_MOVE = 'move'
+_COPY = 'copy'
+_APPEND = 'append'
+
+class _AppendedString(object):
+    "The string at `key` of a dictionary proxy with `texts` appended by `commit`"
+    def __init__(self, parent, key):
+        self._parent = parent
+        self._key = key
+        self.texts = []
+
+    def value(self):
+        value = self._parent._underlying[self._key] # pylint: disable=protected-access
+        for text in self.texts:
+            value = largestring.join(value, text)
+        return value
+
+def _shown(value):
+    "The value to show for an entry of `RollbackDict._updates`"
+    return value.value() if isinstance(value, _AppendedString) else value
+
+def _overlaps(path, other):
+    "Is one of the paths `path` and `other` within the other"
+    length = min(len(path), len(other))
+    return path[:length] == other[:length]
+
 class _RollbackMixin(object):
+    # Only top-level dictionaries have pending moves, copies and appends
+    _pending = ()
+
+    def _observe(self, parent, stats, operation):
+        # Proxies below the top level share the top level's statistics
+        #   and its pending structural changes
+        if parent is not None:
+            stats, operation = parent._stats, parent._operation # pylint: disable=protected-access
+        self._stats = stats
+        self._operation = operation
+        self._top = self if parent is None else parent._top # pylint: disable=protected-access
+
+    def _before_change(self, key=None):
+        "Called before changing `key`, or any part of this proxy if it is None"
+        top = self._top
+        if top._pending: # pylint: disable=protected-access
+            path = self._path() if key is None else self._path() + (key,)
+            top._resolve_conflicts(path) # pylint: disable=protected-access
+
+    def _observed(self, name, keys, function, *args):
+        "Call `function` with `args` as the operation `name` on `keys` below this proxy"
+        if self._stats is not None and self._stats.enabled:
+            # Working out the path is left until it is logged
+            return self._operation(name, lambda: self._path() + keys, function, *args)
+        return function(*args)
+
+    def _path(self):
+        "The keys and indexes of this proxy from the top level (None where it has been replaced)"
+        if self._parent is None:
+            return ()
+        return self._parent._path() + (self._parent._key_of(self),) # pylint: disable=protected-access
+
     def _rollback_wrap(self, value):
         "Make the value rollbackable"
 
@@ -27,25 +90,55 @@ class _RollbackMixin(object):
         else:
             return value
 
+def _check_string(underlying, key):
+    "Raise an error unless the value at `key` of `underlying` is a string"
+    if hasattr(underlying, 'open_string'):
+        underlying.open_string((key,))
+    else:
+        largestring.inline_reader(underlying[key])
+
+def _depth(proxy):
+    depth = 0
+    while proxy._parent is not None: # pylint: disable=protected-access
+        proxy = proxy._parent # pylint: disable=protected-access
+        depth += 1
+    return depth
+
 class RollbackDict(_RollbackMixin, collections.MutableMapping):
-    "A proxy for changing an underlying data structure that commit and rollback"
-    def __init__(self, underlying, parent=None):
+    """A proxy for changing an underlying data structure that commit and rollback
+
+    While `stats` (a `jsdb.stats.Stats`) is enabled, reads of the proxies
+    below the top level are made by calling `operation(name, path, function,
+    *args)`, where `path` is a function returning the keys and indexes read.
+    """
+    def __init__(self, underlying, parent=None, stats=None, operation=None):
         self._underlying = underlying
         self._updates = {}
         self._singleton_children = {}
         self._parent = parent
         self._changed_descendents = []
+        # Keys changed by pending moves, copies and appends, which `commit` makes in the store
+        self._transferred = set()
+        # At the top level: the pending moves, copies and appends and the proxies they change
+        self._pending = []
+        self._transfer_proxies = []
+        self._observe(parent, stats, operation)
 
     def _items(self):
         return self.items()
 
     def __getitem__(self, key):
+        if self._parent is not None:
+            return self._observed('get', (key,), self._getitem, key)
+        return self._getitem(key)
+
+    def _getitem(self, key):
         if key in self._updates:
             updated = self._updates[key]
             if updated == DELETED:
                 raise KeyError(key)
             else:
-                return updated
+                return _shown(updated)
         elif key in self._singleton_children:
             return  self._singleton_children[key]
         else:
@@ -55,11 +148,29 @@ class RollbackDict(_RollbackMixin, collections.MutableMapping):
                 self._singleton_children[key] = wrapped
             return wrapped
 
+    def _key_of(self, child):
+        for children in (self._singleton_children, self._updates):
+            for key, value in children.iteritems():
+                if value is child:
+                    return key
+        return None
+
     def __setitem__(self, key, value):
+        self._before_change(key)
         if self._parent:
             self._parent._record_changed(self) # pylint: disable=protected-access
+        self._transferred.discard(key)
         self._updates[key] = self._rollback_wrap(value)
 
+    def _transfer(self, key, value):
+        "Show `value` at `key` until a pending move, copy or append is made by `commit`"
+        if self._parent:
+            self._parent._record_changed(self) # pylint: disable=protected-access
+        self._singleton_children.pop(key, None)
+        self._updates[key] = value
+        self._transferred.add(key)
+        self._top._transfer_proxies.append(self) # pylint: disable=protected-access
+
     def _record_changed(self, item):
         if self._parent:
             self._parent._record_changed(item) # pylint: disable=protected-access
@@ -75,19 +186,55 @@ class RollbackDict(_RollbackMixin, collections.MutableMapping):
             if key not in self._updates:
                 yield key
 
+    def iteritems(self):
+        # Take values from the underlying store's iteritems rather than
+        #   looking up each key again
+        for key, value in self._updates.iteritems():
+            if value != DELETED:
+                yield key, _shown(value)
+
+        for key, value in self._underlying.iteritems():
+            if key in self._updates:
+                continue
+            elif key in self._singleton_children:
+                yield key, self._singleton_children[key]
+            else:
+                wrapped = self._rollback_wrap(value)
+                if isinstance(wrapped, _RollbackMixin):
+                    self._singleton_children[key] = wrapped
+                yield key, wrapped
+
+    def itervalues(self):
+        for _, value in self.iteritems():
+            yield value
+
+    def items(self):
+        if self._parent is not None:
+            return self._observed('items', (), list, self.iteritems())
+        return list(self.iteritems())
+
+    def values(self):
+        if self._parent is not None:
+            return self._observed('values', (), list, self.itervalues())
+        return list(self.itervalues())
+
     def __delitem__(self, key):
+        self._before_change(key)
         if self._parent:
             self._parent._record_changed(self) # pylint: disable=protected-access
 
         if key in self and self._updates.get(key, None) != DELETED:
+            self._transferred.discard(key)
             self._updates[key] = DELETED
         else:
             raise KeyError(key)
 
     def __len__(self):
-        additions = len([x for x in self._updates.keys() if x not in self._underlying])
-        deletions = len([x for x in self._updates.values() if x == DELETED])
-        return len(self._underlying) + additions - deletions
+        length = len(self._underlying)
+        for key, value in self._updates.iteritems():
+            if (value == DELETED) == (key in self._underlying):
+                length += -1 if value == DELETED else 1
+        return length
 
     def commit(self):
         if self._parent is not None:
@@ -99,16 +246,211 @@ class RollbackDict(_RollbackMixin, collections.MutableMapping):
             raise Exception('Can only commit at top level')
         self._rollback()
 
+    def move(self, source_path, target_path):
+        """Move a value from `source_path` to `target_path` (sequences of keys
+        and indexes) using the underlying store's `move`.
+
+        Like other changes the move is made by `commit`, after the changes
+        made before it. Until then the value is read from where it was, so
+        moving a large value does not read it. Changing the source or target
+        (other than within the moved value) before committing makes the
+        move through Python instead, so that it is made in order.
+        """
+        self._transfer_value(_MOVE, source_path, target_path)
+
+    def copy_path(self, source_path, target_path):
+        """Copy a value from `source_path` to `target_path` using the
+        underlying store's `copy_path`, otherwise like `move`. Changing
+        either copy before committing copies it through Python."""
+        self._transfer_value(_COPY, source_path, target_path)
+
+    def _transfer_value(self, kind, source_path, target_path):
+        source_path, target_path = tuple(source_path), tuple(target_path)
+        if self._parent is not None:
+            raise Exception('Can only make structural changes at top level')
+        source_parent, source_key, target_parent, target_key = self._transfer_parents(source_path, target_path)
+        source_path = source_path[:-1] + (source_key,)
+        value = source_parent[source_key]
+
+        if kind == _MOVE:
+            if not isinstance(source_parent, RollbackDict):
+                raise ValueError('{!r} is not in a dictionary'.format(source_path))
+            source_parent._transfer(source_key, DELETED) # pylint: disable=protected-access
+            if isinstance(value, _RollbackMixin):
+                value._parent = target_parent # pylint: disable=protected-access
+        elif isinstance(value, _RollbackMixin):
+            if self._changed_below(source_path):
+                # The store would not copy the uncommitted changes that are
+                #   shown by the value's proxies
+                target_parent[target_key] = python_copy.copy(value)
+                return
+            value = type(value)(value._underlying, parent=target_parent) # pylint: disable=protected-access
+
+        target_parent._transfer(target_key, value) # pylint: disable=protected-access
+        self._pending.append((kind, source_path, target_path))
+
+    def _transfer_parents(self, source_path, target_path):
+        if not source_path or not target_path:
+            raise ValueError('Cannot move or copy the root')
+        if target_path[:len(source_path)] == source_path:
+            raise ValueError('Cannot move or copy {!r} into itself'.format(source_path))
+
+        source_parent = self._lookup_path(source_path[:-1])
+        source_key = source_path[-1]
+        if isinstance(source_parent, RollbackList) and source_key < 0:
+            source_key += len(source_parent)
+        target_parent = self._lookup_path(target_path[:-1])
+        if not isinstance(target_parent, RollbackDict):
+            raise ValueError('{!r} is not in a dictionary'.format(target_path))
+        if target_path[-1] in target_parent:
+            raise ValueError('{!r} already exists'.format(target_path))
+        return source_parent, source_key, target_parent, target_path[-1]
+
+    def _changed_below(self, path):
+        "Are there pending changes to the value at `path` or within it"
+        for proxy in self._changed_descendents:
+            proxy_path = proxy._path() # pylint: disable=protected-access
+            if proxy_path is not None and proxy_path[:len(path)] == path:
+                return True
+        return False
+
+    def _resolve_conflicts(self, path):
+        "Make pending moves, copies and appends through Python if `path` is about to change in a way that affects them"
+        for kind, source_path, target in self._pending:
+            if _overlaps(path, source_path):
+                break
+            if kind != _APPEND:
+                within_target = kind == _MOVE and len(path) > len(target) and path[:len(target)] == target
+                if _overlaps(path, target) and not within_target:
+                    break
+        else:
+            return
+        self._make_pending_in_python()
+
+    def _make_pending_in_python(self):
+        # The values shown by pending moves, copies and appends are read
+        #   into Python, and written where they are shown like any other change
+        for parent in self._transfer_proxies:
+            for key in parent._transferred: # pylint: disable=protected-access
+                value = parent._updates[key] # pylint: disable=protected-access
+                if isinstance(value, _RollbackMixin):
+                    value._take_copy() # pylint: disable=protected-access
+                elif isinstance(value, _AppendedString):
+                    parent._updates[key] = value.value() # pylint: disable=protected-access
+            parent._transferred.clear() # pylint: disable=protected-access
+        del self._pending[:]
+        del self._transfer_proxies[:]
+
+    def _take_copy(self, plain=None):
+        "Read the underlying value into Python (or use `plain`, a copy of it) keeping pending changes"
+        self._underlying = python_copy.copy(self._underlying) if plain is None else plain
+        for key, child in self._singleton_children.items():
+            child._take_copy(self._underlying[key]) # pylint: disable=protected-access
+
+    def open_string(self, path):
+        """A `jsdb.largestring.StringReader` of the committed string at
+        `path`, so there must not be any uncommitted changes to it"""
+        self._check_committed(tuple(path))
+        return self._underlying.open_string(path)
+
+    def append_string(self, path, text):
+        """Append `text` to the string at `path` using the underlying store's
+        `append_string`, which only rewrites the end of large strings. Like
+        `move` the append is made by `commit`, and until then reading the
+        string reads it from the store and appends the text. Appending to
+        strings in lists, or to strings with other uncommitted changes, is
+        done through Python."""
+        path = tuple(path)
+        if self._parent is not None:
+            raise Exception('Can only make structural changes at top level')
+        if not path:
+            raise ValueError('Cannot append to the root')
+        largestring.utf8(text)
+        parent, key = self._lookup_path(path[:-1]), path[-1]
+
+        updates = {} if isinstance(parent, RollbackList) else parent._updates # pylint: disable=protected-access
+        appended = updates.get(key)
+        if isinstance(parent, RollbackList) or (key in updates and not isinstance(appended, _AppendedString)):
+            parent[key] = largestring.join(parent[key], text)
+            return
+
+        if appended is None:
+            _check_string(parent._underlying, key) # pylint: disable=protected-access
+            appended = _AppendedString(parent, key)
+            parent._transfer(key, appended) # pylint: disable=protected-access
+        appended.texts.append(text)
+        self._pending.append((_APPEND, path, text))
+
+    def query(self, query):
+        """Run `query` (a `jsdb.query.Query`) against the underlying store.
+        Queries read what has been committed, so there must not be any
+        uncommitted changes to what they could match."""
+        self._check_committed(query.prefix_path())
+        return self._query_results(self._underlying.query(query))
+
+    def to_columns(self, path, fields, typecodes=None):
+        """Read `fields` from the records of the list at `path` into columns
+        using the underlying store. Like `query` this reads what has been
+        committed."""
+        self._check_committed(tuple(path))
+        return self._underlying.to_columns(path, fields, typecodes)
+
+    def _query_results(self, results):
+        for path, value in results:
+            if not isinstance(value, JSON_VALUE_TYPES):
+                # Return proxies that support rollback
+                value = self._lookup_path(path)
+            yield path, value
+
+    def _lookup_path(self, path):
+        value = self
+        for component in path:
+            value = value[component]
+        return value
+
+    def _check_committed(self, path):
+        "Raise `UncommittedChanges` if there are changes to the value at `path`, within it or replacing it"
+        if self._parent is not None:
+            raise Exception('Can only read the committed data at top level')
+        for proxy in [self] + self._changed_descendents:
+            proxy_path = proxy._path() # pylint: disable=protected-access
+            if None in proxy_path:
+                raise UncommittedChanges()
+            if isinstance(proxy, RollbackDict):
+                # Including the keys changed by pending moves, copies and appends
+                changed = [proxy_path + (key,) for key in proxy._updates] # pylint: disable=protected-access
+            else:
+                changed = [proxy_path]
+            if any(_overlaps(path, changed_path) for changed_path in changed):
+                raise UncommittedChanges()
+
+    def _forget_children(self, *paths):
+        # Cached proxies may refer to where things used to be
+        for path in paths:
+            self._singleton_children.pop(path[0], None)
+
     def _rollback(self):
         for desc in self._changed_descendents:
             desc._rollback()
+        del self._changed_descendents[:]
         self._updates.clear()
+        self._transferred.clear()
+        del self._pending[:]
+        del self._transfer_proxies[:]
 
     def _commit(self):
-        for desc in self._changed_descendents:
+        # Deeper changes first, so that they are part of new values that
+        #   their ancestors write
+        changed = dict((id(desc), desc) for desc in self._changed_descendents).values()
+        for desc in sorted(changed, key=_depth, reverse=True):
             desc._commit() # pylint: disable=protected-access
         del self._changed_descendents[:]
 
+        # Made by the pending moves, copies and appends below
+        for k in self._transferred:
+            self._updates.pop(k)
+        self._transferred.clear()
+
         # There was a logic bug here related to
         #    update / delete order. This might
         #    deserve some proof.
@@ -126,21 +468,37 @@ class RollbackDict(_RollbackMixin, collections.MutableMapping):
         for k, v in list(self._updates.items()): # python3
             if v != DELETED:
                 raise ValueError(k)
-            del self._underlying[k]
+            if k in self._underlying:
+                # Otherwise it was added and deleted in this transaction
+                del self._underlying[k]
         self._updates.clear()
 
+        pending, self._pending = self._pending, []
+        del self._transfer_proxies[:]
+        for kind, source_path, target in pending:
+            if kind == _APPEND:
+                self._underlying.append_string(source_path, target)
+            elif kind == _MOVE:
+                self._underlying.move(source_path, target)
+                self._forget_children(source_path, target)
+            else:
+                self._underlying.copy_path(source_path, target)
+                self._forget_children(source_path, target)
+
 class RollbackList(_RollbackMixin, collections.MutableSequence):
     """A proxy for changing an underlying data structure that supports commit and rollback
 
     This works by creating a complete clone of the underlying list. Simplifying slicing etc
     """
 
-    def __init__(self, underlying, parent=None):
+    def __init__(self, underlying, parent=None, stats=None, operation=None):
         self._underlying = underlying
         self._new = None
         self._parent = parent
+        self._observe(parent, stats, operation)
 
     def insert(self, index, obj):
+        self._before_change()
         self._ensure_copied()
         self._record_changed(self)
         self._new.insert(index, obj)
@@ -152,25 +510,47 @@ class RollbackList(_RollbackMixin, collections.MutableSequence):
         del self._underlying[:]
 
     def __setitem__(self, key, value):
+        self._before_change()
         self._ensure_copied()
         self._record_changed(self)
         self._new[key] = value
 
     def __getitem__(self, key):
+        return self._observed('get', (key,), self._getitem, key)
+
+    def _getitem(self, key):
+        if not self._is_updated():
+            # Reading numbers and strings need not copy the list
+            if isinstance(key, slice):
+                if isinstance(self._underlying, PackedArray):
+                    return self._underlying[key]
+            else:
+                value = self._underlying[key]
+                if isinstance(value, JSON_VALUE_TYPES):
+                    return value
+
         self._ensure_copied()
         value = self._new[key]
         wrapped = self._rollback_wrap(value)
-        if value == wrapped:
+        # Comparing a proxy with its underlying value would read both
+        if value is wrapped:
             return value
         else:
             self._new[key] = wrapped
             return wrapped
 
+    def _key_of(self, child):
+        for index, value in enumerate(self._new or ()):
+            if value is child:
+                return index
+        return None
+
     def _ensure_copied(self):
         if not self._is_updated():
             self._new = list(self._underlying)
 
     def __delitem__(self, key):
+        self._before_change()
         self._ensure_copied()
         self._record_changed(self)
         del self._new[key]
@@ -190,6 +570,25 @@ class RollbackList(_RollbackMixin, collections.MutableSequence):
     def _is_updated(self):
         return self._new is not None
 
+    def _take_copy(self, plain=None):
+        "Read the underlying list into Python (or use `plain`, a copy of it) keeping pending changes"
+        self._underlying = python_copy.copy(self._underlying) if plain is None else plain
+        if self._is_updated():
+            for index, value in enumerate(self._new):
+                if isinstance(value, _RollbackMixin):
+                    value._take_copy() # pylint: disable=protected-access
+                elif not isinstance(value, JSON_VALUE_TYPES):
+                    self._new[index] = python_copy.copy(value)
+
+    def __getattr__(self, name):
+        # The exports of packed arrays, which only see committed data
+        if name in ('typecode', 'to_array', 'to_bytes', 'to_numpy'):
+            if isinstance(self._underlying, PackedArray):
+                if self._is_updated():
+                    raise UncommittedChanges()
+                return getattr(self._underlying, name)
+        raise AttributeError(name)
+
     def _record_changed(self, item):
         if self._parent:
             self._parent._record_changed(item) # pylint: disable=protected-access
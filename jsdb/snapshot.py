@@ -0,0 +1,259 @@
+"""Read-only views of a database at the time they were taken.
+
+`db.snapshot()` returns a `Snapshot`, which reads the data committed when
+it was taken however much is committed afterwards, without holding up
+commits:
+
+    with db.snapshot() as snapshot:
+        for key, record in snapshot['records'].iteritems():
+            export(record)
+
+Stores that can take snapshots themselves provide `snapshot()`, returning
+a read-only store (LevelDB does, see `jsdb.leveldict`). Other stores are
+wrapped in a `VersionedStore`, which keeps the old value of each key
+written while a snapshot is open in that snapshot. This costs a read for
+each write while there are open snapshots, and memory for each key written
+until the snapshot is closed or garbage collected.
+"""
+
+import bisect
+import collections
+import itertools
+import weakref
+
+from . import flatdict
+from . import python_copy
+from . import query as query_module
+from . import treeutils
+
+class SnapshotReadOnly(Exception):
+    "Snapshots cannot be changed"
+
+class _Missing(object):
+    def __repr__(self):
+        return '<MISSING>'
+
+MISSING = _Missing()
+
+
+class VersionedStore(collections.MutableMapping):
+    "Give the store `underlying` snapshots by keeping the values they would lose"
+    def __init__(self, underlying):
+        self._underlying = underlying
+        # Snapshots that are garbage collected no longer need old values
+        self._snapshots = weakref.WeakValueDictionary()
+        self._ids = itertools.count()
+
+    def __repr__(self):
+        return '<VersionedStore underlying={!r}>'.format(self._underlying)
+
+    def snapshot(self):
+        snapshot_id = next(self._ids)
+        snapshot = StoreSnapshot(self._underlying, lambda: self._snapshots.pop(snapshot_id, None))
+        self._snapshots[snapshot_id] = snapshot
+        return snapshot
+
+    def _preserve(self, key):
+        if not self._snapshots:
+            return
+        old_value = self._underlying.get(key, MISSING)
+        for snapshot in self._snapshots.values():
+            snapshot.preserve(key, old_value)
+
+    def __getitem__(self, key):
+        return self._underlying[key]
+
+    def __contains__(self, key):
+        return key in self._underlying
+
+    def __setitem__(self, key, value):
+        self._preserve(key)
+        self._underlying[key] = value
+
+    def __delitem__(self, key):
+        self._preserve(key)
+        del self._underlying[key]
+
+    def __len__(self):
+        return len(self._underlying)
+
+    def __iter__(self):
+        return iter(self._underlying)
+
+    def key_after_func(self):
+        return treeutils.key_after_func(self._underlying)
+
+    def item_after_func(self):
+        return treeutils.item_after_func(self._underlying)
+
+    def write_batch(self):
+        # Writes made in a batch are not read back until it is written, so
+        #   old values are read correctly
+        return treeutils.write_batch(self._underlying)
+
+    def close(self):
+        self._underlying.close()
+
+
+class StoreSnapshot(collections.MutableMapping):
+    """The keys of `underlying` as they were when created, given the old
+    value (or MISSING) of each key before it is first changed"""
+    def __init__(self, underlying, on_close=None):
+        self._underlying = underlying
+        self._on_close = on_close
+        self._key_after = treeutils.key_after_func(underlying)
+        self._before = {}
+        self._changed = []
+
+    def __repr__(self):
+        return '<StoreSnapshot changed={!r} underlying={!r}>'.format(len(self._changed), self._underlying)
+
+    def preserve(self, key, old_value):
+        if key not in self._before:
+            self._before[key] = old_value
+            bisect.insort(self._changed, key)
+
+    def __getitem__(self, key):
+        value = self._before.get(key, None)
+        if value is None:
+            return self._underlying[key]
+        elif value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, key, value):
+        raise SnapshotReadOnly()
+
+    def __delitem__(self, key):
+        raise SnapshotReadOnly()
+
+    def __iter__(self):
+        key = ''
+        while True:
+            try:
+                key = self.key_after(key)
+            except KeyError:
+                return
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def key_after(self, target_key):
+        # The next key that still exists, unless it was created since the
+        #   snapshot, or the next key that was changed, unless it did not
+        #   exist when the snapshot was taken
+        candidates = []
+        key = self._current_key_after(target_key)
+        if key is not None:
+            candidates.append(key)
+        index = bisect.bisect_right(self._changed, target_key)
+        while index < len(self._changed):
+            if self._before[self._changed[index]] is not MISSING:
+                candidates.append(self._changed[index])
+                break
+            index += 1
+        if not candidates:
+            raise KeyError(target_key)
+        return min(candidates)
+
+    def _current_key_after(self, key):
+        while True:
+            try:
+                if self._key_after is None:
+                    key = min(found for found in self._underlying if found > key)
+                else:
+                    key = self._key_after(key)
+            except (KeyError, ValueError):
+                return None
+            if self._before.get(key, None) is not MISSING:
+                return key
+
+    def item_after(self, target_key):
+        key = self.key_after(target_key)
+        return key, self[key]
+
+    def close(self):
+        if self._on_close is not None:
+            self._on_close()
+        self._before = {}
+        self._changed = []
+
+
+class Snapshot(collections.Mapping):
+    """A read-only view of the top-level dictionary `root` (a
+    `jsdb.flatdict.JsonFlatteningDict` or `jsdb.nodedict.NodeDict`) whose
+    store is the snapshot `store`. Changing it raises `SnapshotReadOnly`."""
+    def __init__(self, root, store):
+        self._root = root
+        self._store = store
+
+    def __repr__(self):
+        return '<Snapshot store={!r}>'.format(self._store)
+
+    def __getitem__(self, key):
+        return self._root[key]
+
+    def __iter__(self):
+        return iter(self._root)
+
+    def __len__(self):
+        return len(self._root)
+
+    def __contains__(self, key):
+        return key in self._root
+
+    def iteritems(self):
+        return self._root.iteritems()
+
+    def itervalues(self):
+        return self._root.itervalues()
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def python_copy(self):
+        return python_copy.copy(self._root)
+
+    def query(self, pattern):
+        "Iterate over the `(path, value)` matches of `pattern` (see `jsdb.Jsdb.query`)"
+        return self._paths_root('Queries').query(query_module.Query(pattern))
+
+    def to_columns(self, list_path, fields, typecodes=None):
+        "See `jsdb.Jsdb.to_columns`"
+        return self._paths_root('Columns').to_columns(_path_tuple(list_path), fields, typecodes)
+
+    def open_string(self, path):
+        "See `jsdb.Jsdb.open_string`"
+        return self._paths_root('String readers').open_string(_path_tuple(path))
+
+    def _paths_root(self, feature):
+        if not isinstance(self._root, flatdict.JsonFlatteningDict):
+            raise ValueError('{} are only supported by the paths layout'.format(feature))
+        return self._root
+
+    def close(self):
+        "Release the snapshot, which should not be read afterwards"
+        self._store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _exc_type, _exc_value, _tb):
+        self.close()
+
+def _path_tuple(path):
+    if isinstance(path, basestring):
+        return (path,)
+    else:
+        return tuple(path)
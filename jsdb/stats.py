@@ -0,0 +1,206 @@
+"""Counters and latency histograms of the work a database does.
+
+`Jsdb(filename, stats=True)` (or `db.enable_stats()`) records:
+
+ * `get`, `set`, `delete`, `commit` and `rollback`: each call to `Jsdb`,
+   including everything below it
+ * `decode` and `encode`: converting values to and from their stored form
+ * `store.get`, `store.put`, `store.delete`, `store.contains`,
+   `store.key_after`, `store.item_after`: each operation on the backend,
+   along with `store.bytes_read` and `store.bytes_written`, and counts of
+   `store.len`, `store.iterate` (keys iterated over) and `store.batch`.
+   These are the operations counted by `jsdb.counting.CountingStore`.
+ * `commit.writes` and `commit.bytes`: the size of each transaction, as
+   the number of keys and bytes written to the backend
+
+What is left of a `get` once its store operations and decoding are taken
+away is spent in Python, flattening paths and building proxies.
+
+The same instrumentation traces the storage calls made by a single access,
+as a list of `StorageCall` (see `Jsdb.explain`), and logs the calls made
+by operations slower than `slow_threshold` (see `Jsdb.log_slow_operations`).
+
+Disabled statistics cost each instrumented method little more than a
+check of `enabled`.
+Counters may be updated by several threads, and each thread traces only
+its own storage calls.
+"""
+
+import collections
+import contextlib
+import threading
+import time
+
+from . import counting
+
+# Latencies are bucketed in microseconds
+LATENCY_SCALE = 1e6
+
+class Histogram(object):
+    """Counts of values in buckets that double in size, the first holding
+    values below 1 / `scale`"""
+    def __init__(self, scale=1):
+        self._scale = scale
+        self.buckets = []
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+
+    def add(self, value):
+        bucket = int(value * self._scale).bit_length()
+        if bucket >= len(self.buckets):
+            self.buckets.extend([0] * (bucket + 1 - len(self.buckets)))
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def upper_bound(self, bucket):
+        "The largest value (exclusive) that falls in `bucket`"
+        return float(1 << bucket) / self._scale
+
+    def percentile(self, fraction):
+        "An upper bound on the value `fraction` of the way through the values added"
+        if not self.count:
+            return None
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= fraction * self.count:
+                return min(self.upper_bound(bucket), self.maximum)
+        return self.maximum
+
+    def summary(self):
+        return dict(
+            count=self.count,
+            total=self.total,
+            mean=self.total / float(self.count) if self.count else None,
+            max=self.maximum,
+            p50=self.percentile(0.5),
+            p90=self.percentile(0.9),
+            p99=self.percentile(0.99),
+            buckets=[(self.upper_bound(bucket), count) for bucket, count in enumerate(self.buckets) if count])
+
+
+StorageCall = collections.namedtuple('StorageCall', 'operation key seconds')
+
+class Stats(object):
+    """Counters and histograms that are updated when `collecting`, and
+    storage calls that are traced during `tracing`. Instrumented code only
+    times anything when `enabled`: when collecting, tracing, or there is a
+    `slow_threshold` (in seconds) for which operations should be logged."""
+    def __init__(self, collecting=False, slow_threshold=None):
+        self.collecting = collecting
+        self.slow_threshold = slow_threshold
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tracing = 0
+        self._update()
+        self.reset()
+
+    @property
+    def trace(self):
+        "The list to which this thread's storage calls are added, if it is tracing"
+        return getattr(self._local, 'trace', None)
+
+    def _update(self):
+        self.enabled = self.collecting or self.slow_threshold is not None or self._tracing > 0
+
+    def collect(self, collecting=True):
+        self.collecting = collecting
+        self._update()
+
+    def log_slow(self, threshold):
+        self.slow_threshold = threshold
+        self._update()
+
+    @contextlib.contextmanager
+    def tracing(self):
+        "Yield a list to which the storage calls made within the context are added"
+        outer = self.trace
+        calls = self._local.trace = []
+        with self._lock:
+            self._tracing += 1
+            self._update()
+        try:
+            yield calls
+        finally:
+            if outer is not None:
+                outer.extend(calls)
+            self._local.trace = outer
+            with self._lock:
+                self._tracing -= 1
+                self._update()
+
+    def reset(self):
+        with self._lock:
+            self.counts = collections.Counter()
+            self.histograms = {}
+
+    def _histogram(self, name, scale):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(scale)
+        return self.histograms[name]
+
+    def record(self, name, seconds):
+        "Count an operation called `name` that took `seconds`"
+        if self.collecting:
+            with self._lock:
+                self.counts[name] += 1
+                self._histogram(name, LATENCY_SCALE).add(seconds)
+
+    def record_size(self, name, size):
+        if self.collecting:
+            with self._lock:
+                self._histogram(name, 1).add(size)
+
+    def add(self, name, amount):
+        if self.collecting:
+            with self._lock:
+                self.counts[name] += amount
+
+    def timed(self, name, function, *args):
+        "Call `function` with `args`, recording how long it took as `name`"
+        start = time.time()
+        try:
+            return function(*args)
+        finally:
+            self.record(name, time.time() - start)
+
+    def storage_call(self, operation, key, function, *args):
+        "Call `function` with `args` to carry out `operation` on `key` in storage"
+        start = time.time()
+        try:
+            return function(*args)
+        finally:
+            seconds = time.time() - start
+            self.record('store.' + operation, seconds)
+            trace = self.trace
+            if trace is not None:
+                trace.append(StorageCall(operation, key, seconds))
+
+    def summary(self):
+        with self._lock:
+            return dict(
+                counts=dict(self.counts),
+                histograms=dict((name, histogram.summary()) for name, histogram in self.histograms.items()))
+
+
+class StatsStore(counting.CountingStore):
+    "Record the operations made on the store `underlying` in `stats` when they are enabled"
+    def __init__(self, underlying, stats): # pylint: disable=super-init-not-called
+        self._underlying = underlying
+        self._stats = stats
+
+    def _call(self, operation, key, function, *args):
+        if not self._stats.enabled:
+            return function(*args)
+        return self._stats.storage_call(operation, key, function, *args)
+
+    def _add(self, name, amount):
+        self._stats.add('store.' + name, amount)
+
+    def __iter__(self):
+        if not self._stats.enabled:
+            return iter(self._underlying)
+        return counting.CountingStore.__iter__(self)
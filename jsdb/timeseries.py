@@ -0,0 +1,255 @@
+"""Append-optimised series of `(time, value)` samples.
+
+Samples are packed into chunks of up to `chunk_size` samples, each stored
+as a single value holding an array of times followed by an array of values
+(little-endian doubles, 16 bytes a sample). Chunk keys sort by the time of
+their first sample:
+
+    !ts."name"                          json metadata
+    !ts."name"@ <sortable time> <seq>   packed chunk
+
+Appending only touches the last chunk, and finding the samples in a time
+range is a binary search over the chunks' first times.
+
+Time series are stored beside the json structure rather than in it, and
+bypass the value codec. Changes are kept in memory until the database is
+committed, and discarded by rollback.
+"""
+
+import array
+import bisect
+import json
+
+from . import codec
+from . import flatpath
+from . import keyformat
+from . import packed
+from . import treeutils
+
+PREFIX = '!ts'
+DEFAULT_CHUNK_SIZE = 256
+
+def _pack(times, values):
+    data = array.array('d', times)
+    data.extend(values)
+    return packed.to_bytes(data)
+
+def _unpack(string):
+    data = packed.from_bytes('d', string)
+    count = len(data) // 2
+    return data[:count], data[count:]
+
+def _mean(values):
+    return sum(values) / float(len(values))
+
+DOWNSAMPLERS = dict(
+    mean=_mean, sum=sum, min=min, max=max, count=len,
+    first=lambda values: values[0], last=lambda values: values[-1])
+
+
+class TimeSeries(object):
+    """The time series `name` stored in `store`. Times must not decrease.
+
+    Use `jsdb.Jsdb.timeseries` rather than creating this directly, so that
+    changes are written when the database is committed.
+    """
+    def __init__(self, store, name, chunk_size=None):
+        self._store = store
+        self.name = name
+        self._prefix = '{}."{}"'.format(PREFIX, flatpath.escape_double_quote(name))
+
+        stored = store.get(self._prefix)
+        if stored is None:
+            if chunk_size is not None and chunk_size <= 0:
+                raise ValueError(chunk_size)
+            self._meta = dict(chunk_size=chunk_size or DEFAULT_CHUNK_SIZE, next_chunk=0, length=0)
+        else:
+            self._meta = json.loads(stored)
+            if chunk_size is not None and chunk_size != self._meta['chunk_size']:
+                raise ValueError('{!r} has chunk size {}'.format(name, self._meta['chunk_size']))
+        self.chunk_size = self._meta['chunk_size']
+        self._reset()
+
+    def __repr__(self):
+        return '<TimeSeries {!r}>'.format(self.name)
+
+    def _reset(self):
+        self._chunks = None
+        self._first_times = None
+        self._written = {}
+        self._deleted = set()
+        self._pending_meta = dict(self._meta)
+        self._changed = False
+
+    def _load_chunks(self):
+        if self._chunks is None:
+            start = self._prefix + '@'
+            self._chunks = list(treeutils.keys_with_prefix(self._store, start))
+            self._first_times = [self._chunk_time(key) for key in self._chunks]
+
+    def _chunk_time(self, key):
+        time, _ = codec.decode_sortable(key, len(self._prefix) + 1)
+        return time
+
+    def _chunk_key(self, time):
+        seq = self._pending_meta['next_chunk']
+        self._pending_meta['next_chunk'] = seq + 1
+        return self._prefix + '@' + codec.encode_sortable(time) + keyformat.encode_int(seq)
+
+    def _read_chunk(self, key):
+        if key in self._written:
+            return self._written[key]
+        return _unpack(self._store[key])
+
+    def _write_chunk(self, index, times, values):
+        "Replace chunk `index` (whose key depends on its first time)"
+        old_key = self._chunks[index]
+        if times[0] == self._first_times[index]:
+            key = old_key
+        else:
+            self._delete_chunk_key(old_key)
+            key = self._chunk_key(times[0])
+            self._chunks[index] = key
+            self._first_times[index] = times[0]
+        self._written[key] = times, values
+        self._deleted.discard(key)
+        self._changed = True
+
+    def _delete_chunk_key(self, key):
+        self._written.pop(key, None)
+        self._deleted.add(key)
+        self._changed = True
+
+    def __len__(self):
+        return self._pending_meta['length']
+
+    def append(self, time, value):
+        self._load_chunks()
+        if not self._chunks:
+            self._new_chunk(time, value)
+            return
+
+        times, values = self._read_chunk(self._chunks[-1])
+        if time < times[-1]:
+            raise ValueError('Time {!r} is before the last sample at {!r}'.format(time, times[-1]))
+
+        if len(times) >= self.chunk_size:
+            self._new_chunk(time, value)
+        else:
+            if self._chunks[-1] not in self._written:
+                times, values = array.array('d', times), array.array('d', values)
+            times.append(time)
+            values.append(value)
+            self._written[self._chunks[-1]] = times, values
+            self._pending_meta['length'] += 1
+            self._changed = True
+
+    def _new_chunk(self, time, value):
+        key = self._chunk_key(time)
+        self._chunks.append(key)
+        self._first_times.append(time)
+        self._written[key] = array.array('d', [time]), array.array('d', [value])
+        self._pending_meta['length'] += 1
+        self._changed = True
+
+    def extend(self, samples):
+        for time, value in samples:
+            self.append(time, value)
+
+    def range(self, start=None, stop=None):
+        "Iterate over the samples with `start <= time < stop`"
+        self._load_chunks()
+        index = 0
+        if start is not None:
+            # The last chunk starting before `start` may contain samples
+            #   at `start` or after
+            index = max(bisect.bisect_left(self._first_times, start) - 1, 0)
+
+        for key, first_time in zip(self._chunks[index:], self._first_times[index:]):
+            if stop is not None and first_time >= stop:
+                return
+            times, values = self._read_chunk(key)
+            for time, value in zip(times, values):
+                if stop is not None and time >= stop:
+                    return
+                if start is None or time >= start:
+                    yield time, value
+
+    def __iter__(self):
+        return self.range()
+
+    def downsample(self, period, start=None, stop=None, how='mean'):
+        """Iterate over `(period_start, value)` summarising the samples in
+        each `period` with `how` (one of `DOWNSAMPLERS`)"""
+        summarise = DOWNSAMPLERS[how]
+        bucket, values = None, []
+        for time, value in self.range(start, stop):
+            time_bucket = (time // period) * period
+            if time_bucket != bucket and values:
+                yield bucket, summarise(values)
+                values = []
+            bucket = time_bucket
+            values.append(value)
+        if values:
+            yield bucket, summarise(values)
+
+    def drop_before(self, time):
+        "Remove the samples before `time`"
+        self._load_chunks()
+        while self._chunks:
+            if len(self._chunks) > 1 and self._first_times[1] < time:
+                # Everything in the first chunk is before the next chunk's first time
+                times, _ = self._read_chunk(self._chunks[0])
+                self._remove_first_chunk(len(times))
+                continue
+
+            times, values = self._read_chunk(self._chunks[0])
+            kept = bisect.bisect_left(times, time)
+            if kept == len(times):
+                self._remove_first_chunk(len(times))
+            elif kept:
+                self._write_chunk(0, array.array('d', times[kept:]), array.array('d', values[kept:]))
+                self._pending_meta['length'] -= kept
+            break
+
+    def _remove_first_chunk(self, count):
+        self._delete_chunk_key(self._chunks.pop(0))
+        self._first_times.pop(0)
+        self._pending_meta['length'] -= count
+
+    def downsample_before(self, time, period, how='mean'):
+        """Replace the samples before `time` with one sample for each `period`
+        (see `downsample`), to keep old data at a lower resolution"""
+        summary = list(self.downsample(period, stop=time, how=how))
+        self.drop_before(time)
+        for index in range(0, len(summary), self.chunk_size):
+            samples = summary[index:index + self.chunk_size]
+            key = self._chunk_key(samples[0][0])
+            position = bisect.bisect_right(self._first_times, samples[0][0])
+            self._chunks.insert(position, key)
+            self._first_times.insert(position, samples[0][0])
+            self._written[key] = (array.array('d', [t for t, _ in samples]),
+                                  array.array('d', [v for _, v in samples]))
+            self._pending_meta['length'] += len(samples)
+            self._changed = True
+
+    def commit(self):
+        "Write pending changes to the store"
+        if not self._changed:
+            return
+        with treeutils.write_batch(self._store):
+            for key in self._deleted:
+                if key in self._store:
+                    del self._store[key]
+            for key, (times, values) in self._written.items():
+                self._store[key] = _pack(times, values)
+            self._store[self._prefix] = json.dumps(self._pending_meta, sort_keys=True)
+
+        self._meta = dict(self._pending_meta)
+        chunks, first_times = self._chunks, self._first_times
+        self._reset()
+        self._chunks, self._first_times = chunks, first_times
+
+    def rollback(self):
+        "Discard pending changes"
+        self._reset()
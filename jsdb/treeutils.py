@@ -1,5 +1,8 @@
 
 import bsddb
+import contextlib
+
+from . import flatpath
 
 def key_after_func(store):
     """
@@ -33,3 +36,128 @@ def key_after_func(store):
 
     else:
         return None
+
+def item_after_func(store):
+    """
+    Get a function to find the key after a given string for a mapping
+    along with its value, from the same position in the store if possible
+    """
+    if hasattr(store, 'item_after_func'):
+        return store.item_after_func()
+    elif hasattr(store, 'item_after'):
+        return store.item_after
+    elif isinstance(store, bsddb._DBWithCursor): # pylint: disable=protected-access
+        def item_after(key):
+            # See key_after_func
+            store.first()
+            following = store.set_location(key)
+            if key == following[0]:
+                return store.next()
+            else:
+                return following
+
+        return item_after
+
+    key_after = key_after_func(store)
+    if key_after is None:
+        return None
+
+    def lookup_item_after(key):
+        found_key = key_after(key)
+        return found_key, store[found_key]
+    return lookup_item_after
+
+def write_batch(store):
+    """Return a context manager within which writes to `store` may be
+    applied together when it exits. Reads made within the context need not
+    see these writes.
+    """
+    if hasattr(store, 'write_batch'):
+        return store.write_batch()
+    else:
+        return _no_batch()
+
+@contextlib.contextmanager
+def _no_batch():
+    yield
+
+def store_header(store, key, name, default):
+    """Return the setting recorded under the header `key` in `store`.
+
+    Empty stores record `name` (or `default`). Stores that have data but no
+    header predate the setting and use `default`.
+    """
+    try:
+        return store[key]
+    except KeyError:
+        pass
+
+    if is_empty(store):
+        store[key] = name or default
+        return name or default
+    else:
+        return default
+
+def is_empty(store):
+    "Does `store` contain no data (ignoring headers)"
+    for key in store:
+        if not key.startswith(flatpath.META_PREFIX):
+            return False
+    return True
+
+def keys_between(store, start, stop):
+    """Iterate in order over the keys of `store` strictly between `start`
+    and `stop`. Keys that have been yielded may be deleted during iteration."""
+    key_after = key_after_func(store)
+    if key_after is None:
+        for key in sorted(key for key in store if start < key < stop):
+            yield key
+        return
+
+    key = start
+    while True:
+        try:
+            key = key_after(key)
+        except KeyError:
+            return
+        if key >= stop:
+            return
+        yield key
+
+def keys_with_prefix(store, prefix):
+    """Iterate in order over the keys of `store` after `prefix` that start
+    with it. Keys that have been yielded may be deleted during iteration.
+
+    Unlike a range ending in a high byte this stops at the end of a subtree
+    whatever the key format, since binary keys prefix names with their length."""
+    key_after = key_after_func(store)
+    if key_after is None:
+        for key in sorted(key for key in store if key > prefix and key.startswith(prefix)):
+            yield key
+        return
+
+    key = prefix
+    while True:
+        try:
+            key = key_after(key)
+        except KeyError:
+            return
+        if not key.startswith(prefix):
+            return
+        yield key
+
+def ordered_items(store):
+    "Iterate in order over the items of `store`, reading each value with its key if possible"
+    item_after = item_after_func(store)
+    if item_after is None:
+        for key in sorted(store):
+            yield key, store[key]
+        return
+
+    key = ''
+    while True:
+        try:
+            key, value = item_after(key)
+        except KeyError:
+            return
+        yield key, value
@@ -21,5 +21,5 @@ setup(
         "Development Status :: 3 - Alpha",
         "License :: OSI Approved :: BSD License"
     ],
-    packages=['jsdb']
+    packages=['jsdb', 'jsdb.benchmarks']
 )
@@ -0,0 +1,107 @@
+import contextlib
+import unittest
+
+from jsdb.derived import DerivedDict
+from jsdb.flatdict import JsonFlatteningDict
+from jsdb.jsdb import JsonEncodeDict
+
+from testutils import FakeOrderedDict
+
+class BatchingDict(FakeOrderedDict):
+    "Like leveldb, writes made in a batch are not visible until it ends"
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self._batch = None
+
+    def __setitem__(self, key, value):
+        if self._batch is None:
+            FakeOrderedDict.__setitem__(self, key, value)
+        else:
+            self._batch.append((key, value))
+
+    def __delitem__(self, key):
+        if self._batch is None:
+            FakeOrderedDict.__delitem__(self, key)
+        else:
+            self._batch.append((key, None))
+
+    @contextlib.contextmanager
+    def write_batch(self):
+        self._batch = []
+        yield
+        batch, self._batch = self._batch, None
+        for key, value in batch:
+            if value is None:
+                self.pop(key, None)
+            else:
+                self[key] = value
+
+
+class TestAggregate(unittest.TestCase):
+    def setUp(self):
+        self.derived = DerivedDict(JsonEncodeDict(BatchingDict()))
+        self.d = JsonFlatteningDict(self.derived)
+
+    def test_aggregate(self):
+        self.derived.create_aggregate('latency', 'requests[*].ms', buckets=[10, 100])
+        self.d['requests'] = [dict(ms=ms) for ms in [5, 50, 500, 50]]
+        values = self.derived.aggregate('latency')
+        self.assertEquals((values.count, values.sum, values.min, values.max), (4, 605, 5, 500))
+        self.assertEquals(values.histogram, [1, 2, 1])
+
+    def test_updates(self):
+        self.derived.create_aggregate('latency', 'requests[*].ms')
+        self.d['requests'] = [dict(ms=ms) for ms in [5, 50, 500, 50]]
+
+        del self.d['requests'][2]
+        values = self.derived.aggregate('latency')
+        self.assertEquals((values.count, values.sum, values.max), (3, 105, 50))
+
+        self.d['requests'][0]['ms'] = 1.5
+        self.d['requests'].append(dict(ms='not a number'))
+        values = self.derived.aggregate('latency')
+        self.assertEquals((values.count, values.sum, values.min), (3, 101.5, 1.5))
+        self.assertEquals(values.histogram, None)
+
+        del self.d['requests']
+        self.assertEquals(self.derived.aggregate('latency'), (0, 0, None, None, None))
+
+    def test_exact_sum(self):
+        self.derived.create_aggregate('n', 'values[*]')
+        self.d['values'] = [1e16] + [1.0] * 10 + [2 ** 70, 0.1, 0.2]
+        self.assertEquals(self.derived.aggregate('n').sum, float(2 ** 70 + 10 ** 16 + 10))
+        del self.d['values'][0]
+        del self.d['values'][-3]
+        self.assertEquals(self.derived.aggregate('n').sum, 10.3)
+        self.d['values'].append(float('inf'))
+        self.assertEquals(self.derived.aggregate('n').sum, float('inf'))
+        self.d['values'][12] = 0.7
+        self.assertEquals(self.derived.aggregate('n').sum, 11.0)
+
+    def test_existing_data(self):
+        self.d['stats'] = dict(a=dict(n=3), b=dict(n=4))
+        self.derived.create_aggregate('n', 'stats.*.n')
+        self.assertEquals(self.derived.aggregate('n').sum, 7)
+
+    def test_definitions_stored(self):
+        self.derived.create_aggregate('n', 'values[*]', buckets=[0])
+        reopened = DerivedDict(JsonEncodeDict(self.derived._underlying._underlying))
+        self.assertEquals(reopened.aggregate_names(), ['n'])
+        JsonFlatteningDict(reopened)['values'] = [-1, 1, 2]
+        self.assertEquals(reopened.aggregate('n').histogram, [1, 2])
+
+    def test_drop(self):
+        self.derived.create_aggregate('n', 'values[*]')
+        self.d['values'] = [1, 2]
+        self.derived.drop_aggregate('n')
+        with self.assertRaises(KeyError):
+            self.derived.aggregate('n')
+        self.assertEquals([key for key in self.derived if key.startswith('!aggregate.')], [])
+
+    def test_bad_buckets(self):
+        with self.assertRaises(ValueError):
+            self.derived.create_aggregate('n', 'values[*]', buckets=[2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from jsdb import analysis, keyformat
+from jsdb.jsdb import Jsdb
+
+from testutils import FakeOrderedDict
+
+class TestAnalysis(unittest.TestCase):
+    def make_store(self, key_format=None):
+        store = FakeOrderedDict()
+        db = Jsdb('unused', storage_class=lambda _filename: store, key_format=key_format)
+        db['records'] = [dict(id=i, tags=['t'] * i) for i in range(5)]
+        db['config'] = dict(a=1, empty={})
+        db['scalar'] = 'value'
+        db.commit()
+        return store
+
+    def test_analyse(self):
+        for key_format in keyformat.FORMATS:
+            store = self.make_store(key_format)
+            report = analysis.analyse(store, depth=2, top=2)
+
+            self.assertEquals(report['keys'] + report['meta_keys'], len(store))
+            self.assertEquals(report['key_bytes'] + report['value_bytes'] + report['meta_bytes'],
+                              sum(len(key) + len(value) for key, value in store.items()))
+            self.assertEquals([subtree['path'] for subtree in report['subtrees'][1]], [['records'], ['config']])
+            self.assertEquals([subtree['path'] for subtree in report['subtrees'][2]], [['records', 4], ['records', 3]])
+            records = report['subtrees'][1][0]
+            prefix = '."records"' if key_format == keyformat.TEXT else keyformat.encode_key('."records"')
+            self.assertEquals(records['keys'], len([key for key in store if key.startswith(prefix)]))
+
+            self.assertEquals(report['largest_lists'], [
+                dict(path=['records'], length=5), dict(path=['records', 4, 'tags'], length=4)])
+            # Ties go to the container scanned first
+            self.assertEquals(report['largest_dicts'][0], dict(path=['config'], length=2))
+            self.assertEquals(dict(report['value_depths']), {1: 1, 2: 1, 3: 5, 4: 10})
+            # Empty containers, dictionaries of two entries and so on
+            self.assertEquals(dict(report['fanout'])[1], 2)
+
+            text = analysis.to_text(report)
+            self.assertTrue('records[4].tags' in text)
+            self.assertTrue('"key_overhead"' in analysis.to_json(report))
+
+    def test_empty(self):
+        report = analysis.analyse(FakeOrderedDict())
+        self.assertEquals(report['keys'], 0)
+        self.assertEquals(report['key_overhead'], None)
+        analysis.to_text(report)
@@ -0,0 +1,129 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from jsdb import Jsdb
+from jsdb import background
+from jsdb.background import BackgroundClosed, BackgroundJsdb
+
+class CountingJsdb(Jsdb):
+    def __init__(self, *args, **kwargs):
+        Jsdb.__init__(self, *args, **kwargs)
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+        Jsdb.commit(self)
+
+class TestBackground(unittest.TestCase):
+    def setUp(self):
+        self.direc = tempfile.mkdtemp()
+        self._filename = os.path.join(self.direc, 'file.jsdb')
+
+    def tearDown(self):
+        shutil.rmtree(self.direc)
+
+    def test_requests(self):
+        db = BackgroundJsdb(Jsdb(self._filename))
+        value = dict(b=[1, 2])
+        db.set_path('a', value)
+        value['b'].append(3)
+        db.set_path(('a', 'c'), 'd')
+        self.assertEquals(db.get_path(('a', 'b', 1)).result(), 2)
+        self.assertEquals(db.get_many(['a', ('a', 'c')]).result(), [dict(b=[1, 2], c='d'), 'd'])
+        self.assertEquals(sorted(db.iterate('a').result()), [('b', [1, 2]), ('c', 'd')])
+
+        with self.assertRaises(KeyError):
+            db.get_path('missing').result()
+        self.assertTrue(isinstance(db.get_many(['a', 'missing']).exception(), KeyError))
+
+        db.commit().result()
+        db.delete_path(('a', 'c'))
+        db.commit().result()
+        db.close().result()
+        with self.assertRaises(BackgroundClosed):
+            db.get_path('a')
+
+        reopened = Jsdb(self._filename)
+        self.assertEquals(reopened['a']['b'][1], 2)
+        self.assertFalse('c' in reopened['a'])
+        reopened.close()
+
+    def test_group_commit(self):
+        underlying = CountingJsdb(self._filename)
+        db = BackgroundJsdb(underlying)
+
+        # Hold up the worker so that requests queue
+        started = threading.Event()
+        release = threading.Event()
+        def block(_future):
+            started.set()
+            release.wait(5)
+        db.get_path('missing').add_done_callback(block)
+        started.wait(5)
+
+        commits = []
+        for i in range(10):
+            db.set_path(str(i), i)
+            commits.append(db.commit())
+        done = []
+        commits[0].add_done_callback(done.append)
+        release.set()
+
+        for commit in commits:
+            commit.result(5)
+        self.assertEquals(underlying.commits, 1)
+        self.assertEquals(done, [commits[0]])
+        db.close().result(5)
+
+    def test_raising_callback(self):
+        logged = []
+        class Handler(logging.Handler):
+            def emit(self, record):
+                logged.append(record)
+        handler = Handler()
+        background.LOGGER.addHandler(handler)
+        background.LOGGER.propagate = False
+        try:
+            db = BackgroundJsdb(Jsdb(self._filename))
+            def fail(_future):
+                raise Exception('callback failed')
+            db.set_path('a', 1).add_done_callback(fail)
+            future = db.get_path('a')
+            self.assertEquals(future.result(5), 1)
+            # Called straight away
+            future.add_done_callback(fail)
+
+            # The worker carries on
+            self.assertEquals(db.get_path('a').result(5), 1)
+            db.close().result(5)
+            self.assertEquals(len(logged), 2)
+        finally:
+            background.LOGGER.removeHandler(handler)
+            background.LOGGER.propagate = True
+
+    def test_shared_lookups(self):
+        db = BackgroundJsdb(Jsdb(self._filename))
+        db.set_path('a', dict(b=[1, 2]))
+
+        started = threading.Event()
+        release = threading.Event()
+        def block(_future):
+            started.set()
+            release.wait(5)
+        db.get_path('missing').add_done_callback(block)
+        started.wait(5)
+
+        # Looked up once, between the same writes
+        gets = [db.get_path('a') for _ in range(2)]
+        iterations = [db.iterate('a') for _ in range(2)]
+        release.set()
+
+        gets[0].result(5)['b'].append(3)
+        iterations[0].result(5)[0][1].append(3)
+        self.assertEquals(gets[1].result(5), dict(b=[1, 2]))
+        self.assertEquals(iterations[1].result(5), [('b', [1, 2])])
+        db.close().result(5)
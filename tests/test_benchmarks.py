@@ -0,0 +1,43 @@
+import unittest
+
+from jsdb.benchmarks import suite
+from jsdb.memorystore import MemoryStore
+
+class TestBenchmarks(unittest.TestCase):
+    def test_run(self):
+        backends = [('memory', MemoryStore)]
+        results = suite.run([10, 20], [1, 2], backends, repeat=3)
+        self.assertEquals(len(results), 2 * 2 * len(suite.OPERATIONS))
+        self.assertEquals(set(result.operation for result in results), set(suite.OPERATIONS))
+        iterate = [result for result in results if result.operation == 'iterate'][0]
+        self.assertEquals(iterate.count, 3)
+        self.assertTrue(iterate.p50 <= iterate.p99)
+
+        self.assertEquals(suite.loads(suite.dumps(results)), results)
+        self.assertEquals(len(suite.growth(results)), 2 * len(suite.OPERATIONS))
+
+    def test_memory_store(self):
+        store = MemoryStore()
+        store['b'] = 1
+        store['a'] = 2
+        store['c'] = 3
+        del store['b']
+        self.assertEquals(list(store), ['a', 'c'])
+        self.assertEquals(store.item_after('a'), ('c', 3))
+        with self.assertRaises(KeyError):
+            store.key_after('c')
+
+    def test_growth(self):
+        results = [result(100, 0.001), result(10000, 0.1)]
+        self.assertAlmostEquals(suite.growth(results)['memory', 'get', 1], 1.0)
+        self.assertEquals(suite.check_growth(results)[0][0], ('memory', 'get', 1))
+        self.assertEquals(suite.check_growth([result(100, 0.001), result(10000, 0.001)]), [])
+
+    def test_compare(self):
+        old = [result(100, 0.001), result(1000, 0.002)]
+        new = [result(100, 0.0011), result(1000, 0.004)]
+        self.assertEquals(suite.compare(old, new), [(old[1], new[1])])
+        self.assertEquals(suite.compare(old, new, tolerance=2), [])
+
+def result(size, p50):
+    return suite.Result('memory', 'get', size, 1, 10, 1 / p50, p50, p50, p50, p50)
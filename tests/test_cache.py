@@ -0,0 +1,92 @@
+import unittest
+
+from jsdb.cache import LruCacheDict
+from jsdb.flatdict import JsonFlatteningDict
+from jsdb.jsdb import JsonEncodeDict
+
+from testutils import FakeOrderedDict
+
+class CountingDict(FakeOrderedDict):
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return FakeOrderedDict.__getitem__(self, key)
+
+
+class TestCache(unittest.TestCase):
+    def test_repeated_reads(self):
+        under = CountingDict()
+        under['a'] = 1
+        cache = LruCacheDict(under, 10)
+        self.assertEquals(cache['a'], 1)
+        self.assertEquals(cache['a'], 1)
+        self.assertEquals(under.reads, 1)
+        self.assertEquals(cache.cache_info().hits, 1)
+        self.assertEquals(cache.cache_info().misses, 1)
+
+    def test_missing_cached(self):
+        under = CountingDict()
+        cache = LruCacheDict(under, 10)
+        self.assertFalse('a' in cache)
+        self.assertFalse('a' in cache)
+        self.assertEquals(under.reads, 1)
+
+    def test_write_invalidates(self):
+        under = CountingDict()
+        cache = LruCacheDict(under, 10)
+        self.assertFalse('a' in cache)
+        cache['a'] = 1
+        self.assertEquals(cache['a'], 1)
+        cache['a'] = 2
+        self.assertEquals(cache['a'], 2)
+        del cache['a']
+        self.assertFalse('a' in cache)
+        with self.assertRaises(KeyError):
+            del cache['a']
+
+    def test_eviction(self):
+        under = CountingDict()
+        cache = LruCacheDict(under, 2)
+        for key in 'abc':
+            cache[key] = key
+            cache[key]
+        cache['c']
+        self.assertEquals(cache.cache_info().currsize, 2)
+        reads = under.reads
+        cache['a']
+        self.assertEquals(under.reads, reads + 1)
+
+    def test_flattening(self):
+        under = CountingDict()
+        d = JsonFlatteningDict(LruCacheDict(under, 100))
+        d['config'] = dict(nested=dict(value=1))
+        self.assertEquals(d['config']['nested']['value'], 1)
+        reads = under.reads
+        self.assertEquals(d['config']['nested']['value'], 1)
+        self.assertEquals(under.reads, reads)
+
+        del d['config']['nested']
+        self.assertFalse('nested' in d['config'])
+        self.assertEquals(list(d['config']), [])
+
+    def test_large_strings_not_cached(self):
+        under = CountingDict()
+        cache = LruCacheDict(JsonEncodeDict(under, large_string_threshold=10), 100)
+        cache['."log"='] = 'x' * 100
+        cache['."name"='] = 'short'
+        self.assertEquals(cache['."log"='], 'x' * 100)
+        self.assertEquals(cache['."name"='], 'short')
+        self.assertEquals(cache.cache_info().currsize, 1)
+
+        reads = under.reads
+        self.assertEquals(cache['."name"='], 'short')
+        self.assertEquals(under.reads, reads)
+        self.assertEquals(cache['."log"='], 'x' * 100)
+        self.assertTrue(under.reads > reads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from jsdb import codec
+from jsdb.flatdict import JsonFlatteningDict
+from jsdb.jsdb import JsonEncodeDict
+
+from testutils import FakeOrderedDict
+
+class TestCodec(unittest.TestCase):
+    VALUES = [None, True, False, 0, 1, 127, 128, -1, 2 ** 62, -2 ** 62, 1.5, -0.25,
+              2 ** 63 - 1, -2 ** 63, 2 ** 63, -2 ** 63 - 1, 2 ** 70, -2 ** 70,
+              u'', u'hello', u'caf\xe9', 'bytes']
+
+    def test_round_trip(self):
+        for name, value_codec in codec.CODECS.items():
+            for value in self.VALUES:
+                decoded = value_codec.decode(value_codec.encode(value))
+                self.assertEquals(decoded, value, (name, value))
+                self.assertEquals(type(decoded) is bool, type(value) is bool)
+
+    def test_binary_is_compact(self):
+        binary = codec.BinaryCodec()
+        self.assertEquals(len(binary.encode(True)), 1)
+        self.assertEquals(len(binary.encode(None)), 1)
+        self.assertEquals(len(binary.encode(17)), 1)
+        self.assertEquals(len(binary.encode(1000)), 9)
+        self.assertEquals(len(binary.encode(-2 ** 63)), 9)
+        self.assertEquals(binary.encode(2 ** 63), binary.BIG_INT + '9223372036854775808')
+        self.assertEquals(binary.decode(binary.encode('hello')), u'hello')
+
+    def test_binary_rejects(self):
+        binary = codec.BinaryCodec()
+        with self.assertRaises(ValueError):
+            binary.encode([])
+        with self.assertRaises(UnicodeDecodeError):
+            binary.encode('\xff')
+
+    def test_sortable(self):
+        values = [None, False, True, -1e10, -3, -0.5, 0, 0.5, 1, 2 ** 40,
+                  u'', u'a', u'a\x00', u'a\x00b', u'ab', u'b', u'caf\xe9']
+        encoded = [codec.encode_sortable(value) for value in values]
+        self.assertEquals(sorted(encoded), encoded)
+        for value, string in zip(values, encoded):
+            self.assertEquals(codec.decode_sortable(string + 'rest'), (value, len(string)))
+        self.assertEquals(codec.encode_sortable(-0.0), codec.encode_sortable(0))
+        self.assertEquals(codec.encode_sortable('x'), codec.encode_sortable(u'x'))
+
+    def test_sortable_large_integers(self):
+        values = [-2 ** 70 - 1, -2 ** 70, -2.0 ** 60, -2 ** 53 - 1, -2 ** 53, -1e10, 0,
+                  2 ** 53, 2 ** 53 + 1, 2 ** 53 + 2, 2 ** 53 + 3, 2.0 ** 60, 2 ** 60 + 1,
+                  2 ** 70 - 1, 2 ** 70, 2 ** 70 + 1, 10 ** 300 + 1, 1e300, float('inf'), u'']
+        encoded = [codec.encode_sortable(value) for value in values]
+        self.assertEquals(sorted(encoded), encoded)
+        self.assertEquals(len(set(encoded)), len(encoded))
+        for value, string in zip(values, encoded):
+            decoded, end = codec.decode_sortable(string + 'rest')
+            self.assertEquals((decoded, end), (value, len(string)))
+        self.assertEquals(codec.encode_sortable(2.0 ** 60), codec.encode_sortable(2 ** 60))
+        with self.assertRaises(ValueError):
+            codec.encode_sortable(10 ** 400)
+
+    def test_header(self):
+        store = FakeOrderedDict()
+        self.assertEquals(codec.store_codec(store, 'binary').name, 'binary')
+        self.assertEquals(store[codec.HEADER_KEY], 'binary')
+        self.assertEquals(codec.store_codec(store).name, 'binary')
+        with self.assertRaises(codec.CodecMismatch):
+            codec.store_codec(store, 'json')
+
+    def test_legacy_store(self):
+        store = FakeOrderedDict()
+        store['#'] = '0'
+        self.assertEquals(codec.store_codec(store).name, 'json')
+        self.assertFalse(codec.HEADER_KEY in store)
+        with self.assertRaises(codec.CodecMismatch):
+            codec.store_codec(store, 'binary')
+
+    def test_flattening(self):
+        store = FakeOrderedDict()
+        d = JsonFlatteningDict(JsonEncodeDict(store, codec.store_codec(store, 'binary')))
+        d['a'] = dict(b=[1, 2.5, u'three', None])
+        self.assertEquals(list(d['a']['b']), [1, 2.5, u'three', None])
+        self.assertEquals(list(d), ['a'])
+        self.assertEquals(store['."a".'], codec.BinaryCodec.TRUE)
+
+    def test_unordered_header(self):
+        store = dict()
+        d = JsonFlatteningDict(JsonEncodeDict(store, codec.store_codec(store, 'binary')))
+        d['a'] = 1
+        self.assertEquals(list(d), ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from jsdb.columns import Column
+from jsdb.flatdict import JsonFlatteningDict
+
+from testutils import FakeOrderedDict
+
+class CountingDict(FakeOrderedDict):
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return FakeOrderedDict.__getitem__(self, key)
+
+
+class TestColumns(unittest.TestCase):
+    def setUp(self):
+        self.under = CountingDict()
+        self.d = JsonFlatteningDict(self.under)
+        self.d['events'] = [dict(ts=i, value=i * 0.5, name='e{}'.format(i), meta=dict(host='h{}'.format(i % 2)))
+                            for i in range(12)]
+
+    def test_columns(self):
+        columns = self.d.to_columns(('events',), ['ts', 'value'])
+        self.assertEquals(sorted(columns), ['ts', 'value'])
+        self.assertTrue(isinstance(columns['ts'], Column))
+        self.assertEquals(columns['ts'].values.tolist(), [float(i) for i in range(12)])
+        self.assertEquals(columns['value'].values.tolist(), [i * 0.5 for i in range(12)])
+        self.assertEquals(columns['value'].missing.tolist(), [0] * 12)
+
+    def test_row_order(self):
+        # Text keys sort [10] before [2]
+        columns = self.d.to_columns(('events',), ['ts'], dict(ts='l'))
+        self.assertEquals(columns['ts'].values.tolist(), range(12))
+
+    def test_missing(self):
+        del self.d['events'][3]['value']
+        self.d['events'][5]['value'] = None
+        column = self.d.to_columns(('events',), ['value'])['value']
+        self.assertEquals([i for i, missing in enumerate(column.missing) if missing], [3, 5])
+        self.assertEquals(column.values[3], 0)
+
+    def test_nested_and_objects(self):
+        columns = self.d.to_columns(('events',), [('meta', 'host'), 'name'], {('meta', 'host'): 'O', 'name': 'O'})
+        self.assertEquals(columns[('meta', 'host')].values[:3], ['h0', 'h1', 'h0'])
+        self.assertEquals(columns['name'].values[11], 'e11')
+
+    def test_reads(self):
+        reads = self.under.reads
+        self.d.to_columns(('events',), ['ts'])
+        # Only the values of the field are read
+        self.assertEquals(self.under.reads - reads, 12)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.d.to_columns(('events',), ['name'])
+        with self.assertRaises(KeyError):
+            self.d.to_columns(('missing',), ['ts'])
+        self.d['empty'] = []
+        self.assertEquals(len(self.d.to_columns(('empty',), ['ts'])['ts'].values), 0)
@@ -0,0 +1,128 @@
+"Check how the number of store operations made by each operation grows"
+
+import collections
+import unittest
+
+from jsdb import counting, keyformat
+from jsdb.jsdb import Jsdb
+from jsdb.memorystore import MemoryStore
+
+def probes(counts):
+    "The number of store operations in `counts`"
+    return sum(counts[name] for name in counting.OPERATIONS)
+
+def operations(counts):
+    "The number of each kind of store operation in `counts`, ignoring bytes"
+    return dict((name, counts[name]) for name in counting.OPERATIONS)
+
+class TestComplexity(unittest.TestCase):
+    key_format = None
+
+    def make_db(self, size, length=10, depth=1):
+        "A database of `size` unrelated keys and a dictionary and list of `length` entries `depth` deep"
+        self.counts = collections.Counter()
+        self.depth = depth
+        db = Jsdb('memory', storage_class=counting.counting_storage(MemoryStore, self.counts), key_format=self.key_format)
+        db['other'] = dict(('o{}'.format(i), i) for i in range(size))
+        node = dict(items=dict(('k{}'.format(i), i) for i in range(length)), list=range(length),
+                    records=[dict(x=i) for i in range(length)])
+        for _ in range(depth - 1):
+            node = dict(child=node)
+        db['root'] = node
+        db.commit()
+        return db
+
+    def leaf(self, db):
+        node = db['root']
+        for _ in range(self.depth - 1):
+            node = node['child']
+        return node
+
+    def measure(self, operation, size=10, length=10, depth=1):
+        db = self.make_db(size, length, depth)
+        with counting.measure(self.counts) as counts:
+            operation(db, self.leaf)
+        return counts
+
+    def assertConstant(self, operation, count=operations, **kwargs):
+        "The operation's counts do not depend on the varied argument"
+        (name, values), = kwargs.items()
+        results = [count(self.measure(operation, **{name: value})) for value in values]
+        for result in results[1:]:
+            self.assertEquals(result, results[0])
+
+    def assertLinear(self, operation, name, count=probes):
+        "The operation's count grows linearly with the argument `name`"
+        small, medium, large = [count(self.measure(operation, **{name: value})) for value in (10, 20, 40)]
+        self.assertTrue(medium > small)
+        self.assertEquals(large - medium, 2 * (medium - small))
+
+    def test_lookup(self):
+        lookup = lambda db, leaf: leaf(db)['items']['k1']
+        self.assertConstant(lookup, size=[10, 100, 1000])
+        self.assertConstant(lookup, length=[10, 100, 1000])
+        self.assertLinear(lookup, 'depth')
+
+    def test_iteration(self):
+        iterate = lambda db, leaf: list(leaf(db)['items'].iteritems())
+        self.assertConstant(iterate, size=[10, 100, 1000])
+        self.assertLinear(iterate, 'length')
+        # Values come with their keys: only finding the dictionary uses lookups
+        self.assertConstant(iterate, count=lambda counts: counts['get'], length=[10, 100, 1000])
+        self.assertEquals(self.measure(iterate, length=40)['item_after'], 41)
+
+    def test_dict_changes(self):
+        def set_value(db, leaf):
+            leaf(db)['items']['k1'] = 'changed'
+            db.commit()
+        def delete(db, leaf):
+            del leaf(db)['items']['k1']
+            db.commit()
+        def rollback(db, leaf):
+            leaf(db)['items']['k1'] = 'changed'
+            db.rollback()
+
+        for operation in (set_value, delete, rollback):
+            self.assertConstant(operation, size=[10, 100, 1000])
+            self.assertConstant(operation, length=[10, 100, 1000])
+
+        self.assertEquals(self.measure(rollback)['put'], 0)
+
+    def test_list_changes(self):
+        def append(db, leaf):
+            leaf(db)['list'].append(1)
+            db.commit()
+        def delete(db, leaf):
+            del leaf(db)['list'][0]
+            db.commit()
+
+        self.assertConstant(append, size=[10, 100, 1000])
+        # Changing a list reads all of it, but appending only writes the new entry
+        self.assertLinear(append, 'length', count=lambda counts: counts['get'])
+        self.assertEquals(self.measure(append, length=10)['put'], self.measure(append, length=1000)['put'])
+
+        # Deleting the first entry shifts the others
+        self.assertLinear(delete, 'length', count=lambda counts: counts['put'])
+
+    def test_scans(self):
+        # Scans of a subtree stop at its end rather than reading its siblings
+        query = lambda db, leaf: list(db.query('root.items.*'))
+        columns = lambda db, leaf: db.to_columns(['root', 'records'], ['x'])
+        index = lambda db, leaf: db.create_index('items', 'root.items.*')
+        for operation in (query, columns, index):
+            self.assertConstant(operation, size=[10, 100, 1000])
+
+    def test_counting_store(self):
+        counts = collections.Counter()
+        store = counting.CountingStore(MemoryStore(), counts)
+        with counting.measure(counts) as measured:
+            store['a'] = 'xyz'
+            store['a']
+            'b' in store
+            store.key_after_func()('')
+        self.assertEquals(measured, collections.Counter(
+            put=1, get=1, contains=1, key_after=1, bytes_written=4, bytes_read=5))
+
+
+class TestBinaryKeyComplexity(TestComplexity):
+    key_format = keyformat.BINARY
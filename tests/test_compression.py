@@ -0,0 +1,81 @@
+import unittest
+
+from jsdb import codec, compression
+from jsdb.benchmarks import compression as compression_benchmark
+from jsdb.flatdict import JsonFlatteningDict
+from jsdb.jsdb import JsonEncodeDict
+
+from testutils import FakeOrderedDict
+
+MESSAGES = ['Request completed successfully after retrying the upstream connection {}',
+            'Cache miss for product listing, falling back to the primary database {}']
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.under = FakeOrderedDict()
+        self.values = [MESSAGES[i % 2].format(i) for i in range(50)]
+
+    def open(self, threshold=None):
+        value_codec = compression.store_compression(self.under, codec.CODECS['json'], threshold)
+        return JsonFlatteningDict(JsonEncodeDict(self.under, value_codec))
+
+    def stored_bytes(self):
+        return sum(len(self.under[key]) for key in self.under if key.endswith('='))
+
+    def test_compressor(self):
+        compressor = compression.Compressor('the quick brown fox')
+        compressed = compressor.compress('the quick brown fox jumps')
+        self.assertTrue(len(compressed) < 15)
+        self.assertEquals(compressor.decompress(compressed), 'the quick brown fox jumps')
+        self.assertEquals(compressor.decompress(compressor.compress('')), '')
+
+    def test_threshold(self):
+        d = self.open(threshold=40)
+        d['short'] = 'x' * 10
+        d['long'] = 'x' * 100
+        self.assertEquals(self.under['."short"='], '"{}"'.format('x' * 10))
+        self.assertEquals(self.under['."long"='][0], compression.FLAG)
+        self.assertEquals(d['long'], 'x' * 100)
+        # Values that do not get shorter are stored as they are
+        d['random'] = '3a9f0c71b2e8d4569a0b1c2d3e4f5a6b7c8d9e0f1'
+        self.assertEquals(self.under['."random"='][0], '"')
+
+    def test_dictionary(self):
+        d = self.open()
+        d['values'] = self.values
+        uncompressed = self.stored_bytes()
+
+        dictionary = compression.train(compression.sample_values(self.under, 100))
+        self.assertTrue(MESSAGES[0][:-3] in dictionary)
+        self.assertEquals(compression.add_dictionary(self.under, dictionary, threshold=20), 1)
+
+        d = self.open()
+        d['values'] = self.values
+        self.assertTrue(self.stored_bytes() < uncompressed / 3)
+        self.assertEquals(list(d['values']), self.values)
+
+    def test_mixed(self):
+        d = self.open()
+        d['old'] = self.values[0]
+        compression.add_dictionary(self.under, MESSAGES[0], threshold=20)
+        d = self.open()
+        d['new'] = self.values[2]
+        compression.add_dictionary(self.under, MESSAGES[1], threshold=20)
+
+        d = self.open()
+        self.assertEquals(self.under['."new"='][:2], compression.FLAG + '\x01')
+        self.assertEquals(d['old'], self.values[0])
+        self.assertEquals(d['new'], self.values[2])
+
+    def test_sample_values(self):
+        d = self.open()
+        d['values'] = self.values
+        samples = compression.sample_values(self.under, 10)
+        self.assertEquals(len(samples), 10)
+        self.assertEquals(len(set(samples)), 10)
+
+    def test_benchmark(self):
+        results = compression_benchmark.run(200, compression_benchmark.backends()[:1])
+        self.assertEquals([result.mode for result in results], list(compression_benchmark.MODES))
+        by_mode = {result.mode: result for result in results}
+        self.assertTrue(by_mode['dictionary'].disk_bytes <= by_mode['none'].disk_bytes)
@@ -1,10 +1,45 @@
 import unittest
 
-from jsdb.flatdict import JsonFlatteningDict
+import array
+
+from jsdb.flatdict import JsonFlatteningDict, JsonFlatteningList
+from jsdb.packed import PackedArray
 from jsdb import python_copy
 
 from testutils import FakeOrderedDict
 
+class ItemAfterDict(FakeOrderedDict):
+    "Counts reads other than those made by `item_after`"
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return FakeOrderedDict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        self.reads += 1
+        return FakeOrderedDict.__contains__(self, key)
+
+    def item_after(self, target_key):
+        key = self.key_after(target_key)
+        return key, FakeOrderedDict.__getitem__(self, key)
+
+class WriteCountingDict(FakeOrderedDict):
+    "Records the keys that are written or deleted"
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.written = []
+
+    def __setitem__(self, key, value):
+        self.written.append(key)
+        FakeOrderedDict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.written.append(key)
+        FakeOrderedDict.__delitem__(self, key)
+
 class TestFlatDict(unittest.TestCase):
     def test_setting(self):
         d = JsonFlatteningDict(FakeOrderedDict())
@@ -70,6 +105,89 @@ class TestFlatDict(unittest.TestCase):
         d['a']['bat'] = 2
         self.assertEquals(set(d['a'].keys()), set(['bat', 'b']))
 
+    def test_iteritems(self):
+        under = ItemAfterDict()
+        d = JsonFlatteningDict(under)
+        d['a'] = dict(('k{}'.format(i), i) for i in range(20))
+        d['a']['nested'] = dict(x=1)
+        d['a']['list'] = [1, 2]
+        d['a']['packed'] = array.array('d', [1.5])
+
+        a = d['a']
+        reads = under.reads
+        items = dict(a.iteritems())
+        self.assertEquals(under.reads - reads, 0)
+        self.assertEquals(len(items), 23)
+        self.assertEquals(items['k7'], 7)
+        self.assertTrue(isinstance(items['nested'], JsonFlatteningDict))
+        self.assertTrue(isinstance(items['list'], JsonFlatteningList))
+        self.assertTrue(isinstance(items['packed'], PackedArray))
+        self.assertEquals(python_copy.copy(d), dict(a=python_copy.copy(dict(d['a'].items()))))
+        self.assertEquals(sorted(d['a'].values())[:3], [0, 1, 2])
+
+    def test_iteritems_unordered(self):
+        d = JsonFlatteningDict(dict())
+        d['a'] = dict(b=1, c=[2])
+        items = dict(d['a'].items())
+        self.assertEquals(items['b'], 1)
+        self.assertEquals(list(items['c']), [2])
+
+    def test_assign_diff(self):
+        under = WriteCountingDict()
+        d = JsonFlatteningDict(under)
+        d['a'] = dict(name='x', tags=['p', 'q'], nested=dict(n=1))
+        record = python_copy.copy(d['a'])
+        record['tags'][1] = 'r'
+        record['count'] = 3
+
+        del under.written[:]
+        d['a'] = record
+        self.assertEquals(sorted(under.written), ['."a"#', '."a"."count"=', '."a"."tags"[1]='])
+        self.assertEquals(python_copy.copy(d['a']), record)
+        self.assertEquals(len(d['a']), 4)
+        self.assertEquals(len(d), 1)
+
+        del under.written[:]
+        d['b'] = dict(c=1)
+        d['b'] = dict(c=1)
+        self.assertEquals(len(d), 2)
+
+    def test_assign_type_change(self):
+        d = JsonFlatteningDict(FakeOrderedDict())
+        d['a'] = dict(b=dict(c=1), d=[1, 2])
+        d['a'] = dict(b=1, d=dict(e=[]))
+        self.assertEquals(python_copy.copy(d['a']), dict(b=1, d=dict(e=[])))
+        d['a'] = dict(b=[dict(x=1)], d=None)
+        self.assertEquals(python_copy.copy(d), dict(a=dict(b=[dict(x=1)], d=None)))
+
+        d['a'] = dict(b=True)
+        d['a'] = dict(b=1)
+        self.assertTrue(d['a']['b'] is not True)
+        d['a'] = dict(b=1.0)
+        self.assertTrue(isinstance(d['a']['b'], float))
+
+    def test_assign_without_diff(self):
+        under = WriteCountingDict()
+        d = JsonFlatteningDict(under)
+        d['a'] = dict(b=1, c=2)
+        del under.written[:]
+        d.assign('a', dict(b=1, c=3), diff=False)
+        self.assertTrue('."a"."b"=' in under.written)
+        self.assertEquals(python_copy.copy(d), dict(a=dict(b=1, c=3)))
+
+    def test_list_item_assign_diff(self):
+        under = WriteCountingDict()
+        d = JsonFlatteningDict(under)
+        d['l'] = [dict(a=1, b=2), dict(a=3, b=4)]
+        del under.written[:]
+        d['l'][0] = dict(a=1, b=5)
+        self.assertEquals(under.written, ['."l"[0]."b"='])
+
+        del under.written[:]
+        d['l'][:] = [dict(a=1, b=5), dict(a=3, b=4), dict(a=6)]
+        self.assertEquals(sorted(under.written), ['."l"#', '."l"[2]#', '."l"[2].', '."l"[2]."a"='])
+        self.assertEquals(python_copy.copy(d['l']), [dict(a=1, b=5), dict(a=3, b=4), dict(a=6)])
+
     def test_items2(self):
         d = JsonFlatteningDict(FakeOrderedDict())
         d['ibbl'] = True
@@ -236,6 +354,40 @@ class TestFlatDict(unittest.TestCase):
         d["c"] = ["list", "item"]
         self.assertEquals(sorted(d.keys()), ["a", "b", "c"])
 
+    def test_move(self):
+        store = FakeOrderedDict()
+        d = JsonFlatteningDict(store)
+        d['records'] = dict(a=dict(b=[1, 2], c='x'), keep=1)
+        d['archive'] = {}
+        d.move(['records', 'a'], ['archive', 'a'])
+        self.assertEquals(python_copy.copy(d), dict(records=dict(keep=1), archive=dict(a=dict(b=[1, 2], c='x'))))
+        self.assertEquals(len(d['records']), 1)
+        self.assertEquals(len(d['archive']), 1)
+        self.assertFalse(any(key.startswith('."records"."a"') for key in store))
+
+        with self.assertRaises(ValueError):
+            d.move(['archive'], ['records'])
+        with self.assertRaises(ValueError):
+            d.move(['archive'], ['archive', 'a', 'inside'])
+        with self.assertRaises(KeyError):
+            d.move(['missing'], ['x'])
+
+    def test_copy_path(self):
+        d = JsonFlatteningDict(FakeOrderedDict())
+        d['a'] = dict(b=[1, dict(c=2)])
+        d.copy_path(['a'], ['x'])
+        d.copy_path(['a', 'b', -1], ['y'])
+        d['a']['b'][1]['c'] = 3
+        self.assertEquals(python_copy.copy(d), dict(a=dict(b=[1, dict(c=3)]), x=dict(b=[1, dict(c=2)]), y=dict(c=2)))
+        with self.assertRaises(ValueError):
+            d.move(['a', 'b', 0], ['z'])
+
+    def test_move_unordered(self):
+        d = JsonFlatteningDict(dict())
+        d['a'] = dict(b=1)
+        d.move(['a'], ['c'])
+        self.assertEquals(python_copy.copy(d), dict(c=dict(b=1)))
+
 
 if __name__ == '__main__':
     unittest.main()
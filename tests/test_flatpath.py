@@ -1,6 +1,7 @@
 import unittest
 
-from jsdb.flatpath import FlatPath, IncorrectType, RootNode
+from jsdb.flatpath import (FlatPath, IncorrectType, PathCorrupt, RootNode, is_chunk_key, is_string_chunk_key,
+                           join_key, parse_key)
 
 class FlatPathTest(unittest.TestCase):
     def test_parent(self):
@@ -26,10 +27,31 @@ class FlatPathTest(unittest.TestCase):
         self.assertEquals(FlatPath('."hello"=').prefix(), FlatPath('."hello"'))
         self.assertEquals(FlatPath('."hello".').prefix(), FlatPath('."hello"'))
 
+    def test_chunk_keys(self):
+        self.assertTrue(is_chunk_key('."samples"[(3)'))
+        self.assertTrue(is_chunk_key('."log"=(12)'))
+        self.assertTrue(is_string_chunk_key('."log"=(12)'))
+        self.assertFalse(is_string_chunk_key('."samples"[(3)'))
+        self.assertFalse(is_chunk_key('."a)"='))
+        self.assertFalse(is_chunk_key('!aggregate."s"<\x04\xbf\xf0)'))
+        self.assertFalse(is_chunk_key('!aggregate."s"<=(1)'))
+
     def test_depth(self):
         self.assertEquals(FlatPath('."hello"').depth(), 1)
         self.assertEquals(FlatPath('."hello"."two"').depth(), 2)
         self.assertEquals(FlatPath('."hello"."two"[0]').depth(), 3)
 
+    def test_parse_key(self):
+        self.assertEquals(parse_key('."hello"[0]."world"='), (('hello', 0, 'world'), '='))
+        self.assertEquals(parse_key('#'), ((), '#'))
+        self.assertEquals(parse_key('."a\\"b".'), (('a"b',), '.'))
+        self.assertEquals(parse_key('."hello"[12]'), (('hello', 12), ''))
+        with self.assertRaises(PathCorrupt):
+            parse_key('."hello"[x]')
+
+    def test_join_key(self):
+        for key in ['."hello"[0]."world"=', '#', '."a\\"b".', '."x\\\\"[']:
+            self.assertEquals(join_key(*parse_key(key)), key)
+
 if __name__ == '__main__':
 	unittest.main()
@@ -9,7 +9,7 @@ import tempfile
 import time
 import unittest
 
-from jsdb import flatdict, jsdb, leveldict, python_copy, rollback
+from jsdb import flatdict, jsdb, keyformat, leveldict, nodedict, python_copy, rollback
 from testutils import FakeOrderedDict
 
 LOGGER = logging.getLogger('jsdb.fuzztest')
@@ -40,6 +40,42 @@ class JsdbFuzzTest(unittest.TestCase):
             shutil.rmtree(self._filename)
         self.assert_fuzz(make_dict, commit=True, clean_up=clean_up)
 
+    def test_jsdb_cache(self):
+        make_dict = lambda: jsdb.Jsdb(self._filename, cache_size=20)
+        def clean_up():
+            os.unlink(self._filename)
+        self.assert_fuzz(make_dict, commit=True, clean_up=clean_up)
+
+    def test_jsdb_binary_codec(self):
+        make_dict = lambda: jsdb.Jsdb(self._filename, codec='binary')
+        def clean_up():
+            os.unlink(self._filename)
+        self.assert_fuzz(make_dict, commit=True, clean_up=clean_up)
+
+    def test_flattening_binary_keys(self):
+        make_dict = lambda: flatdict.JsonFlatteningDict(keyformat.BinaryKeyDict(FakeOrderedDict()))
+        self.assert_fuzz(make_dict)
+
+    def test_jsdb_binary_keys(self):
+        make_dict = lambda: jsdb.Jsdb(self._filename, key_format=keyformat.BINARY, codec='binary')
+        def clean_up():
+            os.unlink(self._filename)
+        self.assert_fuzz(make_dict, commit=True, clean_up=clean_up)
+
+    def test_nodes_ordered(self):
+        make_dict = lambda: nodedict.NodeDict(FakeOrderedDict())
+        self.assert_fuzz(make_dict)
+
+    def test_nodes_unordered(self):
+        make_dict = lambda: nodedict.NodeDict(dict())
+        self.assert_fuzz(make_dict)
+
+    def test_jsdb_nodes(self):
+        make_dict = lambda: jsdb.Jsdb(self._filename, layout=nodedict.NODES)
+        def clean_up():
+            os.unlink(self._filename)
+        self.assert_fuzz(make_dict, commit=True, clean_up=clean_up)
+
     def test_flattening_bsddb(self):
         make_dict = lambda: flatdict.JsonFlatteningDict(jsdb.JsonEncodeDict(bsddb.btopen(self._filename, 'w')))
         def clean_up():
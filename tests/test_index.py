@@ -0,0 +1,107 @@
+import unittest
+
+from jsdb.flatdict import JsonFlatteningDict
+from jsdb.derived import DerivedDict
+from jsdb.jsdb import JsonEncodeDict
+
+from testutils import FakeOrderedDict
+
+class CountingDict(FakeOrderedDict):
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return FakeOrderedDict.__getitem__(self, key)
+
+
+def user(number):
+    return dict(name='user{}'.format(number), email='user{}@example.com'.format(number), age=number % 7)
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.under = CountingDict()
+        self.indexing = DerivedDict(JsonEncodeDict(self.under))
+        self.d = JsonFlatteningDict(self.indexing)
+
+    def test_lookup(self):
+        self.indexing.create_index('by_email', 'users[*].email')
+        self.d['users'] = [user(i) for i in range(5)]
+        index = self.indexing.index('by_email')
+        self.assertEquals(index.lookup('user3@example.com'), [('users', 3, 'email')])
+        self.assertEquals(index.lookup('nobody@example.com'), [])
+
+    def test_existing_data(self):
+        self.d['users'] = [user(i) for i in range(5)]
+        self.indexing.create_index('by_age', 'users[*].age')
+        self.assertEquals(self.indexing.index('by_age').lookup(1), [('users', 1, 'age')])
+
+    def test_updates(self):
+        self.indexing.create_index('by_email', 'users[*].email')
+        self.d['users'] = [user(i) for i in range(3)]
+        index = self.indexing.index('by_email')
+
+        self.d['users'][1]['email'] = 'changed'
+        self.assertEquals(index.lookup('user1@example.com'), [])
+        self.assertEquals(index.lookup('changed'), [('users', 1, 'email')])
+
+        # Deleting shifts later entries down
+        del self.d['users'][0]
+        self.assertEquals(index.lookup('changed'), [('users', 0, 'email')])
+        self.assertEquals(index.lookup('user2@example.com'), [('users', 1, 'email')])
+
+        self.d['users'].insert(0, user(9))
+        self.assertEquals(index.lookup('user9@example.com'), [('users', 0, 'email')])
+        self.assertEquals(index.lookup('user2@example.com'), [('users', 2, 'email')])
+
+        del self.d['users']
+        self.assertEquals(list(index.range()), [])
+
+    def test_large_integers(self):
+        self.indexing.create_index('by_id', 'users[*].id')
+        self.d['users'] = [dict(id=2 ** 53 + 1), dict(id=2 ** 53), dict(id=2 ** 53 + 2)]
+        index = self.indexing.index('by_id')
+        self.assertEquals(index.lookup(2 ** 53), [('users', 1, 'id')])
+        self.assertEquals(index.lookup(2 ** 53 + 1), [('users', 0, 'id')])
+        self.assertEquals([value for value, _ in index.range(2 ** 53 + 1)], [2 ** 53 + 1, 2 ** 53 + 2])
+
+    def test_range(self):
+        self.indexing.create_index('by_age', 'users[*].age')
+        self.d['users'] = [user(i) for i in range(10)]
+        ages = [(value, path[1]) for value, path in self.indexing.index('by_age').range(2, 4)]
+        self.assertEquals(ages, [(2, 2), (2, 9), (3, 3)])
+        self.assertEquals(len(list(self.indexing.index('by_age').range(start=6))), 1)
+        self.assertEquals(len(list(self.indexing.index('by_age').range(stop=1))), 2)
+
+    def test_lookup_reads(self):
+        self.indexing.create_index('by_email', 'users[*].email')
+        self.d['users'] = [user(i) for i in range(200)]
+        reads = self.under.reads
+        self.indexing.index('by_email').lookup('user150@example.com')
+        self.assertTrue(self.under.reads - reads < 5)
+
+    def test_drop(self):
+        self.indexing.create_index('by_email', 'users[*].email')
+        self.d['users'] = [user(i) for i in range(3)]
+        self.indexing.drop_index('by_email')
+        self.assertEquals([key for key in self.under if key.startswith('!index.')], [])
+        with self.assertRaises(KeyError):
+            self.indexing.index('by_email')
+
+    def test_definitions_stored(self):
+        self.indexing.create_index('by_email', 'users[*].email')
+        reopened = DerivedDict(JsonEncodeDict(self.under))
+        self.assertEquals(reopened.index_names(), ['by_email'])
+        d = JsonFlatteningDict(reopened)
+        d['users'] = [user(1)]
+        self.assertEquals(reopened.index('by_email').lookup('user1@example.com'), [('users', 0, 'email')])
+
+    def test_duplicate(self):
+        self.indexing.create_index('by_email', 'users[*].email')
+        with self.assertRaises(ValueError):
+            self.indexing.create_index('by_email', 'users[*].name')
+
+
+if __name__ == '__main__':
+    unittest.main()
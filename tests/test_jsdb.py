@@ -1,3 +1,4 @@
+import array
 import os
 import shutil
 import tempfile
@@ -6,6 +7,12 @@ import unittest
 
 import jsdb.python_copy
 from jsdb import Jsdb, DbClosedError
+from jsdb import keyformat
+from jsdb.codec import CodecMismatch
+from jsdb.nodedict import NODES
+from jsdb.rollback import UncommittedChanges
+
+import testutils
 
 class TestJsdb(unittest.TestCase):
     def setUp(self):
@@ -96,6 +103,281 @@ class TestJsdb(unittest.TestCase):
         d = Jsdb(self._filename)
         self.assertEquals(d['a'], 1)
 
+    def test_cache(self):
+        d = Jsdb(self._filename, cache_size=100)
+        d['a'] = dict(b=1)
+        d.commit()
+        self.assertEquals(d['a']['b'], 1)
+        self.assertEquals(d['a']['b'], 1)
+        self.assertTrue(d.cache_info().hits > 0)
+        d['a']['b'] = 2
+        d.commit()
+        self.assertEquals(d['a']['b'], 2)
+
+    def test_codec(self):
+        d = Jsdb(self._filename, codec='binary')
+        d['a'] = [1, u'two', None, 2 ** 70]
+        d.commit()
+        d.close()
+
+        d = Jsdb(self._filename)
+        self.assertEquals(list(d['a']), [1, u'two', None, 2 ** 70])
+        d.close()
+
+        with self.assertRaises(CodecMismatch):
+            Jsdb(self._filename, codec='json')['a']
+
+    def test_nodes(self):
+        d = Jsdb(self._filename, layout=NODES)
+        d['a'] = dict(b=[1])
+        d.commit()
+        d.close()
+
+        d = Jsdb(self._filename)
+        self.assertEquals(d['a']['b'][0], 1)
+
+    def test_move(self):
+        d = Jsdb(self._filename)
+        d['records'] = dict(old=dict(value=[1, 2]))
+        d['archive'] = {}
+        d.commit()
+
+        d.move(['records', 'old'], ['archive', 'old'])
+        d.rollback()
+        self.assertEquals(d['records']['old']['value'][1], 2)
+
+        d.move(['records', 'old'], ['archive', 'old'])
+        d.copy('archive', 'backup')
+        d.commit()
+        d.close()
+
+        d = Jsdb(self._filename)
+        self.assertEquals(jsdb.python_copy.copy(d), dict(records={}, archive=dict(old=dict(value=[1, 2])),
+                                                         backup=dict(old=dict(value=[1, 2]))))
+
+    def test_index(self):
+        d = Jsdb(self._filename)
+        d['users'] = [dict(email='a@example.com'), dict(email='b@example.com')]
+        d.commit()
+        d.create_index('users_by_email', 'users[*].email')
+        d['users'].append(dict(email='c@example.com'))
+        self.assertEquals(d.index('users_by_email').lookup('c@example.com'), [])
+        d.commit()
+        d.close()
+
+        d = Jsdb(self._filename)
+        self.assertEquals(d.index('users_by_email').lookup('c@example.com'), [('users', 2, 'email')])
+        self.assertEquals([path[1] for _, path in d.index('users_by_email').range('b')], [1, 2])
+
+        with self.assertRaises(ValueError):
+            Jsdb(os.path.join(self.direc, 'nodes'), layout=NODES).create_index('x', 'x')
+
+    def test_aggregate(self):
+        d = Jsdb(self._filename)
+        d.create_aggregate('latency', 'requests[*].ms')
+        d['requests'] = [dict(ms=10), dict(ms=30)]
+        d.commit()
+        d['requests'] = []
+        d.rollback()
+        d.close()
+
+        d = Jsdb(self._filename)
+        self.assertEquals(d.aggregate('latency').sum, 40)
+        self.assertEquals(d.aggregate('latency').max, 30)
+
+    def test_aggregate_key_like_chunk(self):
+        # The sortable encoding of this number ends in ")"
+        d = Jsdb(self._filename)
+        d.create_aggregate('s', 'r.*.x')
+        d['r'] = {'a': {'x': 1.000000000000009}}
+        d.commit()
+        self.assertEquals(d.aggregate('s').max, 1.000000000000009)
+
+    def test_timeseries(self):
+        d = Jsdb(self._filename)
+        series = d.timeseries('keypresses.hourly', chunk_size=16)
+        series.extend((t, 1) for t in range(100))
+        d.commit()
+        series.append(100, 1)
+        d.rollback()
+        d.close()
+
+        d = Jsdb(self._filename)
+        self.assertEquals(len(d.timeseries('keypresses.hourly')), 100)
+        self.assertEquals(len(list(d.timeseries('keypresses.hourly').range(50, 60))), 10)
+        self.assertEquals(list(d), [])
+
+    def test_packed(self):
+        d = Jsdb(self._filename)
+        d['samples'] = array.array('d', [0.5] * 5000)
+        d.commit()
+        d.close()
+
+        d = Jsdb(self._filename)
+        self.assertEquals(len(d['samples']), 5000)
+        self.assertEquals(d['samples'][4000], 0.5)
+        d['samples'].append(1.5)
+        d.rollback()
+        self.assertEquals(len(d['samples']), 5000)
+        d['samples'].append(1.5)
+        d.commit()
+        self.assertEquals(d['samples'][-1], 1.5)
+        self.assertEquals(d['samples'].to_array()[-2:].tolist(), [0.5, 1.5])
+
+    def test_query(self):
+        d = Jsdb(self._filename)
+        d['logs'] = [dict(level='info'), dict(level='error')]
+        d['services'] = dict(web=dict(port=80), db=dict(port=5432))
+        d.commit()
+        self.assertEquals(list(d.query('logs[*].level == "error"')), [(('logs', 1, 'level'), 'error')])
+
+        (path, value), = d.query('services.*.port < 100')
+        self.assertEquals(path, ('services', 'web', 'port'))
+        (_, service), = d.query('services.web')
+        service['port'] = 8080
+        d.rollback()
+        self.assertEquals(d['services']['web']['port'], 80)
+
+        d['services']['cache'] = dict(port=11211)
+        self.assertEquals(len(list(d.query('logs[*].level == "error"'))), 1)
+        with self.assertRaises(UncommittedChanges):
+            d.query('services.*.port < 100')
+        with self.assertRaises(UncommittedChanges):
+            d.query('*.web')
+        self.assertEquals(len(list(d.query('services.web.port'))), 1)
+
+    def test_columns(self):
+        d = Jsdb(self._filename)
+        d['events'] = [dict(ts=1, value=0.5), dict(ts=2)]
+        d.commit()
+        columns = d.to_columns('events', ['ts', 'value'])
+        self.assertEquals(columns['ts'].values.tolist(), [1.0, 2.0])
+        self.assertEquals(columns['value'].missing.tolist(), [0, 1])
+
+        d['other'] = 1
+        self.assertEquals(len(d.to_columns('events', ['ts'])['ts'].values), 2)
+        d['events'].append(dict(ts=3))
+        with self.assertRaises(UncommittedChanges):
+            d.to_columns('events', ['ts'])
+
+    def test_large_strings(self):
+        d = Jsdb(self._filename, large_string_threshold=100, string_compression='zlib')
+        d['log'] = 'line\n' * 1000
+        d.commit()
+        d.close()
+
+        d = Jsdb(self._filename, cache_size=10)
+        self.assertEquals(d['log'][:5], 'line\n')
+        self.assertEquals(d.open_string('log').read(10), 'line\n' * 2)
+        d.append_string('log', 'end')
+        d.rollback()
+        self.assertEquals(len(d['log']), 5000)
+        d.append_string('log', 'end')
+        d.commit()
+        self.assertEquals(d['log'][-4:], '\nend')
+
+        d['other'] = 1
+        self.assertEquals(d.open_string('log').read(4), 'line')
+        d.append_string('log', 'more')
+        with self.assertRaises(UncommittedChanges):
+            d.open_string('log')
+
+    def test_compression(self):
+        d = Jsdb(self._filename, compression_threshold=20)
+        d['messages'] = ['a message that is repeated often'] * 10
+        d.commit()
+        d.close()
+
+        d = Jsdb(self._filename)
+        self.assertEquals(d['messages'][9], 'a message that is repeated often')
+
+    def test_no_cache(self):
+        d = Jsdb(self._filename)
+        self.assertEquals(d.cache_info(), None)
+
+    def test_stats(self):
+        d = Jsdb(self._filename, cache_size=100)
+        d['a'] = dict(b=1)
+        d.commit()
+        self.assertEquals(d.stats()['counts'], {})
+
+        d.enable_stats()
+        d['a']['b']
+        d['c'] = 'hello'
+        d.commit()
+        stats = d.stats()
+        # Both the top level and the nested read
+        self.assertEquals(stats['counts']['get'], 2)
+        self.assertEquals(stats['counts']['commit'], 1)
+        self.assertTrue(stats['counts']['store.put'] >= 1)
+        self.assertEquals(stats['histograms']['commit.writes']['count'], 1)
+        self.assertTrue(stats['histograms']['commit.writes']['max'] >= 1)
+        self.assertTrue(stats['histograms']['get']['p99'] <= stats['histograms']['get']['max'])
+        self.assertTrue(stats['cache']['hit_rate'] is not None)
+
+        d.reset_stats()
+        d.enable_stats(False)
+        d['a']
+        self.assertEquals(d.stats()['counts'], {})
+
+    def test_explain(self):
+        d = Jsdb(self._filename, key_format=keyformat.BINARY)
+        d['a'] = dict(b=dict(c=1))
+        d.commit()
+
+        calls = d.explain(['a', 'b', 'c'])
+        self.assertTrue(calls)
+        self.assertTrue('."a"."b"."c"=' in [call.key for call in calls])
+        self.assertTrue(all(call.seconds >= 0 for call in calls))
+
+        calls = d.explain(lambda db: db['a'].items())
+        self.assertTrue('item_after' in [call.operation for call in calls])
+        self.assertEquals(d.stats()['counts'], {})
+
+    def test_slow_log(self):
+        d = Jsdb(self._filename, slow_threshold=0)
+        with testutils.capture_logs('jsdb') as records:
+            d['a'] = dict(b=1)
+            d.commit()
+            d['a']
+        self.assertEquals(len(records), 3)
+        self.assertTrue(records[1].getMessage().startswith('Slow commit took'))
+        self.assertTrue('put' in records[1].getMessage())
+        self.assertTrue(records[2].getMessage().startswith("Slow get of ['a']"))
+
+        d.log_slow_operations(None)
+        with testutils.capture_logs('jsdb') as records:
+            d['a']
+        self.assertEquals(records, [])
+
+    def test_slow_log_paths(self):
+        d = Jsdb(self._filename)
+        d['users'] = dict(alice=dict(email='alice@example.com', logins=[dict(at=1)]))
+        d.commit()
+        d.log_slow_operations(0)
+        with testutils.capture_logs('jsdb') as records:
+            users = d['users']
+            self.assertEquals(users['alice']['email'], 'alice@example.com')
+            users['alice']['logins'][0]['at']
+            users['alice'].items()
+        messages = [record.getMessage().split(' took')[0] for record in records]
+        self.assertEquals(messages, [
+            "Slow get of ['users']",
+            "Slow get of ['users']['alice']",
+            "Slow get of ['users']['alice']['email']",
+            "Slow get of ['users']['alice']",
+            "Slow get of ['users']['alice']['logins']",
+            "Slow get of ['users']['alice']['logins'][0]",
+            "Slow get of ['users']['alice']['logins'][0]['at']",
+            "Slow get of ['users']['alice']",
+            "Slow items of ['users']['alice']"])
+        self.assertEquals(d.stats()['counts'], {})
+        d.log_slow_operations(None)
+        d.enable_stats()
+        d['users']['alice'].values()
+        counts = d.stats()['counts']
+        self.assertEquals((counts['get'], counts['values']), (2, 1))
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,82 @@
+import unittest
+
+from jsdb import keyformat, python_copy
+from jsdb.flatdict import JsonFlatteningDict
+
+from testutils import FakeOrderedDict
+
+class TestKeyFormat(unittest.TestCase):
+    KEYS = ['#', '."a"=', '."a".', '."a"[', '."a"#', '."a"[0]=', '."a"[300]."b"[',
+            '."quo\\"te"=', '."back\\\\slash".', '.""=', '!codec', '."a"[(0)', '."a"[2][(300)',
+            '."a"=(0)', '."a"[1]=(12)']
+
+    def test_round_trip(self):
+        for key in self.KEYS:
+            self.assertEquals(keyformat.decode_key(keyformat.encode_key(key)), key)
+
+    def test_describe(self):
+        self.assertEquals(keyformat.describe_key(keyformat.encode_key('."a"[')), '."a"[')
+        self.assertEquals(keyformat.describe_key(keyformat.encode_key('."a"[\xff')), '."a"[\xff')
+
+    def test_shorter(self):
+        key = '."metrics"."keypresses.hourly"."values"[14]."time"='
+        self.assertTrue(len(keyformat.encode_key(key)) < len(key))
+
+    def test_index_order(self):
+        keys = [keyformat.encode_key('."a"[{}]='.format(i)) for i in (0, 1, 2, 10, 255, 256, 70000)]
+        self.assertEquals(sorted(keys), keys)
+
+    def test_chunks_after_entries(self):
+        encode = keyformat.encode_key
+        self.assertTrue(encode('."a"[') < encode('."a"[(0)') < encode('."a"[') + keyformat.TOP)
+        self.assertTrue(encode('."a"[1000]=') < encode('."a"[(0)'))
+        self.assertTrue(encode('."a"=') < encode('."a"=(0)') < encode('."a"=(1)') < encode('."a"') + keyformat.TOP)
+
+    def test_descendants_contiguous(self):
+        parent = keyformat.encode_key('."a".')
+        top = keyformat.encode_key('."a".' + keyformat.TOP)
+        for key in ['."a"."b"=', '."a"."' + 'x' * 300 + '"[', '."a"."b"[12]=']:
+            encoded = keyformat.encode_key(key)
+            self.assertTrue(encoded.startswith(parent))
+            self.assertTrue(parent < encoded < top)
+        self.assertTrue(keyformat.encode_key('."a"[') > top)
+
+    def test_flattening(self):
+        store = FakeOrderedDict()
+        d = JsonFlatteningDict(keyformat.key_format_dict(store, keyformat.BINARY))
+        d['a'] = dict(b=[1, dict(c=2)], d='e')
+        d['a']['b'].insert(0, 'x')
+        self.assertEquals(python_copy.copy(d), dict(a=dict(b=['x', 1, dict(c=2)], d='e')))
+        del d['a']['b']
+        self.assertEquals(python_copy.copy(d), dict(a=dict(d='e')))
+        self.assertTrue(all(key[0] in '\x02\x03!' for key in store))
+        self.assertTrue(store.key_after_called)
+
+    def test_header(self):
+        store = FakeOrderedDict()
+        self.assertEquals(keyformat.store_key_format(store, keyformat.BINARY), keyformat.BINARY)
+        self.assertEquals(keyformat.store_key_format(store), keyformat.BINARY)
+        with self.assertRaises(keyformat.KeyFormatMismatch):
+            keyformat.store_key_format(store, keyformat.TEXT)
+
+    def test_convert(self):
+        source = FakeOrderedDict()
+        d = JsonFlatteningDict(source)
+        d['a'] = dict(b=[1, 2], c=None)
+
+        binary = FakeOrderedDict()
+        keyformat.convert(source, binary, keyformat.BINARY)
+        self.assertEquals(
+            python_copy.copy(JsonFlatteningDict(keyformat.key_format_dict(binary))),
+            dict(a=dict(b=[1, 2], c=None)))
+
+        text = FakeOrderedDict()
+        keyformat.convert(binary, text, keyformat.TEXT)
+        self.assertEquals(python_copy.copy(JsonFlatteningDict(text)), dict(a=dict(b=[1, 2], c=None)))
+
+        with self.assertRaises(ValueError):
+            keyformat.convert(binary, text, keyformat.TEXT)
+
+
+if __name__ == '__main__':
+    unittest.main()
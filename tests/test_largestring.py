@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from jsdb import largestring
+from jsdb.flatdict import JsonFlatteningDict
+from jsdb.jsdb import JsonEncodeDict
+from jsdb.largestring import CHUNK_BYTES
+
+from testutils import FakeOrderedDict
+
+class CountingDict(FakeOrderedDict):
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.reads = 0
+        self.writes = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return FakeOrderedDict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self.writes += 1
+        FakeOrderedDict.__setitem__(self, key, value)
+
+
+class TestLargeString(unittest.TestCase):
+    def setUp(self):
+        self.under = CountingDict()
+        self.d = JsonFlatteningDict(JsonEncodeDict(self.under, large_string_threshold=1000))
+        self.text = ''.join(chr(ord('a') + i % 26) for i in range(CHUNK_BYTES * 2 + 100))
+        self.d['log'] = self.text
+
+    def chunk_keys(self):
+        return [key for key in self.under if key.startswith('."log"=(')]
+
+    def test_storage(self):
+        self.assertEquals(len(self.chunk_keys()), 3)
+        self.assertTrue(largestring.is_large(self.under['."log"=']))
+        self.assertEquals(self.d['log'], self.text)
+        self.assertEquals(list(self.d), ['log'])
+
+    def test_small_strings_inline(self):
+        self.d['short'] = 'x' * 1000
+        self.assertEquals(self.under['."short"='], '"{}"'.format('x' * 1000))
+
+    def test_ranged_reads(self):
+        reader = self.d.open_string(('log',))
+        self.assertEquals(len(reader), len(self.text))
+        reads = self.under.reads
+        self.assertEquals(reader[CHUNK_BYTES - 5:CHUNK_BYTES + 5], self.text[CHUNK_BYTES - 5:CHUNK_BYTES + 5])
+        self.assertEquals(self.under.reads - reads, 2)
+        self.assertEquals(reader[-1], self.text[-1])
+
+    def test_file_like(self):
+        reader = self.d.open_string(('log',))
+        self.assertEquals(reader.read(10), self.text[:10])
+        self.assertEquals(reader.tell(), 10)
+        reader.seek(-5, 2)
+        self.assertEquals(reader.read(), self.text[-5:])
+        self.assertEquals(reader.read(), '')
+        self.assertEquals(''.join(reader), self.text)
+
+    def test_append(self):
+        writes = self.under.writes
+        self.d.append_string(('log',), 'xyz')
+        # The last chunk and the header
+        self.assertEquals(self.under.writes - writes, 2)
+        self.assertEquals(self.d['log'], self.text + 'xyz')
+
+        self.d.append_string(('log',), 'q' * CHUNK_BYTES)
+        self.assertEquals(len(self.chunk_keys()), 4)
+        self.d.truncate_string(('log',), len(self.text))
+        self.assertEquals(len(self.chunk_keys()), 3)
+        self.assertEquals(self.d['log'], self.text)
+
+    def test_append_inline(self):
+        self.d['short'] = 'x' * 999
+        self.d.append_string(('short',), 'yy')
+        self.assertEquals(self.d['short'], 'x' * 999 + 'yy')
+        self.assertTrue(largestring.is_large(self.under['."short"=']))
+
+    def test_replace(self):
+        self.d['log'] = 'small'
+        self.assertEquals(self.chunk_keys(), [])
+        self.assertEquals(self.d['log'], 'small')
+        self.d['items'] = [self.text, self.text[:2000]]
+        del self.d['items'][0]
+        self.assertEquals(self.d['items'][0], self.text[:2000])
+        self.assertEquals(len([key for key in self.under if key.endswith(')')]), 1)
+
+    def test_reassign_parent(self):
+        self.d['parent'] = dict(log=self.text)
+        self.d['parent'] = dict(log=self.text, x=1)
+        self.assertEquals(self.d['parent']['log'], self.text)
+        self.d['parent'] = dict(log=self.text[:2000], x=1)
+        self.assertEquals(self.d['parent']['log'], self.text[:2000])
+        self.assertEquals(len([key for key in self.under if key.startswith('."parent"."log"=(')]), 1)
+
+    def test_unicode(self):
+        text = u'é' * 1000
+        self.d['accents'] = text
+        self.assertEquals(self.d['accents'], text)
+        self.assertEquals(len(self.d.open_string(('accents',))), 2000)
+
+    def test_compression(self):
+        under = CountingDict()
+        d = JsonFlatteningDict(JsonEncodeDict(under, large_string_threshold=1000, string_compression='zlib'))
+        d['log'] = self.text
+        self.assertTrue(sum(len(under[key]) for key in under if key.endswith(')')) < len(self.text) / 10)
+        self.assertEquals(d['log'], self.text)
+        d.append_string(('log',), 'end')
+        self.assertEquals(d.open_string(('log',))[-3:], 'end')
+
+    def test_move(self):
+        self.d.move(('log',), ('moved',))
+        self.assertEquals(self.d['moved'], self.text)
+        self.assertEquals(self.chunk_keys(), [])
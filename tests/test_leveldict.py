@@ -3,8 +3,17 @@ import shutil
 import tempfile
 import unittest
 
+from jsdb import keyformat, leveldict
 from jsdb.leveldict import LevelDict
 
+class CompactionRecordingDict(LevelDict):
+    def __init__(self, *args, **kwargs):
+        LevelDict.__init__(self, *args, **kwargs)
+        self.compactions = []
+
+    def compact_range(self, start=None, stop=None):
+        self.compactions.append((start, stop))
+        LevelDict.compact_range(self, start, stop)
 
 class LevelDictTest(unittest.TestCase):
     def test_basic(self):
@@ -43,6 +52,80 @@ class LevelDictTest(unittest.TestCase):
         finally:
             shutil.rmtree(name)
 
+    def test_write_batch(self):
+        name = tempfile.mkdtemp()
+        try:
+            db = LevelDict(name)
+            db['a'] = '1'
+            with db.write_batch():
+                db['b'] = '2'
+                del db['a']
+                self.assertEquals(db['a'], '1')
+            self.assertEquals(list(db), ['b'])
+
+            with self.assertRaises(ValueError):
+                with db.write_batch():
+                    db['c'] = '3'
+                    raise ValueError()
+            self.assertEquals(list(db), ['b'])
+            db.close()
+        finally:
+            shutil.rmtree(name)
+
+    def test_profiles(self):
+        self.assertEquals(leveldict.profile_options(), {})
+        self.assertEquals(leveldict.profile_options('low_memory', max_open_files=10)['max_open_files'], 10)
+        self.assertEquals(leveldict.profile_options('read_heavy')['bloom_filter_bits'], 10)
+        with self.assertRaises(ValueError):
+            leveldict.profile_options('fast')
+
+        name = tempfile.mkdtemp()
+        try:
+            db = leveldict.level_storage('write_heavy', block_size=8192)(name)
+            db['a'] = '1'
+            self.assertEquals(db['a'], '1')
+            db.close()
+        finally:
+            shutil.rmtree(name)
+
+    def test_compaction(self):
+        name = tempfile.mkdtemp()
+        try:
+            db = CompactionRecordingDict(name, compaction_threshold=3)
+            keys = ['."a"."{}"='.format(i) for i in range(5)] + ['."b"."{}"='.format(i) for i in range(5)]
+            for key in keys:
+                db[key] = '1'
+
+            with db.write_batch():
+                del db['."a"."1"=']
+                del db['."a"."2"=']
+                del db['."a"."3"=']
+                self.assertEquals(db.compactions, [])
+            self.assertEquals(db.compactions, [('."a"."1"=', '."a"."3"=')])
+
+            # Deletions from other top-level values are counted separately
+            del db['."a"."4"=']
+            del db['."b"."0"=']
+            del db['."a"."0"=']
+            del db['."b"."4"=']
+            self.assertEquals(len(db.compactions), 1)
+            del db['."b"."2"=']
+            self.assertEquals(db.compactions[1:], [('."b"."0"=', '."b"."4"=')])
+            db.close()
+
+            self.assertEquals(leveldict.deletion_bucket('."a\\""[2]='), '."a\\""')
+            self.assertEquals(leveldict.deletion_bucket(keyformat.encode_key('."ab"[2]=')), '\x03\x01\x02ab')
+            self.assertEquals(leveldict.deletion_bucket('@12:."a"='), '@12:')
+            self.assertEquals(leveldict.deletion_bucket('!keyformat'), '')
+
+            db = CompactionRecordingDict(name, compaction_threshold=None)
+            db['a'] = '1'
+            del db['a']
+            self.assertEquals(db.compactions, [])
+            db.close()
+        finally:
+            shutil.rmtree(name)
+
 
 if __name__ == "__main__":
     unittest.main()
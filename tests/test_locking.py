@@ -0,0 +1,148 @@
+import bsddb
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from jsdb import Jsdb
+from jsdb import locking
+
+class TestReadWriteLock(unittest.TestCase):
+    def test_readers_share(self):
+        lock = locking.ReadWriteLock()
+        both_reading = threading.Event()
+        readers = []
+
+        def read():
+            with lock.read():
+                readers.append(1)
+                if len(readers) == 2:
+                    both_reading.set()
+                both_reading.wait(5)
+
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(both_reading.is_set())
+
+    def test_writer_excludes(self):
+        lock = locking.ReadWriteLock()
+        events = []
+
+        def write():
+            with lock.write():
+                events.append('write')
+
+        with lock.read():
+            writer = threading.Thread(target=write)
+            writer.start()
+            time.sleep(0.05)
+            events.append('read')
+        writer.join()
+        self.assertEquals(events, ['read', 'write'])
+
+    def test_reentrant(self):
+        lock = locking.ReadWriteLock()
+        with lock.write():
+            with lock.write():
+                with lock.read():
+                    pass
+        with lock.read():
+            with lock.read():
+                with self.assertRaises(RuntimeError):
+                    with lock.write():
+                        pass
+        with lock.write():
+            pass
+
+
+class TestThreadsafe(unittest.TestCase):
+    def setUp(self):
+        self.direc = tempfile.mkdtemp()
+        self._filename = os.path.join(self.direc, 'file.jsdb')
+
+    def tearDown(self):
+        shutil.rmtree(self.direc)
+
+    def in_thread(self, function):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(function()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_transactions(self):
+        db = Jsdb(self._filename, threadsafe=True)
+        db['a'] = 1
+        self.assertEquals(self.in_thread(lambda: 'a' in db), False)
+        db.commit()
+        self.assertEquals(self.in_thread(lambda: db['a']), 1)
+
+        def change():
+            db['a'] = 2
+            db['b'] = dict(c=[1, 2])
+            db.commit()
+            db['a'] = 3
+        self.in_thread(change)
+        self.assertEquals(db['a'], 2)
+        self.assertEquals(db['b']['c'][1], 2)
+        db.close()
+
+    def test_uncommitted_move(self):
+        db = Jsdb(self._filename, threadsafe=True)
+        db['a'] = dict(b=1)
+        db.commit()
+        db.move('a', 'moved')
+        self.assertEquals(self.in_thread(lambda: sorted(db)), ['a'])
+        db.commit()
+        self.assertEquals(self.in_thread(lambda: sorted(db)), ['moved'])
+        db.close()
+
+    def test_concurrent(self):
+        db = Jsdb(self._filename, threadsafe=True, cache_size=50)
+        db['counts'] = dict((str(i), 0) for i in range(10))
+        db.commit()
+        errors = []
+
+        def write():
+            for round_number in range(1, 20):
+                for i in range(10):
+                    db['counts'][str(i)] = round_number
+                db.commit()
+
+        def read():
+            try:
+                for _ in range(50):
+                    counts = db['counts']
+                    values = [counts[str(i)] for i in range(10)]
+                    # Later reads may see later commits, never earlier ones
+                    self.assertEquals(values, sorted(values))
+                    self.assertEquals(sorted(counts), sorted(str(i) for i in range(10)))
+            except Exception as error: # pylint: disable=broad-except
+                errors.append(error)
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(errors, [])
+        self.assertEquals(db['counts']['9'], 19)
+        db.close()
+
+    def test_cursors(self):
+        store = bsddb.btopen(self._filename)
+        for key in 'ace':
+            store[key] = key
+        cursors = locking.thread_safe_storage(store)
+        self.assertEquals(cursors.key_after('a'), 'c')
+        self.assertEquals(cursors.item_after('b'), ('c', 'c'))
+        with self.assertRaises(KeyError):
+            cursors.key_after('e')
+        with self.assertRaises(KeyError):
+            cursors.item_after('f')
+        cursors.close()
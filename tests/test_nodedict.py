@@ -0,0 +1,113 @@
+import unittest
+
+from jsdb import python_copy
+from jsdb.nodedict import NodeDict, store_layout, LayoutMismatch, NODES, PATHS
+
+from testutils import FakeOrderedDict
+
+class CountingDict(FakeOrderedDict):
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.writes = 0
+
+    def __setitem__(self, key, value):
+        self.writes += 1
+        FakeOrderedDict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.writes += 1
+        FakeOrderedDict.__delitem__(self, key)
+
+
+class TestNodeDict(unittest.TestCase):
+    def test_basic(self):
+        d = NodeDict(FakeOrderedDict())
+        d['a'] = dict(b=1, c=[1, 2, dict(d=None)])
+        d['e'] = 'f'
+        self.assertEquals(python_copy.copy(d), dict(a=dict(b=1, c=[1, 2, dict(d=None)]), e='f'))
+        self.assertEquals(len(d), 2)
+        self.assertEquals(len(d['a']['c']), 3)
+        self.assertEquals(sorted(d), ['a', 'e'])
+
+    def test_short_keys(self):
+        store = FakeOrderedDict()
+        d = NodeDict(store)
+        d['a'] = dict(b=dict(c=dict(d=dict(e=1))))
+        self.assertTrue(max(len(key) for key in store) < 12)
+
+    def test_delete(self):
+        store = FakeOrderedDict()
+        d = NodeDict(store)
+        d['a'] = dict(b=dict(c=[1, 2]))
+        d['x'] = 1
+        del d['a']
+        self.assertEquals(python_copy.copy(d), dict(x=1))
+        self.assertEquals(sorted(k for k in store if k.startswith('@')), ['@0:#', '@0:."x"='])
+
+    def test_list(self):
+        d = NodeDict(FakeOrderedDict())
+        d['a'] = []
+        d['a'].append(1)
+        d['a'].insert(0, [2])
+        d['a'].insert(1, dict(b=3))
+        self.assertEquals(python_copy.copy(d['a']), [[2], dict(b=3), 1])
+        del d['a'][0]
+        self.assertEquals(python_copy.copy(d['a']), [dict(b=3), 1])
+        self.assertEquals(d['a'].pop(), 1)
+        d['a'][0] = 'x'
+        d['a'][:] = [4, 5]
+        self.assertEquals(python_copy.copy(d['a']), [4, 5])
+        self.assertEquals(d['a'][-1], 5)
+
+    def test_self_assign(self):
+        d = NodeDict(FakeOrderedDict())
+        d['a'] = dict(b=dict(c=1))
+        d['a'] = d['a']
+        d['a'] = d['a']['b']
+        self.assertEquals(python_copy.copy(d), dict(a=dict(c=1)))
+
+    def test_move(self):
+        store = CountingDict()
+        d = NodeDict(store)
+        d['a'] = dict(('key{}'.format(i), [i]) for i in range(100))
+        d['b'] = {}
+        writes = store.writes
+        d.move(['a'], ['b', 'moved'])
+        self.assertTrue(store.writes - writes < 10)
+        self.assertEquals(sorted(d), ['b'])
+        self.assertEquals(d['b']['moved']['key7'][0], 7)
+        self.assertEquals(len(d['b']), 1)
+
+        d.move(['b', 'moved'], ['c'])
+        self.assertEquals(d['c']['key8'][0], 8)
+        self.assertEquals(len(d['b']), 0)
+        with self.assertRaises(ValueError):
+            d.move(['c'], ['c', 'key8', 'x'])
+        with self.assertRaises(ValueError):
+            d.move(['c'], ['b'])
+        with self.assertRaises(KeyError):
+            d.move(['missing'], ['x'])
+
+    def test_copy_path(self):
+        d = NodeDict(FakeOrderedDict())
+        d['a'] = dict(b=[1, dict(c=2)])
+        d.copy_path(['a'], ['x'])
+        d.copy_path(['a', 'b', 1], ['y'])
+        d['a']['b'][1]['c'] = 3
+        self.assertEquals(python_copy.copy(d), dict(a=dict(b=[1, dict(c=3)]), x=dict(b=[1, dict(c=2)]), y=dict(c=2)))
+
+    def test_unordered(self):
+        d = NodeDict(dict())
+        d['a'] = dict(b=[1])
+        del d['a']['b']
+        self.assertEquals(python_copy.copy(d), dict(a={}))
+
+    def test_layout_header(self):
+        store = FakeOrderedDict()
+        self.assertEquals(store_layout(store, NODES), NODES)
+        with self.assertRaises(LayoutMismatch):
+            store_layout(store, PATHS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import array
+import unittest
+
+from jsdb import packed, python_copy
+from jsdb.flatdict import JsonFlatteningDict
+from jsdb.jsdb import JsonEncodeDict
+from jsdb.packed import CHUNK_ITEMS, PackedArray
+
+from testutils import FakeOrderedDict
+
+class CountingDict(FakeOrderedDict):
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return FakeOrderedDict.__getitem__(self, key)
+
+
+class TestPacked(unittest.TestCase):
+    def setUp(self):
+        self.under = CountingDict()
+        self.d = JsonFlatteningDict(JsonEncodeDict(self.under))
+        self.values = [float(i) for i in range(CHUNK_ITEMS * 3 + 10)]
+        self.d['samples'] = array.array('d', self.values)
+        self.samples = self.d['samples']
+
+    def test_storage(self):
+        self.assertTrue(isinstance(self.samples, PackedArray))
+        self.assertEquals(self.d._underlying['."samples"['], 'd8') # pylint: disable=protected-access
+        self.assertEquals(len([key for key in self.under if key.startswith('."samples"[(')]), 4)
+        self.assertEquals(list(self.d), ['samples'])
+        self.assertEquals(len(self.samples), len(self.values))
+
+    def test_random_access(self):
+        reads = self.under.reads
+        self.assertEquals(self.samples[CHUNK_ITEMS + 5], CHUNK_ITEMS + 5)
+        self.assertEquals(self.samples[-1], self.values[-1])
+        self.assertTrue(self.under.reads - reads <= 4)
+        with self.assertRaises(IndexError):
+            self.samples[len(self.values)]
+
+    def test_slice(self):
+        self.assertEquals(list(self.samples[CHUNK_ITEMS - 2:CHUNK_ITEMS + 2]), self.values[CHUNK_ITEMS - 2:CHUNK_ITEMS + 2])
+        self.assertEquals(list(self.samples[5:100:7]), self.values[5:100:7])
+        self.assertEquals(list(self.samples[20:10:-3]), self.values[20:10:-3])
+        self.assertEquals(list(self.samples[5:5]), [])
+
+    def test_modify(self):
+        self.samples[CHUNK_ITEMS] = -1
+        self.values[CHUNK_ITEMS] = -1
+        del self.samples[3]
+        del self.values[3]
+        self.samples.insert(CHUNK_ITEMS * 2, 0.5)
+        self.values.insert(CHUNK_ITEMS * 2, 0.5)
+        self.samples.extend(range(CHUNK_ITEMS + 1))
+        self.values.extend(range(CHUNK_ITEMS + 1))
+        self.samples.append(7)
+        self.values.append(7)
+        self.assertEquals(list(self.d['samples']), self.values)
+
+        self.samples[:] = [1, 2]
+        self.assertEquals(list(self.d['samples']), [1, 2])
+        self.assertEquals(len([key for key in self.under if key.startswith('."samples"[(')]), 1)
+
+        del self.samples[:]
+        self.samples.insert(0, 3)
+        self.assertEquals(list(self.d['samples']), [3])
+
+    def test_export(self):
+        exported = self.samples.to_array()
+        self.assertEquals(exported.typecode, 'd')
+        self.assertEquals(exported.tolist(), self.values)
+        self.assertEquals(len(self.samples.to_bytes()), len(self.values) * 8)
+        self.assertEquals(packed.numpy_dtype('d'), '<f8')
+        self.assertEquals(packed.numpy_dtype('B'), '<u1')
+
+    def test_copy(self):
+        self.d['copy'] = self.d['samples']
+        self.assertTrue(isinstance(self.d['copy'], PackedArray))
+        self.assertEquals(python_copy.copy(self.d)['copy'].tolist(), self.values)
+
+        del self.d['samples']
+        self.assertEquals([key for key in self.under if key.startswith('."samples"')], [])
+
+    def test_in_list(self):
+        self.d['lists'] = [array.array('i', [1, 2]), [3]]
+        self.assertEquals(list(self.d['lists'][0]), [1, 2])
+        self.d['lists'][0].append(4)
+        self.assertEquals(list(self.d['lists'][0]), [1, 2, 4])
+
+    def test_item_sizes(self):
+        for typecode in packed.TYPECODES:
+            self.assertEquals(packed.local_typecode(packed.header(typecode)), typecode)
+        # Written before item sizes were stored
+        self.assertEquals(packed.local_typecode('l'), 'l')
+
+        # Longs written where they have a different size
+        other_size = 12 - array.array('l').itemsize
+        self.d._underlying['."samples"['] = 'l{}'.format(other_size) # pylint: disable=protected-access
+        self.assertEquals(array.array(self.d['samples'].typecode).itemsize, other_size)
+        self.assertTrue(self.d['samples'].typecode in 'il')
+        with self.assertRaises(ValueError):
+            packed.local_typecode('l16')
+
+    def test_bad_typecode(self):
+        with self.assertRaises(ValueError):
+            self.d['chars'] = array.array('c', 'abc')
+
+
+if __name__ == '__main__':
+    unittest.main()
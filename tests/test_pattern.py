@@ -0,0 +1,54 @@
+import unittest
+
+from jsdb.pattern import Pattern, BadPattern, parse, ANY_KEY, ANY_INDEX, DESCENDANTS, IndexRange
+
+class TestPattern(unittest.TestCase):
+    def test_parse(self):
+        self.assertEquals(parse('users[*].email'), ['users', ANY_INDEX, 'email'])
+        self.assertEquals(parse('config.*.enabled'), ['config', ANY_KEY, 'enabled'])
+        self.assertEquals(parse('"odd \\"key"[2]'), ['odd "key', 2])
+        self.assertEquals(parse('[*]'), [ANY_INDEX])
+        self.assertEquals(parse('a..b'), ['a', DESCENDANTS, 'b'])
+        self.assertEquals(parse('..[0]'), [DESCENDANTS, 0])
+        self.assertEquals(parse('a[2:5][:3][1:]'), ['a', IndexRange(2, 5), IndexRange(0, 3), IndexRange(1, None)])
+
+    def test_bad(self):
+        for text in ['users...email', 'users.[0]', 'users..', '.users', 'users email', 'users[x]', 'users[']:
+            with self.assertRaises(BadPattern):
+                parse(text)
+
+    def test_matches(self):
+        pattern = Pattern('users[*].email')
+        self.assertTrue(pattern.matches('."users"[0]."email"='))
+        self.assertTrue(pattern.matches('."users"[12]."email"='))
+        self.assertFalse(pattern.matches('."users"[0]."email".'))
+        self.assertFalse(pattern.matches('."users"[0]."email"."x"='))
+        self.assertFalse(pattern.matches('."users"."0"."email"='))
+        self.assertFalse(pattern.matches('."users"[0]."emails"='))
+
+    def test_any_key(self):
+        pattern = Pattern('*.enabled')
+        self.assertTrue(pattern.matches('."a"."enabled"='))
+        self.assertTrue(pattern.matches('."a \\"quoted\\""."enabled"='))
+        self.assertFalse(pattern.matches('[0]."enabled"='))
+
+    def test_descendants_and_ranges(self):
+        pattern = Pattern('a..b')
+        self.assertTrue(pattern.matches('."a"."b"='))
+        self.assertTrue(pattern.matches('."a"[3]."x"."b"='))
+        self.assertFalse(pattern.matches('."a"."b"."c"='))
+
+        pattern = Pattern('a[1:3]')
+        self.assertTrue(pattern.matches('."a"[1]='))
+        self.assertTrue(pattern.matches('."a"[2]='))
+        self.assertFalse(pattern.matches('."a"[3]='))
+        self.assertFalse(pattern.matches('."a"[0]='))
+
+    def test_prefix(self):
+        self.assertEquals(Pattern('users[*].email').prefix(), '."users"')
+        self.assertEquals(Pattern('a.b[1].*').prefix(), '."a"."b"[1]')
+        self.assertEquals(Pattern('*.b').prefix(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
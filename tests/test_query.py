@@ -0,0 +1,91 @@
+import unittest
+
+from jsdb.flatdict import JsonFlatteningDict
+from jsdb.pattern import BadPattern
+from jsdb.query import Query
+
+from testutils import FakeOrderedDict
+
+class CountingDict(FakeOrderedDict):
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return FakeOrderedDict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self.reads += 1
+        return FakeOrderedDict.get(self, key, default)
+
+    def __contains__(self, key):
+        self.reads += 1
+        return FakeOrderedDict.__contains__(self, key)
+
+
+class TestQuery(unittest.TestCase):
+    def setUp(self):
+        self.under = CountingDict()
+        self.d = JsonFlatteningDict(self.under)
+        self.d['logs'] = [dict(level='error' if i % 10 == 0 else 'info', message='m' * 20, tags=['a', 'b'])
+                          for i in range(50)]
+        self.d['config'] = dict(a=dict(enabled=True), b=dict(enabled=False, nested=dict(enabled=True)))
+
+    def query(self, text):
+        return list(self.d.query(Query(text)))
+
+    def test_predicate(self):
+        self.assertEquals(self.query('logs[*].level == "error"'),
+                          [(('logs', i, 'level'), 'error') for i in range(0, 50, 10)])
+
+    def test_predicate_reads(self):
+        reads = self.under.reads
+        self.query('logs[*].level == "error"')
+        # The list marker and length, then one key per entry
+        self.assertEquals(self.under.reads - reads, 52)
+
+    def test_ranges(self):
+        self.assertEquals([path for path, _ in self.query('logs[8:12].level')],
+                          [('logs', i, 'level') for i in range(8, 12)])
+        self.assertEquals(len(self.query('logs[45:].level')), 5)
+        self.assertEquals(self.query('logs[3].tags[1]'), [(('logs', 3, 'tags', 1), 'b')])
+        self.assertEquals(self.query('logs[60:].level'), [])
+
+    def test_any_key(self):
+        self.assertEquals(self.query('config.*.enabled'),
+                          [(('config', 'a', 'enabled'), True), (('config', 'b', 'enabled'), False)])
+
+    def test_descendants(self):
+        self.assertEquals([path for path, _ in self.query('config..enabled')],
+                          [('config', 'a', 'enabled'), ('config', 'b', 'enabled'),
+                           ('config', 'b', 'nested', 'enabled')])
+        self.assertEquals(self.query('config..enabled == true')[-1], (('config', 'b', 'nested', 'enabled'), True))
+        self.assertEquals(len(self.query('..tags[1:]')), 50)
+
+    def test_containers(self):
+        (path, value), = self.query('config.b.nested')
+        self.assertEquals(path, ('config', 'b', 'nested'))
+        self.assertEquals(dict(value), dict(enabled=True))
+
+    def test_ordering_types(self):
+        self.d['values'] = [1, 'a', 2.5, None, True]
+        self.assertEquals([value for _, value in self.query('values[*] > 0')], [1, 2.5])
+        self.assertEquals([value for _, value in self.query('values[*] != 1')], ['a', 2.5, None, True])
+
+    def test_missing(self):
+        self.assertEquals(self.query('nothing[*].here'), [])
+        self.assertEquals(self.query('config[*]'), [])
+        self.assertEquals(self.query('logs.*'), [])
+
+    def test_bad(self):
+        for text in ['logs[*] ==', 'logs[*] = 1', 'logs[*] == bad']:
+            with self.assertRaises(BadPattern):
+                Query(text)
+
+    def test_explain(self):
+        self.assertEquals(len(Query('logs[*].level == "error"').explain()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
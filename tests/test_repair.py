@@ -0,0 +1,103 @@
+import array
+import unittest
+
+from jsdb import keyformat, python_copy, repair
+from jsdb.jsdb import Jsdb
+
+from testutils import FakeOrderedDict
+
+class CorruptDict(FakeOrderedDict):
+    "Values of keys in `corrupt` cannot be read"
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.corrupt = set()
+
+    def __getitem__(self, key):
+        if key in self.corrupt:
+            raise IOError('Corrupt page')
+        return FakeOrderedDict.__getitem__(self, key)
+
+class BatchDict(FakeOrderedDict):
+    def __init__(self):
+        FakeOrderedDict.__init__(self)
+        self.batches = 0
+
+    def write_batch(self):
+        self.batches += 1
+        return repair.treeutils.write_batch(None)
+
+def open_db(store, **kwargs):
+    return Jsdb('unused', storage_class=lambda _filename: store, **kwargs)
+
+VALUE = dict(
+    records=[dict(id=i, tags=['t'] * i) for i in range(12)],
+    config=dict(a=1, empty={}, nested=dict(list=[])),
+    samples=array.array('d', [1.5, 2.5]),
+    log='x' * 100)
+
+class TestRepair(unittest.TestCase):
+    def make_store(self, key_format=None):
+        store = CorruptDict()
+        db = open_db(store, key_format=key_format, large_string_threshold=10)
+        db.update(VALUE)
+        db.commit()
+        return store
+
+    def copy(self, source, do_repair, batch_size=repair.BATCH_SIZE):
+        destination = BatchDict()
+        problems = []
+        result = repair.copy(source, destination, do_repair, batch_size, problems.append)
+        return destination, result, problems
+
+    def test_compact(self):
+        for key_format in keyformat.FORMATS:
+            source = self.make_store(key_format)
+            destination, result, problems = self.copy(source, False, batch_size=10)
+            self.assertEquals(problems, [])
+            self.assertEquals(dict(destination), dict(source))
+            self.assertEquals(result, repair.Result(len(source), len(source), 0, 0))
+            self.assertEquals(destination.batches, (len(source) + 9) // 10)
+
+    def test_repair(self):
+        for key_format in keyformat.FORMATS:
+            source = self.make_store(key_format)
+            encode = keyformat.encode_key if key_format == keyformat.BINARY else str
+            source[encode('."config"."a".')] = 'true'
+            source[encode('."orphan"."x"=')] = '1'
+            source[encode('."records"#')] = '13'
+            source[encode('."config"."nested"[0]=')] = '1'
+            source[encode('."config"."gone"#')] = '1'
+            source.corrupt.add(encode('."records"[3]."id"='))
+
+            destination, result, problems = self.copy(source, True)
+            self.assertEquals(sorted((problem.kind, problem.key) for problem in problems), [
+                (repair.CONFLICT, '."config"."a"='),
+                (repair.LENGTH, '."records"#'),
+                (repair.LENGTH, '."records"[3]#'),
+                (repair.ORPHAN, '."config"."gone"#'),
+                (repair.ORPHAN, '."orphan"."x"='),
+                (repair.UNREADABLE, '."records"[3]."id"='),
+                (repair.WRONG_KIND, '."config"."nested"[0]=')])
+            self.assertEquals(result.problems, len(problems))
+
+            db = open_db(destination)
+            self.assertEquals(len(db['records']), 12)
+            self.assertEquals(len(db['records'][3]), 1)
+            self.assertEquals(python_copy.copy(db['config']), dict(a={}, empty={}, nested=dict(list=[])))
+            self.assertEquals(sorted(db), sorted(VALUE))
+            self.assertEquals(list(db['samples']), [1.5, 2.5])
+            self.assertEquals(db['log'], 'x' * 100)
+
+    def test_compact_reports(self):
+        source = self.make_store()
+        source['."records"#'] = '13'
+        destination, result, problems = self.copy(source, False)
+        self.assertEquals([problem.kind for problem in problems], [repair.LENGTH])
+        self.assertEquals(dict(destination), dict(source))
+        self.assertEquals(result.skipped, 0)
+
+    def test_destination_not_empty(self):
+        destination = FakeOrderedDict()
+        destination['a'] = 'b'
+        with self.assertRaises(ValueError):
+            repair.copy(self.make_store(), destination)
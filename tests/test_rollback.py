@@ -1,6 +1,19 @@
 import unittest
 
-from jsdb.rollback import RollbackDict, RollbackList
+from jsdb import python_copy
+from jsdb.flatdict import JsonFlatteningDict
+from jsdb.rollback import RollbackDict, RollbackList, UncommittedChanges
+
+from testutils import FakeOrderedDict
+
+class MoveRecordingDict(JsonFlatteningDict):
+    def __init__(self, *args, **kwargs):
+        JsonFlatteningDict.__init__(self, *args, **kwargs)
+        self.moves = []
+
+    def move(self, source_path, target_path):
+        self.moves.append((source_path, target_path))
+        JsonFlatteningDict.move(self, source_path, target_path)
 
 class TestRollback(unittest.TestCase):
     def _commit(self, item):
@@ -52,6 +65,21 @@ class TestRollback(unittest.TestCase):
         roll['b'] = 17
         self.assertEquals(set(iter(roll)), set(['a', 'b']))
 
+    def test_iteritems(self):
+        under = dict(a=dict(b=1), c=2, d=3)
+        roll = RollbackDict(under)
+        roll['b'] = 17
+        roll['c'] = 4
+        del roll['d']
+        items = dict(roll.iteritems())
+        self.assertEquals(sorted(items), ['a', 'b', 'c'])
+        self.assertEquals(items['c'], 4)
+        self.assertTrue(items['a'] is roll['a'])
+        items['a']['b'] = 5
+        roll.rollback()
+        self.assertEquals(under['a']['b'], 1)
+        self.assertEquals(sorted(roll.values()), [2, 3, roll['a']])
+
     def test_delete(self):
         under = dict(a=dict(b=1))
         roll = RollbackDict(under)
@@ -145,5 +173,106 @@ class TestRollback(unittest.TestCase):
         d = RollbackDict(underlying)
         self.assertFalse('b' in d['a'])
 
+    def test_change_in_new_grandchild(self):
+        under = JsonFlatteningDict(FakeOrderedDict())
+        under['p'] = {}
+        d = RollbackDict(under)
+        d['p']['new'] = dict(a={})
+        d['p']['new']['a']['x'] = 1
+        d.commit()
+        self.assertEquals(python_copy.copy(under), dict(p=dict(new=dict(a=dict(x=1)))))
+
+    def test_move(self):
+        under = JsonFlatteningDict(FakeOrderedDict())
+        under['a'] = dict(b=1)
+        d = RollbackDict(under)
+        self.assertEquals(d['a']['b'], 1)
+
+        d.move(['a'], ['c'])
+        self.assertFalse('a' in d)
+        self.assertEquals(d['c']['b'], 1)
+        d.rollback()
+        self.assertEquals(d['a']['b'], 1)
+        self.assertFalse('c' in d)
+
+        d.copy_path(['a'], ['c'])
+        d['c']['b'] = 2
+        d.commit()
+        self.assertEquals(python_copy.copy(under), dict(a=dict(b=1), c=dict(b=2)))
+
+    def test_move_uncommitted(self):
+        under = MoveRecordingDict(FakeOrderedDict())
+        under['a'] = dict(b=1)
+        d = RollbackDict(under)
+        d['a']['c'] = 2
+        d['x'] = 1
+        d.move(['a'], ['moved'])
+        d['moved']['d'] = 3
+        self.assertEquals(python_copy.copy(d['moved']), dict(b=1, c=2, d=3))
+        # Not made until committed
+        self.assertEquals(python_copy.copy(under), dict(a=dict(b=1)))
+        self.assertEquals(len(d), 2)
+
+        d.commit()
+        self.assertEquals(under.moves, [(('a',), ('moved',))])
+        self.assertEquals(python_copy.copy(under), dict(x=1, moved=dict(b=1, c=2, d=3)))
+
+    def test_move_then_change(self):
+        under = MoveRecordingDict(FakeOrderedDict())
+        under['a'] = dict(b=1)
+        d = RollbackDict(under)
+        d.move(['a'], ['b'])
+        d.move(['b'], ['c'])
+        d.copy_path(['c'], ['d'])
+        # Changes what the copy was taken of, so it is made through Python
+        d['c']['b'] = 2
+        d['a'] = 'new'
+        d.commit()
+        self.assertEquals(under.moves, [])
+        self.assertEquals(python_copy.copy(under), dict(a='new', c=dict(b=2), d=dict(b=1)))
+
+        d.copy_path(['d'], ['e'])
+        d['d']['x'] = 1
+        d.rollback()
+        self.assertEquals(python_copy.copy(d), dict(a='new', c=dict(b=2), d=dict(b=1)))
+        with self.assertRaises(ValueError):
+            d.move(['c'], ['d'])
+        with self.assertRaises(KeyError):
+            d.move(['missing'], ['e'])
+
+    def test_append_string(self):
+        under = JsonFlatteningDict(FakeOrderedDict())
+        under['log'] = 'a'
+        under['d'] = dict(log='x', n=1)
+        d = RollbackDict(under)
+        d.append_string(['log'], 'b')
+        d.append_string(['log'], 'c')
+        d.append_string(['d', 'log'], 'y')
+        self.assertEquals(d['log'], 'abc')
+        self.assertEquals(python_copy.copy(d['d']), dict(log='xy', n=1))
+        # Not made until committed
+        self.assertEquals(python_copy.copy(under), dict(log='a', d=dict(log='x', n=1)))
+        d.rollback()
+        self.assertEquals(d['log'], 'a')
+
+        d.append_string(['log'], 'b')
+        d.move(['d'], ['e'])
+        d.append_string(['e', 'log'], 'y')
+        d['e']['n'] = 2
+        d.commit()
+        self.assertEquals(python_copy.copy(under), dict(log='ab', e=dict(log='xy', n=2)))
+
+        # Changing the string first appends through Python
+        d.append_string(['log'], 'c')
+        d['log'] = d['log'] + 'd'
+        d.append_string(['log'], 'e')
+        d.commit()
+        self.assertEquals(under['log'], 'abcde')
+        with self.assertRaises(ValueError):
+            d.append_string(['e', 'n'], 'x')
+        with self.assertRaises(KeyError):
+            d.append_string(['missing'], 'x')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from jsdb import Jsdb
+from jsdb import keyformat, leveldict, python_copy
+from jsdb.nodedict import NODES
+from jsdb.snapshot import SnapshotReadOnly, VersionedStore
+
+from testutils import FakeOrderedDict
+
+class TestVersionedStore(unittest.TestCase):
+    def test_snapshot(self):
+        store = VersionedStore(FakeOrderedDict())
+        store['a'] = '1'
+        store['c'] = '3'
+        snapshot = store.snapshot()
+        store['a'] = 'changed'
+        store['b'] = 'created'
+        del store['c']
+        store['d'] = 'created'
+
+        self.assertEquals(list(snapshot), ['a', 'c'])
+        self.assertEquals(snapshot['a'], '1')
+        self.assertEquals(snapshot['c'], '3')
+        self.assertFalse('b' in snapshot)
+        self.assertEquals(snapshot.key_after('a'), 'c')
+        self.assertEquals(snapshot.item_after(''), ('a', '1'))
+        with self.assertRaises(KeyError):
+            snapshot.key_after('c')
+        with self.assertRaises(SnapshotReadOnly):
+            snapshot['a'] = '2'
+
+        later = store.snapshot()
+        del store['a']
+        self.assertEquals(list(later), ['a', 'b', 'd'])
+        self.assertEquals(later['a'], 'changed')
+        self.assertEquals(snapshot['a'], '1')
+
+        snapshot.close()
+        later.close()
+        store['e'] = '5'
+        self.assertEquals(sorted(store), ['b', 'd', 'e'])
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.direc = tempfile.mkdtemp()
+        self._filename = os.path.join(self.direc, 'file.jsdb')
+
+    def tearDown(self):
+        shutil.rmtree(self.direc)
+
+    def check_snapshot(self, db):
+        db['records'] = [dict(id=i, name='record {}'.format(i)) for i in range(5)]
+        db['log'] = 'x' * 100
+        db.commit()
+
+        with db.snapshot() as snapshot:
+            del db['records'][0]
+            db['records'].append(dict(id=5))
+            db['log'] = 'y'
+            db['new'] = 1
+            db.commit()
+
+            self.assertEquals(sorted(snapshot), ['log', 'records'])
+            self.assertEquals([record['id'] for record in snapshot['records']], range(5))
+            self.assertEquals(snapshot['log'], 'x' * 100)
+            self.assertEquals(python_copy.copy(snapshot['records'][4]), dict(id=4, name='record 4'))
+            with self.assertRaises(SnapshotReadOnly):
+                snapshot['records'][0]['id'] = 7
+
+        self.assertEquals([record['id'] for record in db['records']], range(1, 6))
+        self.assertEquals(db['new'], 1)
+        db.close()
+
+    def test_snapshot(self):
+        self.check_snapshot(Jsdb(self._filename, large_string_threshold=10))
+
+    def test_binary_keys(self):
+        self.check_snapshot(Jsdb(self._filename, key_format=keyformat.BINARY))
+
+    def test_nodes(self):
+        self.check_snapshot(Jsdb(self._filename, layout=NODES))
+
+    def test_leveldb(self):
+        self.check_snapshot(Jsdb(self._filename, storage_class=leveldict.LevelDict))
+
+    def test_threadsafe(self):
+        self.check_snapshot(Jsdb(self._filename, threadsafe=True))
+
+    def test_uncommitted_structural_changes(self):
+        db = Jsdb(self._filename, large_string_threshold=10)
+        db['a'] = dict(b=1)
+        db['log'] = 'x' * 100
+        db.commit()
+        db.move('a', 'moved')
+        db.copy('moved', 'copied')
+        db.append_string('log', 'end')
+        with db.snapshot() as snapshot:
+            self.assertEquals(sorted(snapshot), ['a', 'log'])
+            self.assertEquals(snapshot['log'], 'x' * 100)
+            db.commit()
+            self.assertEquals(sorted(snapshot), ['a', 'log'])
+        with db.snapshot() as snapshot:
+            self.assertEquals(sorted(snapshot), ['copied', 'log', 'moved'])
+            self.assertEquals(snapshot['log'], 'x' * 100 + 'end')
+        db.close()
+
+    def test_query(self):
+        db = Jsdb(self._filename)
+        db['logs'] = [dict(level='error'), dict(level='info')]
+        db.commit()
+        snapshot = db.snapshot()
+        db['logs'].append(dict(level='error'))
+        db.commit()
+        self.assertEquals([path for path, _ in snapshot.query('logs[*].level == "error"')], [('logs', 0, 'level')])
+        snapshot.close()
+        db.close()
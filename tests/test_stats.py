@@ -0,0 +1,87 @@
+import threading
+import unittest
+
+from jsdb import stats
+
+from testutils import FakeOrderedDict
+
+class TestStats(unittest.TestCase):
+    def test_histogram(self):
+        histogram = stats.Histogram()
+        for value in [1, 2, 3, 100]:
+            histogram.add(value)
+        self.assertEquals(histogram.count, 4)
+        self.assertEquals(histogram.percentile(0.5), 4)
+        self.assertEquals(histogram.percentile(1), 100)
+        self.assertEquals(histogram.summary()['buckets'], [(2.0, 1), (4.0, 2), (128.0, 1)])
+
+    def test_latency_histogram(self):
+        histogram = stats.Histogram(stats.LATENCY_SCALE)
+        histogram.add(0.0000005)
+        histogram.add(0.003)
+        self.assertEquals(histogram.percentile(0.5), 0.000001)
+        self.assertEquals(histogram.percentile(0.99), 0.003)
+        self.assertEquals(stats.Histogram().percentile(0.5), None)
+
+    def test_store(self):
+        recorded = stats.Stats()
+        store = stats.StatsStore(FakeOrderedDict(), recorded)
+        store['a'] = 'x'
+        self.assertEquals(recorded.counts, {})
+
+        recorded.collect()
+        store['b'] = 'yz'
+        store['b']
+        'c' in store
+        store.key_after_func()('a')
+        with self.assertRaises(KeyError):
+            store['c']
+        self.assertEquals(recorded.counts['store.put'], 1)
+        self.assertEquals(recorded.counts['store.get'], 2)
+        self.assertEquals(recorded.counts['store.contains'], 1)
+        self.assertEquals(recorded.counts['store.key_after'], 1)
+        self.assertEquals(recorded.counts['store.bytes_written'], 3)
+        # The value read and the key found after 'a'
+        self.assertEquals(recorded.counts['store.bytes_read'], 4)
+        self.assertEquals(recorded.histograms['store.get'].count, 2)
+
+        self.assertEquals(sorted(key for key in store), ['a', 'b'])
+        self.assertEquals(len(store), 2)
+        self.assertEquals(recorded.counts['store.iterate'], 2)
+        self.assertEquals(recorded.counts['store.len'], 1)
+
+    def test_threads(self):
+        recorded = stats.Stats(collecting=True)
+        store = stats.StatsStore(FakeOrderedDict(), recorded)
+        store['a'] = 'x'
+        first_tracing = threading.Event()
+        first_done = threading.Event()
+        traces = {}
+
+        def first():
+            with recorded.tracing() as calls:
+                first_tracing.set()
+                store['a']
+                first_done.wait(5)
+            traces['first'] = calls
+
+        def second():
+            first_tracing.wait(5)
+            with recorded.tracing() as calls:
+                'b' in store
+                # The first thread finishes while this one is still tracing
+                first_done.set()
+                thread.join()
+                store['b'] = 'y'
+            traces['second'] = calls
+
+        thread = threading.Thread(target=first)
+        thread.start()
+        second()
+        self.assertEquals([call.operation for call in traces['first']], ['get'])
+        self.assertEquals([call.operation for call in traces['second']], ['contains', 'put'])
+        self.assertEquals(recorded.trace, None)
+        self.assertEquals(recorded.counts['store.put'], 2)
+
+        recorded.collect(False)
+        self.assertFalse(recorded.enabled)
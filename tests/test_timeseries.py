@@ -0,0 +1,88 @@
+import unittest
+
+from jsdb.timeseries import TimeSeries
+
+from testutils import FakeOrderedDict
+
+class TestTimeSeries(unittest.TestCase):
+    def setUp(self):
+        self.store = FakeOrderedDict()
+        self.series = TimeSeries(self.store, 'keypresses', chunk_size=4)
+
+    def test_append(self):
+        self.series.extend((t, t * 10) for t in range(10))
+        self.assertEquals(len(self.series), 10)
+        self.assertEquals(list(self.series)[3], (3, 30))
+        self.series.commit()
+
+        chunk_keys = [key for key in self.store if key.startswith('!ts."keypresses"@')]
+        self.assertEquals(len(chunk_keys), 3)
+
+        reopened = TimeSeries(self.store, 'keypresses')
+        self.assertEquals(reopened.chunk_size, 4)
+        self.assertEquals(len(reopened), 10)
+        self.assertEquals(list(reopened), list(self.series))
+
+    def test_order(self):
+        self.series.append(5, 1)
+        self.series.append(5, 2)
+        with self.assertRaises(ValueError):
+            self.series.append(4, 3)
+
+    def test_range(self):
+        self.series.extend((t, t) for t in range(0, 100, 2))
+        self.series.commit()
+        self.assertEquals([t for t, _ in self.series.range(10, 17)], [10, 12, 14, 16])
+        self.assertEquals([t for t, _ in self.series.range(95)], [96, 98])
+        self.assertEquals([t for t, _ in self.series.range(stop=3)], [0, 2])
+
+    def test_repeated_times(self):
+        self.series.extend((1, v) for v in range(10))
+        self.series.append(2, 10)
+        self.series.commit()
+        self.assertEquals(len(list(TimeSeries(self.store, 'keypresses').range(1, 2))), 10)
+
+    def test_rollback(self):
+        self.series.extend((t, t) for t in range(6))
+        self.series.commit()
+        self.series.extend((t, t) for t in range(6, 12))
+        self.series.drop_before(3)
+        self.series.rollback()
+        self.assertEquals([t for t, _ in self.series], range(6))
+        self.assertEquals(len(self.series), 6)
+
+    def test_drop_before(self):
+        self.series.extend((t, t) for t in range(10))
+        self.series.commit()
+        self.series.drop_before(5)
+        self.series.commit()
+        self.assertEquals(len(self.series), 5)
+        self.assertEquals([t for t, _ in TimeSeries(self.store, 'keypresses')], range(5, 10))
+
+        self.series.drop_before(100)
+        self.series.commit()
+        self.assertEquals(list(TimeSeries(self.store, 'keypresses')), [])
+        self.assertEquals([key for key in self.store if '@' in key], [])
+
+    def test_downsample(self):
+        self.series.extend((t, t) for t in range(10))
+        self.assertEquals(list(self.series.downsample(5)), [(0, 2.0), (5, 7.0)])
+        self.assertEquals(list(self.series.downsample(4, how='max')), [(0, 3), (4, 7), (8, 9)])
+        self.assertEquals(list(self.series.downsample(4, start=2, stop=6, how='count')), [(0, 2), (4, 2)])
+
+    def test_downsample_before(self):
+        self.series.extend((t, t) for t in range(20))
+        self.series.downsample_before(10, 5, how='sum')
+        self.series.commit()
+        reopened = TimeSeries(self.store, 'keypresses')
+        self.assertEquals(list(reopened)[:3], [(0, 10), (5, 35), (10, 10)])
+        self.assertEquals(len(reopened), 12)
+
+    def test_compact(self):
+        self.series.extend((t, t) for t in range(400))
+        self.series.commit()
+        self.assertTrue(sum(len(self.store[key]) for key in self.store) < 400 * 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,6 @@
+import contextlib
+import logging
+
 class FakeOrderedDict(dict):
     "An inefficiently 'ordered' dict for testing (allows us to avoid use bsddb"
     def __init__(self):
@@ -12,3 +15,23 @@ class FakeOrderedDict(dict):
         else:
             raise KeyError(target_key)
 
+
+class ListHandler(logging.Handler):
+    def __init__(self, records):
+        logging.Handler.__init__(self)
+        self.records = records
+
+    def emit(self, record):
+        self.records.append(record)
+
+@contextlib.contextmanager
+def capture_logs(name):
+    "Yield a list of the records logged to the logger `name` within the context"
+    records = []
+    logger = logging.getLogger(name)
+    handler = ListHandler(records)
+    logger.addHandler(handler)
+    try:
+        yield records
+    finally:
+        logger.removeHandler(handler)